@@ -1,5 +1,44 @@
 from flask import Flask, request, jsonify
 import os
+import json
+import logging
+
+from checkin_journal import CheckinJournal
+from location_ingest import LOCATIONS_SHEET, LOCATION_HEADERS, LocationIngestor, handle_batch
+from storage import create_storage
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Penyimpanan yang sama dengan bot (lihat STORAGE_BACKEND di bot.py)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sheets').strip().lower()
+SHEET_URL = os.getenv('SHEET_URL')
+GOOGLE_CREDENTIALS_JSON = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+SQLITE_STORAGE_PATH = os.getenv('SQLITE_STORAGE_PATH', 'checkin_storage.db')
+# Jurnal lokasi: kunci client_id untuk mendeteksi kiriman ulang dan menyimpan item yang belum tertulis
+LOCATION_JOURNAL_PATH = os.getenv('LOCATION_JOURNAL_PATH', 'location_journal.db')
+
+try:
+    # Jumlah item maksimal per permintaan batch
+    MAX_BATCH_ITEMS = max(1, int(os.getenv('MAX_BATCH_ITEMS', 1000)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan MAX_BATCH_ITEMS bukan bilangan bulat. Menggunakan default 1000.")
+    MAX_BATCH_ITEMS = 1000
+
+def open_spreadsheet():
+    import gspread
+    return gspread.service_account_from_dict(json.loads(GOOGLE_CREDENTIALS_JSON)).open_by_url(SHEET_URL)
+
+storage_backend = create_storage(
+    STORAGE_BACKEND,
+    open_spreadsheet=open_spreadsheet,
+    sqlite_path=SQLITE_STORAGE_PATH,
+    default_headers={LOCATIONS_SHEET: LOCATION_HEADERS},
+)
+location_ingestor = LocationIngestor(storage_backend, CheckinJournal(LOCATION_JOURNAL_PATH), max_pending_retry=2 * MAX_BATCH_ITEMS)
 
 app = Flask(__name__)
 
@@ -25,6 +64,20 @@ def save_location():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Endpoint batch: sinkronisasi antrean offline dalam satu permintaan
+@app.route('/api/locations/batch', methods=['POST'])
+def save_locations_batch():
+    """
+    Menerima array JSON (atau {"locations": [...]}, atau NDJSON dengan Content-Type
+    application/x-ndjson) berisi lokasi dengan client_id. Status dikembalikan per item:
+    stored, duplicate (sudah pernah diterima), queued (tercatat, ditulis nanti) atau invalid.
+    Item dengan status selain invalid aman dihapus dari antrean klien.
+    """
+    content_type = request.content_type or ''
+    body = request.stream if 'ndjson' in content_type else request.get_data()
+    status, payload = handle_batch(location_ingestor, body, content_type, MAX_BATCH_ITEMS)
+    return jsonify(payload), status
+
 # Health check untuk Koyeb
 @app.route('/health')
 def health():
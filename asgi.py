@@ -0,0 +1,254 @@
+"""
+Satu entry point ASGI (Starlette + uvicorn) untuk webhook Telegram, API lokasi, /health dan
+/metrics, dengan backend penyimpanan dan pool Sheets yang sama dengan bot.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080 --workers 2
+
+State ConversationHandler hanya ada di memori satu proses, jadi Application bot hanya berjalan
+di satu worker: worker pertama yang memegang BOT_LEADER_LOCK. Worker lain tetap melayani API
+lokasi, dan update webhook yang mereka terima diteruskan ke worker bot lewat Unix socket
+BOT_UPDATE_SOCKET, sehingga urutan dan state percakapan per pengguna tetap benar.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+from contextlib import asynccontextmanager, suppress
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from telegram import Update
+
+import bot
+from checkin_journal import CheckinJournal
+from location_ingest import LocationIngestor, handle_batch_async
+from metrics import CONTENT_TYPE, REGISTRY
+from storage import BlockingCallPool
+
+logger = logging.getLogger(__name__)
+
+LOCATION_JOURNAL_PATH = os.getenv('LOCATION_JOURNAL_PATH', 'location_journal.db')
+# Worker yang memegang lock ini menjalankan Application bot; worker lain meneruskan update ke socket
+BOT_LEADER_LOCK = os.getenv('BOT_LEADER_LOCK', 'bot_leader.lock')
+BOT_UPDATE_SOCKET = os.getenv('BOT_UPDATE_SOCKET', 'bot_updates.sock')
+
+try:
+    # Jumlah item maksimal per permintaan batch
+    MAX_BATCH_ITEMS = max(1, int(os.getenv('MAX_BATCH_ITEMS', 1000)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan MAX_BATCH_ITEMS bukan bilangan bulat. Menggunakan default 1000.")
+    MAX_BATCH_ITEMS = 1000
+
+WEBHOOK_PATH = f"/{bot.TELEGRAM_TOKEN}"
+WEBHOOK_URL = f"https://{bot.WEBHOOK_HOST}/{bot.TELEGRAM_TOKEN}"
+
+# Jurnal lokasi dipakai bersama semua worker; entri tertunda diklaim di jurnal agar tidak dikirim dua worker sekaligus
+location_journal = CheckinJournal(LOCATION_JOURNAL_PATH)
+location_ingestor = LocationIngestor(bot.storage_backend, location_journal, max_pending_retry=2 * MAX_BATCH_ITEMS)
+# Satu thread khusus untuk jurnal lokasi (SQLite), terpisah dari pool Sheets seperti journal_pool di bot.py
+location_journal_pool = BlockingCallPool(1, thread_name_prefix="location-journal")
+
+
+class BotRuntime:
+    """Menjalankan Application bot di worker pemimpin, atau meneruskan update ke sana dari worker lain."""
+
+    def __init__(self, lock_path: str, socket_path: str):
+        self.lock_path = lock_path
+        self.socket_path = socket_path
+        self.application = None
+        self._lock_file = None
+        self._server = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.application is not None
+
+    def _acquire_leadership(self) -> bool:
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def start(self):
+        if not self._acquire_leadership():
+            logger.info(f"Worker {os.getpid()} melayani API; update webhook diteruskan ke worker bot lewat {self.socket_path}.")
+            return
+
+        logger.info(f"Worker {os.getpid()} menjalankan bot. Memulai inisialisasi bot...")
+        # Warm start seperti bot.main(): lifespan tidak menunggu Google Sheets; peran dari snapshot lokal
+        # dipakai sampai warm_start_job (dijadwalkan schedule_jobs) memuat lembar 'Users' di latar belakang
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, bot.load_roles_snapshot):
+            logger.warning("Snapshot peran tidak tersedia: sampai Google Sheets termuat, hanya owner yang dikenali.")
+
+        application = bot.build_application()
+        bot.schedule_jobs(application)
+        await application.initialize()
+        # post_init hanya dipanggil oleh run_webhook/run_polling. /metrics disajikan di port utama,
+        # jadi server metrik terpisah milik bot.py tidak dijalankan
+        await bot.on_startup(application, serve_metrics=False)
+        await application.start()
+        self.application = application
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path) # Sisa worker bot sebelumnya
+        self._server = await asyncio.start_unix_server(self._handle_forwarded, path=self.socket_path)
+
+        try:
+            await application.bot.set_webhook(url=WEBHOOK_URL)
+            logger.info(f"Webhook diatur ke https://{bot.WEBHOOK_HOST}/<token>.")
+        except Exception as e:
+            logger.error(f"Gagal mengatur webhook, memakai pengaturan webhook yang sudah ada: {e}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        if self.application is not None:
+            await self.application.stop()
+            await bot.on_shutdown(self.application)
+            await self.application.shutdown()
+            self.application = None
+        else:
+            bot.sheets_pool.shutdown(wait=True)
+            bot.storage_backend.close()
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def enqueue(self, data: dict):
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+
+    async def _handle_forwarded(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Satu update JSON per baris dari worker lain; setiap baris dibalas 'ok' setelah masuk antrean."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    await self.enqueue(json.loads(line))
+                    writer.write(b"ok\n")
+                except Exception as e:
+                    logger.error(f"Update terusan tidak bisa diproses: {e}")
+                    writer.write(b"error\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def forward(self, data: dict):
+        """Meneruskan update ke worker bot; gagal (dan Telegram mengirim ulang) jika worker bot belum siap."""
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        try:
+            writer.write(json.dumps(data, separators=(',', ':')).encode('utf-8') + b"\n")
+            await writer.drain()
+            ack = await asyncio.wait_for(reader.readline(), timeout=5)
+            if ack.strip() != b"ok":
+                raise RuntimeError(f"Worker bot menolak update: {ack!r}")
+        finally:
+            writer.close()
+
+
+runtime = BotRuntime(BOT_LEADER_LOCK, BOT_UPDATE_SOCKET)
+
+
+async def telegram_webhook(request: Request):
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return Response(status_code=400)
+    try:
+        if runtime.is_leader:
+            await runtime.enqueue(data)
+        else:
+            await runtime.forward(data)
+    except Exception as e:
+        logger.error(f"Update webhook {data.get('update_id')} tidak dapat diteruskan ke bot: {e}")
+        return Response(status_code=503) # Telegram akan mengirim ulang update ini
+    return Response(status_code=200)
+
+
+async def save_location(request: Request):
+    try:
+        data = await request.json()
+        lat = data.get('latitude')
+        lng = data.get('longitude')
+
+        if not lat or not lng:
+            return JSONResponse({"error": "Latitude dan longitude diperlukan"}, status_code=400)
+
+        # Contoh penyimpanan sederhana
+        logger.info(f"Menyimpan lokasi - Lat: {lat}, Lng: {lng}")
+
+        return JSONResponse({
+            "status": "success",
+            "data": {"latitude": lat, "longitude": lng}
+        }, status_code=200)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def save_locations_batch(request: Request):
+    """Sama dengan /api/locations/batch di app.py; penulisan ke Sheets lewat pool bot (retry + circuit breaker)."""
+    content_type = request.headers.get('content-type', '')
+    body = await request.body()
+    status, payload = await handle_batch_async(location_ingestor, body, content_type, MAX_BATCH_ITEMS, bot.sheets_pool, location_journal_pool)
+    return JSONResponse(payload, status_code=status)
+
+
+async def health(request: Request):
+    return PlainTextResponse("OK")
+
+
+async def metrics(request: Request):
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+async def prune_location_journal():
+    """Menghapus entri jurnal lokasi yang sudah terkirim secara berkala, dengan masa simpan yang sama dengan jurnal check-in."""
+    while True:
+        try:
+            removed = await location_journal_pool.run(location_journal.prune, bot.journal_retention_seconds())
+            if removed:
+                logger.info(f"Jurnal lokasi dibersihkan: {removed} entri terkirim lebih dari {bot.JOURNAL_RETENTION_DAYS} hari dihapus.")
+        except Exception as e:
+            logger.error(f"Gagal membersihkan jurnal lokasi: {e}")
+        await asyncio.sleep(bot.JOURNAL_PRUNE_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await runtime.start()
+    prune_task = asyncio.create_task(prune_location_journal())
+    try:
+        yield
+    finally:
+        prune_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await prune_task
+        await runtime.stop()
+        location_journal_pool.shutdown(wait=True)
+        location_journal.close()
+
+
+app = Starlette(
+    routes=[
+        Route(WEBHOOK_PATH, telegram_webhook, methods=['POST']),
+        Route('/api/save-location', save_location, methods=['POST']),
+        Route('/api/locations/batch', save_locations_batch, methods=['POST']),
+        Route('/health', health),
+        Route('/metrics', metrics),
+    ],
+    lifespan=lifespan,
+)
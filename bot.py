@@ -1,19 +1,41 @@
 import os
+import asyncio
+import functools
+import hashlib
 import logging
 import json
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from telegram import Update, Bot, ReplyKeyboardMarkup, KeyboardButton
+import threading
+import time
+PROCESS_STARTED = time.monotonic() # Awal proses, sebelum impor berat; untuk metrik waktu siap
+from telegram import Update, Bot, ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton
+from telegram.error import Forbidden
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
     filters,
     ContextTypes,
-    ConversationHandler
+    ConversationHandler,
+    TypeHandler
 )
-from datetime import datetime
+from datetime import datetime, time as dt_time, timedelta, timezone
 import pytz # Import modul pytz
+from storage import BlockingCallPool, BatchWriteQueue, WorksheetMissing, create_storage, read_row_range, rowcol_to_a1
+from user_table import RoleSnapshot, UserTable, REMOVED_AT_HEADER, REMOVED_ROLE, REQUIRED_HEADERS, parse_user_ids, parse_user_ids_csv, without_tombstones
+from checkin_journal import CheckinJournal
+from resilience import CircuitBreaker, ResilientPool, RetryPolicy, is_rejected
+from metrics import REGISTRY, MetricsServer, timed
+from update_processor import PerUserUpdateProcessor
+from rate_limiter import PRIORITY_BROADCAST, PRIORITY_NAMES, PRIORITY_NOTIFICATION, PriorityRateLimiter
+from update_capture import UpdateCapture
+from location_ingest import LOCATIONS_SHEET, LOCATION_HEADERS
+from spatial import OutletIndex, parse_maps_link
+from checkin_cache import CheckinColumns, day_to_date, parse_days, today_day
+from export import EXPORT_FORMATS, FORMAT_CSV, CheckinExporter, ExportError
+from geocode import BoundaryFormatError, load_region_index
+from duplicate_guard import ACTION_MERGE, ACTION_REJECT, DuplicateGuard
+from partitions import LEGACY_CHECKIN_SHEET, CheckinPartitions, PartitionedTailReader, is_checkin_sheet
 
 # --- Konfigurasi Logging ---
 logging.basicConfig(
@@ -41,26 +63,370 @@ except (ValueError, TypeError):
     logger.warning("Variabel lingkungan PORT bukan bilangan bulat. Menggunakan port default 8080.")
     PORT = 8080
 
+try:
+    # Batas jumlah panggilan Google Sheets yang berjalan bersamaan (ukuran thread pool)
+    SHEETS_MAX_CONCURRENCY = max(1, int(os.getenv('SHEETS_MAX_CONCURRENCY', 4)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan SHEETS_MAX_CONCURRENCY bukan bilangan bulat. Menggunakan default 4.")
+    SHEETS_MAX_CONCURRENCY = 4
+
+try:
+    # Access token Google diperbarui di latar belakang sekian detik sebelum kedaluwarsa (token berlaku 1 jam);
+    # minimal 240 agar mendahului refresh lazy google-auth (token dianggap kedaluwarsa ~4 menit lebih awal)
+    SHEETS_TOKEN_REFRESH_MARGIN = min(1800, max(240, int(os.getenv('SHEETS_TOKEN_REFRESH_MARGIN', 300))))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan SHEETS_TOKEN_REFRESH_MARGIN bukan bilangan bulat. Menggunakan default 300 detik.")
+    SHEETS_TOKEN_REFRESH_MARGIN = 300
+
+try:
+    # Write-behind check-in: maksimal baris per batch dan waktu tunggu maksimal sebelum flush
+    CHECKIN_BATCH_MAX_ROWS = max(1, int(os.getenv('CHECKIN_BATCH_MAX_ROWS', 50)))
+    CHECKIN_BATCH_MAX_WAIT_MS = max(0, int(os.getenv('CHECKIN_BATCH_MAX_WAIT_MS', 300)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan CHECKIN_BATCH_MAX_ROWS/CHECKIN_BATCH_MAX_WAIT_MS bukan bilangan bulat. Menggunakan default 50 baris / 300 ms.")
+    CHECKIN_BATCH_MAX_ROWS = 50
+    CHECKIN_BATCH_MAX_WAIT_MS = 300
+
+# Backend penyimpanan: 'sheets' (default, Google Sheets), 'sqlite' (file lokal) atau 'memory' (fake Sheets untuk benchmark/pengujian)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sheets').strip().lower()
+SQLITE_STORAGE_PATH = os.getenv('SQLITE_STORAGE_PATH', 'checkin_storage.db')
+try:
+    # Perilaku fake Sheets (hanya untuk STORAGE_BACKEND=memory)
+    FAKE_SHEETS_LATENCY_MS = max(0, int(os.getenv('FAKE_SHEETS_LATENCY_MS', 0)))
+    FAKE_SHEETS_ERROR_RATE = min(1.0, max(0.0, float(os.getenv('FAKE_SHEETS_ERROR_RATE', 0))))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan FAKE_SHEETS_LATENCY_MS/FAKE_SHEETS_ERROR_RATE tidak valid. Menggunakan default 0.")
+    FAKE_SHEETS_LATENCY_MS = 0
+    FAKE_SHEETS_ERROR_RATE = 0.0
+
+if STORAGE_BACKEND not in ('sheets', 'sqlite', 'memory'):
+    logger.critical(f"Bot berhenti: STORAGE_BACKEND '{STORAGE_BACKEND}' tidak dikenal. Gunakan 'sheets', 'sqlite' atau 'memory'.")
+    exit(1)
+
 # Cek keberadaan semua environment variables penting
-if not all([TELEGRAM_TOKEN, WEBHOOK_HOST, SHEET_URL, GOOGLE_CREDENTIALS_JSON]):
-    logger.critical("Bot berhenti: Hilang satu atau lebih variabel lingkungan yang diperlukan (TELEGRAM_TOKEN, WEBHOOK_HOST, SHEET_URL, GOOGLE_CREDENTIALS_JSON).")
+if not all([TELEGRAM_TOKEN, WEBHOOK_HOST]):
+    logger.critical("Bot berhenti: Hilang satu atau lebih variabel lingkungan yang diperlukan (TELEGRAM_TOKEN, WEBHOOK_HOST).")
+    exit(1)
+if STORAGE_BACKEND == 'sheets' and not all([SHEET_URL, GOOGLE_CREDENTIALS_JSON]):
+    logger.critical("Bot berhenti: Backend 'sheets' membutuhkan variabel lingkungan SHEET_URL dan GOOGLE_APPLICATION_CREDENTIALS_JSON.")
     exit(1)
 
+try:
+    # Interval refresh peran pengguna di latar belakang (detik); 0 untuk menonaktifkan
+    ROLE_REFRESH_INTERVAL = max(0, int(os.getenv('ROLE_REFRESH_INTERVAL', 300)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan ROLE_REFRESH_INTERVAL bukan bilangan bulat. Menggunakan default 300 detik.")
+    ROLE_REFRESH_INTERVAL = 300
+
+# Snapshot lokal peran terakhir yang berhasil dimuat (warm start); kosongkan untuk menonaktifkan
+ROLES_SNAPSHOT_PATH = os.getenv('ROLES_SNAPSHOT_PATH', 'roles_snapshot.json').strip()
+
+# Jurnal lokal check-in (SQLite) agar check-in tidak hilang saat Google Sheets bermasalah
+CHECKIN_JOURNAL_PATH = os.getenv('CHECKIN_JOURNAL_PATH', 'checkin_journal.db')
+try:
+    # Interval replayer jurnal (detik) dan batas waktu menunggu konfirmasi tulis sebelum membalas pengguna
+    JOURNAL_REPLAY_INTERVAL = max(1, int(os.getenv('JOURNAL_REPLAY_INTERVAL', 30)))
+    CHECKIN_CONFIRM_TIMEOUT = max(0, int(os.getenv('CHECKIN_CONFIRM_TIMEOUT', 5)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan JOURNAL_REPLAY_INTERVAL/CHECKIN_CONFIRM_TIMEOUT bukan bilangan bulat. Menggunakan default 30 / 5 detik.")
+    JOURNAL_REPLAY_INTERVAL = 30
+    CHECKIN_CONFIRM_TIMEOUT = 5
+
+try:
+    # Entri jurnal yang sudah terkirim disimpan sekian hari (kunci idempotensi untuk update Telegram yang
+    # dikirim ulang dan isi jendela duplikat saat start) lalu dihapus; minimal 1 hari
+    JOURNAL_RETENTION_DAYS = max(1, int(os.getenv('JOURNAL_RETENTION_DAYS', 7)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan JOURNAL_RETENTION_DAYS bukan bilangan bulat. Menggunakan default 7 hari.")
+    JOURNAL_RETENTION_DAYS = 7
+JOURNAL_PRUNE_INTERVAL = 3600 # Detik antar pembersihan jurnal
+
+try:
+    # Retry dan circuit breaker untuk panggilan Google Sheets
+    SHEETS_MAX_RETRIES = max(0, int(os.getenv('SHEETS_MAX_RETRIES', 3)))
+    SHEETS_BREAKER_THRESHOLD = max(1, int(os.getenv('SHEETS_BREAKER_THRESHOLD', 5)))
+    SHEETS_BREAKER_COOLDOWN = max(1, int(os.getenv('SHEETS_BREAKER_COOLDOWN', 30)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan SHEETS_MAX_RETRIES/SHEETS_BREAKER_THRESHOLD/SHEETS_BREAKER_COOLDOWN bukan bilangan bulat. Menggunakan default 3 / 5 / 30.")
+    SHEETS_MAX_RETRIES = 3
+    SHEETS_BREAKER_THRESHOLD = 5
+    SHEETS_BREAKER_COOLDOWN = 30
+
+try:
+    # Port endpoint Prometheus /metrics; 0 untuk menonaktifkan
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9090))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan METRICS_PORT bukan bilangan bulat. Menggunakan port default 9090.")
+    METRICS_PORT = 9090
+
+try:
+    # Pemrosesan update bersamaan: batas global update yang berjalan dan batas antrean per pengguna.
+    # Handler check-in menunggu flush batch sambil memegang slot, jadi batas global dibuat longgar;
+    # panggilan Sheets tetap dibatasi sheets_pool
+    MAX_CONCURRENT_UPDATES = max(1, int(os.getenv('MAX_CONCURRENT_UPDATES', 64)))
+    PER_USER_QUEUE_LIMIT = max(1, int(os.getenv('PER_USER_QUEUE_LIMIT', 10)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan MAX_CONCURRENT_UPDATES/PER_USER_QUEUE_LIMIT bukan bilangan bulat. Menggunakan default 64 / 10.")
+    MAX_CONCURRENT_UPDATES = 64
+    PER_USER_QUEUE_LIMIT = 10
+
+try:
+    # Batas pengiriman ke Telegram: pesan/detik global, pesan/detik dan burst per chat pribadi,
+    # pesan/menit per grup; 0 untuk tanpa batas
+    TELEGRAM_GLOBAL_RATE = max(0.0, float(os.getenv('TELEGRAM_GLOBAL_RATE', 25)))
+    TELEGRAM_CHAT_RATE = max(0.0, float(os.getenv('TELEGRAM_CHAT_RATE', 1)))
+    TELEGRAM_CHAT_BURST = max(1.0, float(os.getenv('TELEGRAM_CHAT_BURST', 3)))
+    TELEGRAM_GROUP_RATE_PER_MINUTE = max(0.0, float(os.getenv('TELEGRAM_GROUP_RATE_PER_MINUTE', 20)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan TELEGRAM_GLOBAL_RATE/TELEGRAM_CHAT_RATE/TELEGRAM_CHAT_BURST/TELEGRAM_GROUP_RATE_PER_MINUTE bukan angka. Menggunakan default 25 / 1 / 3 / 20.")
+    TELEGRAM_GLOBAL_RATE = 25.0
+    TELEGRAM_CHAT_RATE = 1.0
+    TELEGRAM_CHAT_BURST = 3.0
+    TELEGRAM_GROUP_RATE_PER_MINUTE = 20.0
+
+# Perekaman update masuk (PII dihapus) untuk diputar ulang dengan replay.py; kosong untuk menonaktifkan
+CAPTURE_UPDATES_DIR = os.getenv('CAPTURE_UPDATES_DIR', '').strip()
+# Kunci HMAC untuk ID samaran; tanpa nilai ini dibuat acak per proses (ID samaran tidak konsisten antar restart)
+CAPTURE_SALT = os.getenv('CAPTURE_SALT', '')
+try:
+    # Ukuran file rekaman sebelum dirotasi (byte), jumlah file .gz yang disimpan, dan presisi koordinat
+    CAPTURE_MAX_BYTES = max(1024, int(os.getenv('CAPTURE_MAX_BYTES', 50 * 1024 * 1024)))
+    CAPTURE_BACKUP_COUNT = max(1, int(os.getenv('CAPTURE_BACKUP_COUNT', 20)))
+    CAPTURE_COORD_DECIMALS = max(0, int(os.getenv('CAPTURE_COORD_DECIMALS', 3)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan CAPTURE_MAX_BYTES/CAPTURE_BACKUP_COUNT/CAPTURE_COORD_DECIMALS bukan bilangan bulat. Menggunakan default 50 MB / 20 / 3.")
+    CAPTURE_MAX_BYTES = 50 * 1024 * 1024
+    CAPTURE_BACKUP_COUNT = 20
+    CAPTURE_COORD_DECIMALS = 3
+
+try:
+    # Saran outlet terdekat saat check-in: jumlah tombol (0 untuk menonaktifkan) dan radius pencarian (meter)
+    NEARBY_OUTLET_SUGGESTIONS = max(0, int(os.getenv('NEARBY_OUTLET_SUGGESTIONS', 5)))
+    NEARBY_OUTLET_RADIUS_M = max(10, int(os.getenv('NEARBY_OUTLET_RADIUS_M', 500)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan NEARBY_OUTLET_SUGGESTIONS/NEARBY_OUTLET_RADIUS_M bukan bilangan bulat. Menggunakan default 5 / 500 meter.")
+    NEARBY_OUTLET_SUGGESTIONS = 5
+    NEARBY_OUTLET_RADIUS_M = 500
+
+try:
+    # Interval membaca check-in baru dari worksheet check-in ke cache riwayat (indeks outlet dan /rekap), detik
+    CHECKIN_HISTORY_REFRESH_INTERVAL = max(10, int(os.getenv('CHECKIN_HISTORY_REFRESH_INTERVAL', 300)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan CHECKIN_HISTORY_REFRESH_INTERVAL bukan bilangan bulat. Menggunakan default 300 detik.")
+    CHECKIN_HISTORY_REFRESH_INTERVAL = 300
+
+try:
+    # Check-in ulang ke outlet yang sama (nama sama, dalam radius meter) dalam jendela waktu (detik)
+    # tidak ditulis lagi; jendela 0 untuk menonaktifkan
+    DUPLICATE_WINDOW_SECONDS = max(0, int(os.getenv('DUPLICATE_WINDOW_SECONDS', 600)))
+    DUPLICATE_RADIUS_M = max(1, int(os.getenv('DUPLICATE_RADIUS_M', 100)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan DUPLICATE_WINDOW_SECONDS/DUPLICATE_RADIUS_M bukan bilangan bulat. Menggunakan default 600 detik / 100 meter.")
+    DUPLICATE_WINDOW_SECONDS = 600
+    DUPLICATE_RADIUS_M = 100
+# 'merge': duplikat dianggap check-in sebelumnya (dibalas berhasil); 'reject': duplikat ditolak
+DUPLICATE_CHECKIN_ACTION = os.getenv('DUPLICATE_CHECKIN_ACTION', ACTION_MERGE).strip().lower()
+if DUPLICATE_CHECKIN_ACTION not in (ACTION_MERGE, ACTION_REJECT):
+    logger.warning(f"DUPLICATE_CHECKIN_ACTION '{DUPLICATE_CHECKIN_ACTION}' tidak dikenal. Menggunakan '{ACTION_MERGE}'.")
+    DUPLICATE_CHECKIN_ACTION = ACTION_MERGE
+
+try:
+    # Kelola pengguna massal: batas ID per perintah, panggilan Telegram paralel (info akun dan
+    # notifikasi) dan ukuran maksimum file CSV yang diunggah (byte)
+    USER_BATCH_MAX_IDS = max(1, int(os.getenv('USER_BATCH_MAX_IDS', 500)))
+    USER_BATCH_CONCURRENCY = max(1, int(os.getenv('USER_BATCH_CONCURRENCY', 20)))
+    USER_CSV_MAX_BYTES = max(1024, int(os.getenv('USER_CSV_MAX_BYTES', 1024 * 1024)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan USER_BATCH_MAX_IDS/USER_BATCH_CONCURRENCY/USER_CSV_MAX_BYTES bukan bilangan bulat. Menggunakan default 500 / 20 / 1 MB.")
+    USER_BATCH_MAX_IDS = 500
+    USER_BATCH_CONCURRENCY = 20
+    USER_CSV_MAX_BYTES = 1024 * 1024
+
+try:
+    # Jam (WIB) compaction harian lembar 'Users' yang membuang tombstone pengguna terhapus; -1 untuk menonaktifkan
+    USERS_COMPACTION_HOUR = int(os.getenv('USERS_COMPACTION_HOUR', 2))
+    if not -1 <= USERS_COMPACTION_HOUR <= 23:
+        raise ValueError
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan USERS_COMPACTION_HOUR harus -1 sampai 23. Menggunakan default 2 (02:00 WIB).")
+    USERS_COMPACTION_HOUR = 2
+
+# 'month': check-in ditulis ke worksheet per bulan ('Check-in 2026-10'); 'none': semua ke 'Check-in Data'
+CHECKIN_PARTITIONING = os.getenv('CHECKIN_PARTITIONING', 'month').strip().lower()
+if CHECKIN_PARTITIONING not in ('month', 'none'):
+    logger.warning(f"CHECKIN_PARTITIONING '{CHECKIN_PARTITIONING}' tidak dikenal. Menggunakan 'month'.")
+    CHECKIN_PARTITIONING = 'month'
+
+try:
+    # /export: baris per get_values dan ukuran file ekspor yang ditahan di memori sebelum dipindah ke disk (byte)
+    EXPORT_CHUNK_ROWS = max(100, int(os.getenv('EXPORT_CHUNK_ROWS', 5000)))
+    # Minimal 64 KB: SpooledTemporaryFile(max_size=0) tidak pernah pindah ke disk
+    EXPORT_SPOOL_MAX_BYTES = max(64 * 1024, int(os.getenv('EXPORT_SPOOL_MAX_BYTES', 8 * 1024 * 1024)))
+except (ValueError, TypeError):
+    logger.warning("Variabel lingkungan EXPORT_CHUNK_ROWS/EXPORT_SPOOL_MAX_BYTES bukan bilangan bulat. Menggunakan default 5000 / 8 MB.")
+    EXPORT_CHUNK_ROWS = 5000
+    EXPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Batas ukuran dokumen yang bisa dikirim bot lewat Bot API
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+
+# Wilayah otomatis dari koordinat: file batas administrasi lokal (GeoJSON atau indeks hasil
+# `python geocode.py compile`); kosong untuk tetap menanyakan wilayah ke pengguna
+REGION_BOUNDARIES_PATH = os.getenv('REGION_BOUNDARIES_PATH', '').strip()
+# Properti GeoJSON yang berisi nama wilayah; kosong untuk mendeteksi otomatis (WADMKK, NAME_2, ...)
+REGION_NAME_PROPERTY = os.getenv('REGION_NAME_PROPERTY', '').strip() or None
+
 # --- Google Sheets Initialization ---
 gsheet_client = None
+gsheet_client_lock = threading.Lock() # Klien dibuat sekali walau diminta beberapa thread pool bersamaan
+token_refresher = None
 admin_ids = set() # Set untuk menyimpan ID admin
 user_ids = set()  # Set untuk menyimpan ID semua pengguna terdaftar (role 'user', 'admin', 'owner')
 
+# Salinan lokal lembar 'Users' yang diindeks per user_id
+user_table = UserTable(OWNER_ID)
+# Status refresh peran: revisi/checksum terakhir yang dimuat, waktu refresh terakhir (GMT+7) dan
+# sumber tabel ('snapshot' sampai Google Sheets berhasil dimuat, lalu 'sheets')
+role_refresh_status = {'revision': None, 'checksum': None, 'last_checked': None, 'last_rebuilt': None, 'source': None}
+role_snapshot = RoleSnapshot(ROLES_SNAPSHOT_PATH) if ROLES_SNAPSHOT_PATH else None
+# Mencegah dua perubahan pengguna saling menimpa indeks/nomor baris (dibuat saat pertama dipakai,
+# agar terikat ke event loop yang sedang berjalan)
+users_lock = None
+
+# Semua panggilan gspread dari handler async dijalankan lewat pool ini agar event loop tidak terblokir;
+# retry dengan backoff dan circuit breaker berlaku bersama untuk semua panggilan
+sheets_pool = ResilientPool(
+    BlockingCallPool(SHEETS_MAX_CONCURRENCY),
+    RetryPolicy(max_retries=SHEETS_MAX_RETRIES),
+    CircuitBreaker(failure_threshold=SHEETS_BREAKER_THRESHOLD, reset_timeout=SHEETS_BREAKER_COOLDOWN),
+)
+
+# Update dari pengguna berbeda diproses paralel; update dari pengguna yang sama tetap berurutan
+update_processor = PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES, PER_USER_QUEUE_LIMIT)
+
+# Semua request keluar lewat rate limiter berprioritas: balasan interaktif didahulukan dari notifikasi dan broadcast
+outbound_limiter = PriorityRateLimiter(TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_GROUP_RATE_PER_MINUTE)
+
+def role_of(user_id: int):
+    """Peran pengguna saat ini: 'owner', 'admin', 'user' atau None jika tidak terdaftar."""
+    if user_id == OWNER_ID:
+        return 'owner'
+    if user_id in admin_ids:
+        return 'admin'
+    if user_id in user_ids:
+        return 'user'
+    return None
+
+def open_region_index():
+    """Membuka indeks wilayah jika REGION_BOUNDARIES_PATH diisi; None (wilayah ditanyakan manual) jika gagal."""
+    if not REGION_BOUNDARIES_PATH:
+        return None
+    try:
+        index = load_region_index(REGION_BOUNDARIES_PATH, REGION_NAME_PROPERTY)
+        logger.info(f"Wilayah otomatis aktif dari {REGION_BOUNDARIES_PATH}: {index.stats()}")
+        return index
+    except (BoundaryFormatError, OSError) as e:
+        logger.error(f"Gagal memuat batas wilayah {REGION_BOUNDARIES_PATH}, wilayah akan ditanyakan ke pengguna: {e}")
+        return None
+
+region_index = open_region_index()
+
+update_capture = UpdateCapture(
+    CAPTURE_UPDATES_DIR,
+    max_bytes=CAPTURE_MAX_BYTES,
+    backup_count=CAPTURE_BACKUP_COUNT,
+    salt=CAPTURE_SALT.encode('utf-8') if CAPTURE_SALT else os.urandom(16),
+    coordinate_decimals=CAPTURE_COORD_DECIMALS,
+    role_of=role_of,
+) if CAPTURE_UPDATES_DIR else None
+
+# --- Metrik (format Prometheus, disajikan di /metrics) ---
+HANDLER_LATENCY = REGISTRY.histogram('bot_handler_duration_seconds', 'Durasi handler dan operasi bot.', ['handler'])
+SHEETS_CALL_LATENCY = REGISTRY.histogram('bot_sheets_call_duration_seconds', 'Durasi setiap percobaan panggilan backend penyimpanan.', ['method'])
+SHEETS_CALL_ERRORS = REGISTRY.counter('bot_sheets_call_errors_total', 'Panggilan backend penyimpanan yang gagal.', ['method', 'status'])
+SHEETS_RETRIES = REGISTRY.counter('bot_sheets_retries_total', 'Percobaan ulang panggilan backend penyimpanan.', ['method', 'status'])
+SHEETS_BREAKER_STATE = REGISTRY.gauge('bot_sheets_breaker_state', 'Keadaan circuit breaker (1 untuk keadaan aktif).', ['state'])
+SHEETS_BREAKER_OPENED = REGISTRY.counter('bot_sheets_breaker_opened_total', 'Berapa kali circuit breaker terbuka.')
+CONVERSATION_TRANSITIONS = REGISTRY.counter('bot_conversation_transitions_total', 'Perpindahan state percakapan.', ['conversation', 'state'])
+CONVERSATIONS_ACTIVE = REGISTRY.gauge('bot_conversations_active', 'Percakapan yang sedang berada di tiap state.', ['conversation', 'state'])
+QUEUE_DEPTH = REGISTRY.gauge('bot_queue_depth', 'Kedalaman antrean internal.', ['queue'])
+ROLE_SET_SIZE = REGISTRY.gauge('bot_role_set_size', 'Ukuran set peran di memori.', ['role'])
+UPDATES_DROPPED = REGISTRY.counter('bot_updates_dropped_total', 'Update yang dibuang karena antrean per pengguna penuh.')
+DUPLICATES_SUPPRESSED = REGISTRY.counter('bot_duplicate_checkins_suppressed_total', 'Check-in duplikat yang tidak ditulis ke penyimpanan.', ['action'])
+OUTLET_INDEX_SIZE = REGISTRY.gauge('bot_outlet_index_size', 'Isi indeks spasial outlet di memori.', ['kind'])
+CHECKIN_CACHE_ROWS = REGISTRY.gauge('bot_checkin_cache_rows', 'Check-in di cache kolumnar /rekap.')
+OUTBOUND_QUEUE_DEPTH = REGISTRY.gauge('bot_outbound_queue_depth', 'Request ke Telegram yang menunggu giliran rate limiter.', ['priority'])
+OUTBOUND_WAIT = REGISTRY.histogram('bot_outbound_wait_seconds', 'Waktu tunggu request ke Telegram di rate limiter.', ['priority'])
+OUTBOUND_SENT = REGISTRY.counter('bot_outbound_requests_total', 'Request ke Telegram yang sudah diberi giliran rate limiter.', ['priority'])
+OUTBOUND_RETRY_AFTER = REGISTRY.counter('bot_outbound_retry_after_total', 'Respons RetryAfter (flood control) dari Telegram.')
+SHEETS_TOKEN_REFRESHES = REGISTRY.counter('bot_sheets_token_refresh_total', 'Refresh access token Google (background: sebelum kedaluwarsa; request: lazy saat panggilan).', ['trigger', 'result'])
+STARTUP_SECONDS = REGISTRY.gauge('bot_startup_seconds', 'Detik sejak proses dimulai sampai tahap start tercapai (ready: webhook melayani; roles_loaded: peran dari Google Sheets).', ['stage'])
+
+def observe_sheets_call(method: str, seconds: float, error_status):
+    SHEETS_CALL_LATENCY.observe(seconds, method=method)
+    if error_status:
+        SHEETS_CALL_ERRORS.inc(method=method, status=error_status)
+
+sheets_pool.on_call = observe_sheets_call
+sheets_pool.on_retry = lambda method, status: SHEETS_RETRIES.inc(method=method, status=status)
+SHEETS_BREAKER_STATE.set_function(lambda: {(state,): float(sheets_pool.breaker.state == state) for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)})
+SHEETS_BREAKER_OPENED.set_function(lambda: sheets_pool.breaker.opened_total)
+ROLE_SET_SIZE.set_function(lambda: {('admin',): len(admin_ids), ('user',): len(user_ids)})
+QUEUE_DEPTH.set_function(lambda: {
+    ('checkin_write',): checkin_write_queue.pending,
+    ('sheets_calls_in_flight',): sheets_pool.in_flight,
+    ('journal_in_flight',): len(journal_in_flight),
+    ('journal_pending',): journal_pending_count,
+    ('updates_running',): update_processor.running,
+    ('updates_waiting',): update_processor.queued,
+})
+UPDATES_DROPPED.set_function(lambda: update_processor.dropped)
+OUTLET_INDEX_SIZE.set_function(lambda: {('checkins',): outlet_index.points, ('outlets',): outlet_index.outlets})
+CHECKIN_CACHE_ROWS.set_function(lambda: checkin_columns.size)
+outbound_limiter.on_wait = lambda priority, seconds: OUTBOUND_WAIT.observe(seconds, priority=priority)
+OUTBOUND_QUEUE_DEPTH.set_function(lambda: {(name,): depth for name, depth in outbound_limiter.queue_depths().items()})
+OUTBOUND_SENT.set_function(lambda: {(name,): count for name, count in zip(PRIORITY_NAMES, outbound_limiter.sent)})
+OUTBOUND_RETRY_AFTER.set_function(lambda: outbound_limiter.retry_after_total)
+
+# State percakapan terakhir per (percakapan, user_id), untuk gauge bot_conversations_active
+conversation_states = {}
+
+def track_conversation(conversation: str, user_id: int, state_name: str):
+    CONVERSATION_TRANSITIONS.inc(conversation=conversation, state=state_name)
+    if state_name == 'END':
+        conversation_states.pop((conversation, user_id), None)
+    else:
+        conversation_states[(conversation, user_id)] = state_name
+
+def count_active_conversations() -> dict:
+    counts = {}
+    for (conversation, _), state_name in list(conversation_states.items()):
+        counts[(conversation, state_name)] = counts.get((conversation, state_name), 0) + 1
+    return counts
+
+CONVERSATIONS_ACTIVE.set_function(count_active_conversations)
+
 def get_google_sheet_client():
-    global gsheet_client
     if gsheet_client:
         return gsheet_client # Return existing client if already initialized
 
+    with gsheet_client_lock:
+        if gsheet_client:
+            return gsheet_client
+        return _create_google_sheet_client()
+
+def _create_google_sheet_client():
+    global gsheet_client, token_refresher
     try:
+        # Diimpor saat pertama dipakai (di thread pool), bukan saat start: impor ini memakan ratusan ms
+        from sheets_client import create_client
         creds_dict = json.loads(GOOGLE_CREDENTIALS_JSON)
-        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        gsheet_client = gspread.authorize(creds)
+        # Pool koneksi keep-alive seukuran sheets_pool; token diperbarui di latar belakang sebelum kedaluwarsa
+        gsheet_client, token_refresher = create_client(
+            creds_dict,
+            pool_size=SHEETS_MAX_CONCURRENCY,
+            refresh_margin=SHEETS_TOKEN_REFRESH_MARGIN,
+            on_refresh=lambda trigger, ok: SHEETS_TOKEN_REFRESHES.inc(trigger=trigger, result='ok' if ok else 'error'),
+        )
         logger.info("Klien Google Sheet berhasil diinisialisasi.")
         return gsheet_client
     except json.JSONDecodeError as e:
@@ -70,72 +436,356 @@ def get_google_sheet_client():
         logger.critical(f"Inisialisasi Google Sheets gagal: {e}. Pastikan SHEET_URL benar dan Akun Layanan memiliki izin Editor.")
         raise # Re-raise for bot to crash, as this is critical
 
-def load_user_roles():
-    """Memuat peran pengguna dari Google Sheet 'Users'."""
+def open_spreadsheet():
+    """Membuka spreadsheet utama; hanya dipanggil oleh cache handle backend 'sheets' saat cache kosong."""
+    return get_google_sheet_client().open_by_url(SHEET_URL)
+
+# Header tiap worksheet; dipakai backend 'sqlite'/'memory' saat membuat worksheet baru
+CHECKIN_HEADERS = ['user_id', 'first_name', 'username', 'timestamp', 'nama_lokasi', 'wilayah', 'link_google_map', 'checkin_id']
+SHEET_HEADERS = {"Users": REQUIRED_HEADERS, LEGACY_CHECKIN_SHEET: CHECKIN_HEADERS, LOCATIONS_SHEET: LOCATION_HEADERS}
+
+# Semua penyimpanan (peran, pengguna, check-in) lewat backend ini; untuk 'sheets', handle
+# "Users" dan worksheet check-in dibuka sekali lalu dipakai ulang
+storage_backend = create_storage(
+    STORAGE_BACKEND,
+    open_spreadsheet=open_spreadsheet,
+    sqlite_path=SQLITE_STORAGE_PATH,
+    default_headers=SHEET_HEADERS,
+    fake_latency=FAKE_SHEETS_LATENCY_MS / 1000,
+    fake_error_rate=FAKE_SHEETS_ERROR_RATE,
+)
+
+# Worksheet check-in per bulan; partisi bulan baru dibuat otomatis saat check-in pertamanya ditulis
+checkin_partitions = CheckinPartitions(storage_backend, CHECKIN_HEADERS, enabled=CHECKIN_PARTITIONING == 'month')
+
+async def run_on_worksheet(title: str, method: str, *args, idempotent: bool = False, **kwargs):
+    """
+    Menjalankan worksheet.<method>(*args, **kwargs) di sheets_pool lewat backend penyimpanan.
+    idempotent=True untuk baca/update yang aman diulang saat 5xx atau gangguan koneksi.
+    """
+    return await sheets_pool.call(method, storage_backend.run, title, lambda ws: getattr(ws, method)(*args, **kwargs), idempotent=idempotent)
+
+def apply_user_roles(save_snapshot: bool = True):
+    """
+    Menghitung ulang admin_ids/user_ids dari user_table (tanpa akses jaringan) dan, jika
+    save_snapshot, menyimpan isi tabel ke snapshot lokal untuk warm start berikutnya.
+    """
     global admin_ids, user_ids
+    # Set baru dibangun terpisah lalu ditukar sekaligus, karena fungsi ini bisa berjalan di thread pool
+    # sementara dekorator akses membaca admin_ids/user_ids dari event loop.
+    admin_ids, user_ids = user_table.role_sets()
+    logger.info(f"Peran pengguna dimuat. Admin: {sorted(list(admin_ids))}. Total Pengguna Terdaftar: {sorted(list(user_ids))}")
+    if save_snapshot and role_snapshot:
+        try:
+            role_snapshot.save(user_table.rows())
+        except OSError as e:
+            logger.warning(f"Gagal menyimpan snapshot peran ke {role_snapshot.path}: {e}")
+
+def load_roles_snapshot() -> bool:
+    """Warm start: mengisi tabel dan set peran dari snapshot lokal. False jika snapshot tidak ada."""
+    rows = role_snapshot.load() if role_snapshot else None
+    if not rows:
+        return False
+    user_table.load(rows)
+    apply_user_roles(save_snapshot=False)
+    role_refresh_status['source'] = 'snapshot'
+    saved_at = datetime.fromtimestamp(role_snapshot.saved_at, pytz.timezone('Asia/Jakarta')).strftime("%Y-%m-%d %H:%M:%S") if role_snapshot.saved_at else '-'
+    logger.info(f"Peran dimuat dari snapshot {role_snapshot.path} (disimpan {saved_at} GMT+7); Google Sheets dimuat di latar belakang.")
+    return True
+
+def fetch_users_sheet() -> list:
+    """Mengunduh seluruh isi lembar 'Users' (blocking)."""
     try:
-        client = get_google_sheet_client()
-        spreadsheet = client.open_by_url(SHEET_URL)
-
+        return storage_backend.run("Users", lambda ws: ws.get_all_values())
+    except WorksheetMissing:
+        # Daftar lembar kerja hanya diambil saat gagal, untuk membantu diagnosis
         try:
-            worksheet_names = [ws.title for ws in spreadsheet.worksheets()]
-            logger.info(f"Berhasil terhubung ke spreadsheet. Ditemukan lembar kerja: {worksheet_names}")
-            if "Users" not in worksheet_names:
-                logger.critical(f"Lembar kerja 'Users' TIDAK DITEMUKAN di spreadsheet. Lembar kerja yang tersedia: {worksheet_names}")
-                raise ValueError("Lembar kerja 'Users' tidak ditemukan.") # Raise an error to stop initialization
+            worksheet_names = storage_backend.worksheet_titles()
         except Exception as e:
             logger.critical(f"Kesalahan daftar lembar kerja di spreadsheet. Harap periksa izin. Error: {e}")
             raise # Re-raise jika tidak bisa membaca daftar worksheet
+        logger.critical(f"Lembar kerja 'Users' TIDAK DITEMUKAN di spreadsheet. Lembar kerja yang tersedia: {worksheet_names}")
+        raise ValueError("Lembar kerja 'Users' tidak ditemukan.") # Raise an error to stop initialization
 
-        worksheet = spreadsheet.worksheet("Users")
-        all_data = worksheet.get_all_values()
+def users_checksum(all_data: list) -> str:
+    return hashlib.sha1(json.dumps(all_data, ensure_ascii=False).encode('utf-8')).hexdigest()
 
-        admin_ids.clear()
-        user_ids.clear()
+def probe_spreadsheet_revision():
+    """Probe murah (untuk Sheets: metadata Drive 'modifiedTime'); None jika tidak tersedia."""
+    try:
+        return storage_backend.revision()
+    except Exception as e:
+        logger.warning(f"Probe revisi spreadsheet gagal, memakai checksum isi sheet: {e}")
+        return None
 
-        # OWNER_ID selalu admin dan user
-        admin_ids.add(OWNER_ID)
-        user_ids.add(OWNER_ID)
+@timed(HANDLER_LATENCY, handler='load_user_roles')
+def load_user_roles():
+    """
+    Memuat peran pengguna dari Google Sheet 'Users'.
+    Fungsi ini blocking; dari handler async panggil lewat `await sheets_pool.run_idempotent(load_user_roles)`.
+    """
+    try:
+        revision = probe_spreadsheet_revision()
+        all_data = fetch_users_sheet()
 
         if not all_data:
             logger.warning("Lembar 'Users' kosong.")
-            return
-
-        # Loop melalui baris data, mulai dari baris kedua (index 1)
-        for i, row in enumerate(all_data[1:]): # Melewati header (all_data[0])
-            row_num = i + 2 # Nomor baris di sheet Google (mulai dari 2)
-            try:
-                # user_id ada di kolom A (index 0)
-                user_id_str = row[0] if len(row) > 0 else None
-                if not user_id_str:
-                    logger.warning(f"Melewati baris {row_num} di 'Users' karena 'user_id' di kolom A hilang.")
-                    continue
-                user_id = int(user_id_str.strip()) # Pastikan user_id bisa diubah ke integer
-
-                # role ada di kolom B (index 1)
-                role_str = row[1] if len(row) > 1 else None
-                if not role_str:
-                    logger.warning(f"Melewati baris {row_num} di 'Users' karena 'role' di kolom B hilang.")
-                    continue
-                role = str(role_str).strip().lower() # Normalisasi role
-
-                # Tambahkan ke set user_ids jika valid
-                user_ids.add(user_id)
-
-                # Tambahkan ke set admin_ids jika peran adalah 'admin' atau 'owner'
-                if role == 'admin' or user_id == OWNER_ID: # Owner juga dianggap admin
-                    admin_ids.add(user_id)
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Melewati baris {row_num} di lembar 'Users' karena data tidak valid di kolom A (user_id) atau B (role). Data: {row}. Error: {e}")
-            except Exception as e:
-                logger.error(f"Kesalahan tak terduga saat memproses baris {row_num} di lembar 'Users'. Data: {row}. Error: {e}")
 
-        logger.info(f"Peran pengguna dimuat. Admin: {sorted(list(admin_ids))}. Total Pengguna Terdaftar: {sorted(list(user_ids))}")
+        user_table.load(all_data)
+        apply_user_roles()
+        now = datetime.now(pytz.timezone('Asia/Jakarta'))
+        role_refresh_status.update(revision=revision, checksum=users_checksum(all_data), last_checked=now, last_rebuilt=now, source='sheets')
+        logger.info(f"Statistik backend penyimpanan: {storage_backend.stats()}")
 
     except Exception as e:
         logger.critical(f"Gagal memuat peran pengguna dari Google Sheet (Users). Harap periksa status API Google Cloud Console, izin Akun Layanan, dan akses sheet. Error: {e}")
         raise # Re-raise for bot to crash if user roles cannot be loaded
 
+def refresh_user_roles() -> bool:
+    """
+    Refresh inkremental (blocking): lewati pembangunan ulang jika 'Users' tidak berubah.
+    Tahap 1 membandingkan revisi spreadsheet (satu request metadata); tahap 2, bila revisi
+    berubah (misalnya karena check-in baru), membandingkan checksum isi 'Users'.
+    Mengembalikan True jika tabel dan set peran dibangun ulang.
+    """
+    revision = probe_spreadsheet_revision()
+    now = datetime.now(pytz.timezone('Asia/Jakarta'))
+    if revision is not None and revision == role_refresh_status['revision']:
+        role_refresh_status['last_checked'] = now
+        return False
+
+    all_data = fetch_users_sheet()
+    checksum = users_checksum(all_data)
+    if checksum == role_refresh_status['checksum']:
+        role_refresh_status.update(revision=revision, last_checked=now)
+        return False
+
+    user_table.load(all_data)
+    apply_user_roles()
+    role_refresh_status.update(revision=revision, checksum=checksum, last_checked=now, last_rebuilt=now, source='sheets')
+    return True
+
+async def refresh_roles_job(context: ContextTypes.DEFAULT_TYPE):
+    """Job periodik JobQueue: menyegarkan peran agar edit langsung di sheet ikut terbaca."""
+    try:
+        # Tunggu perubahan pengguna yang sedang berjalan agar nomor baris di tabel tidak tertimpa
+        async with get_users_lock():
+            rebuilt = await sheets_pool.run_idempotent(refresh_user_roles)
+        if rebuilt:
+            logger.info("Refresh berkala: lembar 'Users' berubah, peran dibangun ulang.")
+    except Exception as e:
+        logger.error(f"Refresh berkala peran pengguna gagal, memakai data terakhir: {e}")
+
+def ensure_users_columns(count: int):
+    """
+    Memastikan grid lembar 'Users' punya minimal `count` kolom (blocking): menulis di luar col_count
+    ditolak Sheets API. Worksheet backend 'sqlite'/'memory' tidak punya batas kolom (tanpa col_count).
+    """
+    def ensure(ws):
+        col_count = getattr(ws, 'col_count', None)
+        if col_count is not None and col_count < count:
+            ws.add_cols(count - col_count)
+            logger.info(f"Lembar 'Users' diperlebar dari {col_count} menjadi {count} kolom.")
+    storage_backend.run("Users", ensure)
+
+def compact_users_sheet() -> int:
+    """
+    Membuang baris tombstone dari lembar 'Users' (blocking): isi yang tersisa ditulis ulang dalam
+    satu batch_update dan baris kosong di ekor dipangkas. Mengembalikan jumlah baris yang dibuang.
+    """
+    all_data = fetch_users_sheet()
+    kept, removed = without_tombstones(all_data)
+    if not removed:
+        return 0
+    width = max(len(row) for row in all_data)
+    values = [list(row) + [''] * (width - len(row)) for row in kept] + [[''] * width for _ in range(removed)]
+    last_cell = rowcol_to_a1(len(all_data), width)
+    storage_backend.run("Users", lambda ws: ws.batch_update([{'range': f"A1:{last_cell}", 'values': values}]))
+    try:
+        # Isi sudah benar tanpa ini; hanya merapikan baris kosong sisa penulisan ulang
+        storage_backend.run("Users", lambda ws: ws.delete_rows(len(kept) + 1, len(all_data)))
+    except Exception as e:
+        logger.warning(f"Gagal memangkas {removed} baris kosong di lembar 'Users' setelah compaction: {e}")
+    # Isi sheet sekarang sama dengan baris yang baru ditulis: checksum diperbarui agar refresh berikutnya
+    # tidak menganggap lembar berubah dan membangun ulang tanpa perlu
+    compacted = values[:len(kept)]
+    user_table.load(compacted)
+    apply_user_roles()
+    role_refresh_status.update(checksum=users_checksum(compacted), source='sheets')
+    return removed
+
+async def compact_users_job(context: ContextTypes.DEFAULT_TYPE):
+    """Job harian (di luar jam kerja): memadatkan lembar 'Users' dari tombstone penghapusan pengguna."""
+    try:
+        # Kelola pengguna ditahan selama penulisan ulang agar nomor baris di tabel tidak tertimpa
+        async with get_users_lock():
+            removed = await sheets_pool.run_idempotent(compact_users_sheet)
+        if removed:
+            logger.info(f"Compaction lembar 'Users': {removed} baris tombstone dibuang.")
+    except Exception as e:
+        logger.error(f"Compaction lembar 'Users' gagal, dicoba lagi pada jadwal berikutnya: {e}")
+
+async def warm_start_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Job sekali jalan setelah webhook melayani: mencatat waktu siap, lalu memuat peran dari Google
+    Sheets. Jika gagal, dicoba lagi dengan jeda yang membesar sampai berhasil (peran dari snapshot tetap dipakai).
+    """
+    if context.job.data is None:
+        ready = time.monotonic() - PROCESS_STARTED
+        STARTUP_SECONDS.set(ready, stage='ready')
+        logger.info(f"Bot siap melayani {ready:.2f} detik setelah proses dimulai (sumber peran: {role_refresh_status['source'] or 'belum ada'}).")
+    try:
+        async with get_users_lock():
+            await sheets_pool.run_idempotent(load_user_roles)
+    except Exception as e:
+        delay = min(300, (context.job.data or 5) * 2)
+        logger.error(f"Memuat peran dari Google Sheets gagal, dicoba lagi dalam {delay} detik: {e}")
+        context.job_queue.run_once(warm_start_job, when=delay, data=delay, name="warm_start")
+        return
+    loaded = time.monotonic() - PROCESS_STARTED
+    STARTUP_SECONDS.set(loaded, stage='roles_loaded')
+    logger.info(f"Peran dari Google Sheets dimuat {loaded:.2f} detik setelah proses dimulai.")
+
+def append_rows_to(title: str, rows: list):
+    """Menulis beberapa baris ke worksheet `title` dalam satu panggilan API (blocking)."""
+    checkin_partitions.ensure(title) # Rollover: partisi bulan baru dibuat dengan header dulu
+    try:
+        # append_rows menambahkan ke baris kosong pertama
+        storage_backend.run(title, lambda ws: ws.append_rows(rows))
+    except WorksheetMissing:
+        checkin_partitions.forget(title) # Dihapus manual: dibuat ulang pada percobaan berikutnya
+        raise
+
+def append_checkin_rows(rows: list):
+    """Menulis beberapa baris check-in ke worksheet partisi bulannya, satu append per worksheet (blocking)."""
+    by_sheet = {}
+    for row in rows:
+        by_sheet.setdefault(checkin_partitions.sheet_for(row[3]), []).append(row)
+    for title, group in by_sheet.items():
+        append_rows_to(title, group)
+
+# Check-in dari banyak pengguna dikumpulkan lalu ditulis dengan satu append_rows per batch
+checkin_write_queue = BatchWriteQueue(
+    sheets_pool,
+    append_checkin_rows,
+    max_rows=CHECKIN_BATCH_MAX_ROWS,
+    max_wait=CHECKIN_BATCH_MAX_WAIT_MS / 1000,
+    name="check-in",
+)
+
+# Setiap check-in dicatat di jurnal dulu; satu thread khusus agar penulisan SQLite berurutan
+checkin_journal = CheckinJournal(CHECKIN_JOURNAL_PATH)
+journal_pool = BlockingCallPool(1, thread_name_prefix="journal")
+journal_in_flight = set() # ID entri jurnal yang sedang ditulis lewat antrean (jangan di-replay)
+journal_pending_count = 0 # Jumlah entri jurnal belum terkirim, diperbarui oleh replayer (untuk metrik)
+
+async def write_journaled_checkin(entry_id: int, row_data: list):
+    """
+    Mengirim entri jurnal lewat antrean tulis, lalu menandainya terkirim atau mencatat kegagalannya.
+    Pemanggil sudah memasukkan entry_id ke journal_in_flight sebelum task ini dijadwalkan.
+    """
+    try:
+        try:
+            await checkin_write_queue.submit(row_data)
+        except Exception as e:
+            await journal_pool.run(checkin_journal.record_failure, [entry_id], str(e), not is_rejected(e))
+            raise
+        await journal_pool.run(checkin_journal.mark_sent, [entry_id])
+    finally:
+        journal_in_flight.discard(entry_id)
+
+async def replay_journal_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Job periodik: mengirim ulang entri jurnal yang belum sampai ke sheet, per worksheet dalam satu
+    append_rows. Kunci idempotensi ada di kolom terakhir baris; untuk entri yang sebelumnya gagal,
+    kolom itu dibaca dulu agar baris yang ternyata sudah tertulis tidak diduplikasi.
+    """
+    global journal_pending_count
+    try:
+        journal_pending_count = (await journal_pool.run(checkin_journal.stats))['pending']
+    except Exception as e:
+        logger.error(f"Gagal membaca statistik jurnal check-in: {e}")
+    if sheets_pool.breaker.state == CircuitBreaker.OPEN:
+        return # Jangan membebani API yang sedang tidak sehat; coba lagi di putaran berikutnya
+    try:
+        entries = await journal_pool.run(checkin_journal.pending, CHECKIN_BATCH_MAX_ROWS, tuple(journal_in_flight))
+    except Exception as e:
+        logger.error(f"Gagal membaca jurnal check-in: {e}")
+        return
+    by_sheet = {}
+    for entry in entries:
+        by_sheet.setdefault(entry.sheet, []).append(entry)
+
+    for sheet, group in by_sheet.items():
+        ids = [entry.id for entry in group]
+        journal_in_flight.update(ids)
+        try:
+            if any(entry.attempts for entry in group):
+                key_column = len(group[0].row)
+                existing = set(await run_on_worksheet(sheet, "col_values", key_column, idempotent=True))
+                already_written = [entry.id for entry in group if entry.idempotency_key in existing]
+                await journal_pool.run(checkin_journal.mark_sent, already_written)
+                group = [entry for entry in group if entry.idempotency_key not in existing]
+            if group:
+                await sheets_pool.run(append_rows_to, sheet, [entry.row for entry in group])
+                await journal_pool.run(checkin_journal.mark_sent, [entry.id for entry in group])
+                logger.info(f"Replayer jurnal mengirim {len(group)} baris tertunda ke '{sheet}'.")
+        except Exception as e:
+            logger.warning(f"Replayer jurnal gagal mengirim {len(group)} baris ke '{sheet}', dicoba lagi nanti: {e}")
+            await journal_pool.run(checkin_journal.record_failure, [entry.id for entry in group], str(e), not is_rejected(e))
+        finally:
+            journal_in_flight.difference_update(ids)
+
+def journal_retention_seconds() -> float:
+    """Umur entri terkirim yang disimpan di jurnal; tidak pernah lebih pendek dari jendela check-in duplikat."""
+    return max(JOURNAL_RETENTION_DAYS * 86400, DUPLICATE_WINDOW_SECONDS)
+
+async def prune_journal_job(context: ContextTypes.DEFAULT_TYPE):
+    """Job berkala: menghapus entri jurnal check-in yang sudah terkirim lebih dari JOURNAL_RETENTION_DAYS hari."""
+    try:
+        removed = await journal_pool.run(checkin_journal.prune, journal_retention_seconds())
+    except Exception as e:
+        logger.error(f"Gagal membersihkan jurnal check-in: {e}")
+        return
+    if removed:
+        logger.info(f"Jurnal check-in dibersihkan: {removed} entri terkirim lebih dari {JOURNAL_RETENTION_DAYS} hari dihapus.")
+
+# Check-in terakhir per pengguna untuk mendeteksi check-in ulang sebelum menulis ke penyimpanan
+duplicate_guard = DuplicateGuard(DUPLICATE_WINDOW_SECONDS, DUPLICATE_RADIUS_M) if DUPLICATE_WINDOW_SECONDS else None
+
+# Cache riwayat check-in, dibaca bertahap (hanya baris baru) dari worksheet check-in: indeks spasial
+# outlet untuk saran outlet terdekat dan cache kolumnar untuk /rekap
+outlet_index = OutletIndex()
+checkin_columns = CheckinColumns()
+checkin_tail = PartitionedTailReader(checkin_partitions, last_column='H')
+indexed_checkin_ids = set() # Check-in yang sudah masuk indeks outlet saat disimpan; dilewati saat terbaca dari sheet
+
+def refresh_checkin_history() -> int:
+    """Membaca check-in baru dari sheet ke indeks outlet dan cache /rekap (blocking). Mengembalikan jumlah baris baru."""
+    rows = [row for _, _, row in checkin_tail.read_new()]
+    checkin_columns.append(rows)
+    for row in rows:
+        if len(row) < 7:
+            continue
+        checkin_id = row[7] if len(row) > 7 else ''
+        if checkin_id in indexed_checkin_ids:
+            indexed_checkin_ids.discard(checkin_id)
+            continue
+        coordinates = parse_maps_link(row[6])
+        if coordinates:
+            outlet_index.add(row[4], row[5], *coordinates)
+    return len(rows)
+
+async def refresh_checkin_history_job(context: ContextTypes.DEFAULT_TYPE):
+    """Job periodik: membaca check-in baru ke cache riwayat (putaran pertama membaca seluruh riwayat)."""
+    try:
+        added = await sheets_pool.run_idempotent(refresh_checkin_history)
+        if added:
+            stats = outlet_index.stats()
+            logger.info(f"Cache riwayat: {added} check-in baru dibaca, total {checkin_columns.size} check-in, {stats['outlets']} outlet.")
+    except Exception as e:
+        logger.error(f"Gagal memperbarui cache riwayat check-in, dicoba lagi nanti: {e}")
+
 # --- Dekorator untuk Akses Perintah ---
 def admin_only(func):
     """Membatasi akses perintah hanya untuk admin."""
@@ -171,6 +821,33 @@ def registered_user_only(func):
 GET_LOCATION_NAME, GET_REGION, GET_LOCATION = range(3)
 ADD_ADMIN_ID, REMOVE_ADMIN_ID, ADD_USER_ID, REMOVE_USER_ID = range(3, 7) # New states for user management
 
+# Nama state untuk label metrik
+STATE_NAMES = {
+    GET_LOCATION_NAME: 'GET_LOCATION_NAME', GET_REGION: 'GET_REGION', GET_LOCATION: 'GET_LOCATION',
+    ADD_ADMIN_ID: 'ADD_ADMIN_ID', REMOVE_ADMIN_ID: 'REMOVE_ADMIN_ID', ADD_USER_ID: 'ADD_USER_ID', REMOVE_USER_ID: 'REMOVE_USER_ID',
+    ConversationHandler.END: 'END',
+}
+
+def observe_handler(name: str, conversation: str = None):
+    """
+    Mencatat durasi handler ke bot_handler_duration_seconds dan, untuk handler percakapan,
+    state yang dikembalikan. conversation='*' mengakhiri semua percakapan pengguna (dipakai /cancel).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            with HANDLER_LATENCY.time(handler=name):
+                result = await func(update, context)
+            if conversation and result in STATE_NAMES and update.effective_user:
+                if conversation == '*':
+                    for key in [k for k in conversation_states if k[1] == update.effective_user.id]:
+                        track_conversation(key[0], update.effective_user.id, STATE_NAMES[result])
+                else:
+                    track_conversation(conversation, update.effective_user.id, STATE_NAMES[result])
+            return result
+        return wrapper
+    return decorator
+
 # --- Command Handlers ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Halo! Saya bot Sales Check-in Anda. Gunakan /help untuk melihat perintah.")
@@ -191,16 +868,21 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         help_text += (
             "\n\n**--- Perintah Admin ---**\n"
             "/reloadroles - Memuat ulang peran pengguna dari Google Sheet\n"
+            "/rolestatus - Melihat waktu refresh peran terakhir\n"
+            "/pending - Melihat jumlah check-in yang belum terkirim ke Google Sheet\n"
+            "/rekap - Rekap check-in per user/wilayah/hari/minggu (contoh: /rekap wilayah 30)\n"
+            "/export - Ekspor check-in ke CSV/Parquet (contoh: /export dari=2026-10-01 sampai=2026-10-31 user=123)\n"
+            "/broadcast - Mengirim pesan ke semua pengguna (contoh: /broadcast Shift pagi mulai 08.00)\n"
             "/listuser - Melihat ID seluruh pengguna terdaftar (termasuk admin/owner)\n"
             "/listadmins - Melihat ID admin yang terdaftar\n"
-            "/adduser - Menambah user baru\n" # Admin bisa add user
-            "/removeuser - Menghapus user\n" # Admin bisa remove user
+            "/adduser - Menambah user baru (bisa banyak ID atau file CSV, contoh: /adduser 111 222)\n" # Admin bisa add user
+            "/removeuser - Menghapus user (bisa banyak ID atau file CSV)\n" # Admin bisa remove user
         )
     if user_id == OWNER_ID:
         help_text += (
             "\n\n**--- Perintah Owner ---**\n"
-            "/addadmin - Menambah user sebagai admin\n"
-            "/removeadmin - Menghapus admin\n"
+            "/addadmin - Menambah user sebagai admin (bisa banyak ID)\n"
+            "/removeadmin - Menghapus admin (bisa banyak ID)\n"
             "(Note: Owner juga bisa menggunakan /adduser dan /removeuser)"
         )
     await update.message.reply_text(help_text, parse_mode='Markdown')
@@ -213,13 +895,185 @@ async def myid(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @admin_only
 async def reload_roles(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        load_user_roles()
+        async with get_users_lock():
+            await sheets_pool.run_idempotent(load_user_roles)
         await update.message.reply_text("Peran pengguna berhasil dimuat ulang.")
         logger.info(f"Admin {update.effective_user.id} ({update.effective_user.username}) memuat ulang peran pengguna.")
     except Exception as e:
         await update.message.reply_text(f"Gagal memuat ulang peran: {e}")
         logger.error(f"Admin {update.effective_user.id} ({update.effective_user.username}) gagal memuat ulang peran: {e}")
 
+ROLE_SOURCE_LABELS = {'snapshot': "snapshot lokal (Google Sheets belum termuat)", 'sheets': "Google Sheets"}
+
+@admin_only
+async def role_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    def fmt(value):
+        return value.strftime("%Y-%m-%d %H:%M:%S") if value else "-"
+    interval = f"setiap {ROLE_REFRESH_INTERVAL} detik" if ROLE_REFRESH_INTERVAL else "nonaktif"
+    await update.message.reply_text(
+        "**Status Refresh Peran**\n"
+        f"Refresh otomatis: {interval}\n"
+        f"Pemeriksaan terakhir berhasil: {fmt(role_refresh_status['last_checked'])} (GMT+7)\n"
+        f"Pembangunan ulang terakhir: {fmt(role_refresh_status['last_rebuilt'])} (GMT+7)\n"
+        f"Sumber peran: {ROLE_SOURCE_LABELS.get(role_refresh_status['source'], 'belum dimuat')}\n"
+        f"Admin: {len(admin_ids)}, Pengguna terdaftar: {len(user_ids)}",
+        parse_mode='Markdown'
+    )
+    logger.info(f"Admin {update.effective_user.id} ({update.effective_user.username}) meminta status refresh peran.")
+
+@admin_only
+async def pending_checkins(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    stats = await journal_pool.run(checkin_journal.stats)
+    message = (
+        "**Antrean Check-in Tertunda**\n"
+        f"Belum terkirim ke Google Sheet: {stats['pending']}\n"
+        f"Sedang dikirim: {len(journal_in_flight)}\n"
+        f"Pernah gagal dikirim: {stats['failed']}\n"
+        f"Umur entri tertua: {int(stats['oldest_age_seconds'])} detik"
+    )
+    if stats['last_error']:
+        message += f"\nError terakhir: {stats['last_error']}"
+    api = sheets_pool.stats()
+    message += (
+        f"\n\nCircuit breaker Google Sheets: {api['breaker_state']} (dibuka {api['breaker_opened_total']}x)\n"
+        f"Retry: {api['retries']}, Kegagalan: {api['failures']}, Ditolak breaker: {api['rejected']}"
+    )
+    await update.message.reply_text(message)
+    logger.info(f"Admin {update.effective_user.id} ({update.effective_user.username}) meminta status antrean check-in.")
+
+# /rekap <dimensi> [jumlah hari]: rentang default per dimensi dan batas baris per balasan
+REKAP_DEFAULT_DAYS = {'user': 30, 'wilayah': 30, 'hari': 14, 'minggu': 84}
+REKAP_MAX_LINES = 40
+
+def format_rekap_lines(counts: list, limit: int = REKAP_MAX_LINES) -> str:
+    lines = [f"{label}: {count}" for label, count in counts[:limit]]
+    if len(counts) > limit:
+        lines.append(f"... dan {len(counts) - limit} lainnya")
+    return "\n".join(lines) or "(tidak ada check-in)"
+
+@observe_handler('rekap')
+@admin_only
+async def rekap(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Rekap jumlah check-in per pengguna/wilayah/hari/minggu dari cache kolumnar (hanya baris baru yang dibaca dari sheet)."""
+    args = [arg.lower() for arg in (context.args or [])]
+    dimension = args[0] if args else None
+    if dimension is not None and dimension not in REKAP_DEFAULT_DAYS:
+        await update.message.reply_text(
+            "Format: /rekap [user|wilayah|hari|minggu] [jumlah hari]\n"
+            "Contoh: /rekap wilayah 30, /rekap minggu 84. Tanpa argumen: ringkasan 7 hari terakhir."
+        )
+        return
+    try:
+        days = int(args[1]) if len(args) > 1 else REKAP_DEFAULT_DAYS.get(dimension, 7)
+        if not 1 <= days <= 3660:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text("Jumlah hari harus bilangan bulat antara 1 dan 3660.")
+        return
+
+    note = ""
+    try:
+        await sheets_pool.run_idempotent(refresh_checkin_history)
+    except Exception as e:
+        note = "\n(Google Sheet sedang tidak bisa dibaca; memakai data cache terakhir.)"
+        logger.warning(f"Rekap memakai cache tanpa refresh: {e}")
+
+    started = time.perf_counter()
+    end_day = today_day()
+    start_day = end_day - days + 1
+    period = f"{day_to_date(start_day)} s/d {day_to_date(end_day)} (GMT+7)"
+    if dimension is None:
+        by_day = checkin_columns.count_by('hari', start_day, end_day)
+        total = sum(count for _, count in by_day)
+        message = (
+            f"Rekap check-in {period}\nTotal: {total}\n\n"
+            f"Per wilayah (teratas):\n{format_rekap_lines(checkin_columns.count_by('wilayah', start_day, end_day), 5)}\n\n"
+            f"Per pengguna (teratas):\n{format_rekap_lines(checkin_columns.count_by('user', start_day, end_day), 5)}\n\n"
+            f"Per hari:\n{format_rekap_lines(by_day)}"
+        )
+    else:
+        counts = checkin_columns.count_by(dimension, start_day, end_day)
+        total = sum(count for _, count in counts)
+        message = f"Rekap check-in per {dimension}, {period}\nTotal: {total}\n\n{format_rekap_lines(counts)}"
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    message += f"\n\nDihitung dari {checkin_columns.size} check-in dalam {elapsed_ms:.1f} ms.{note}"
+    await update.message.reply_text(message)
+    logger.info(f"Admin {update.effective_user.id} ({update.effective_user.username}) meminta rekap {dimension or 'ringkasan'} {days} hari.")
+
+def parse_export_args(args: list) -> dict:
+    """Argumen /export berbentuk kunci=nilai: dari=YYYY-MM-DD sampai=YYYY-MM-DD user=ID[,ID...] format=csv|csv.gz|parquet."""
+    options = {'format': FORMAT_CSV, 'start_day': None, 'end_day': None, 'user_ids': None}
+    for arg in args:
+        key, separator, value = arg.partition('=')
+        key, value = key.lower(), value.strip()
+        if not separator or not value:
+            raise ValueError(f"Argumen '{arg}' harus berbentuk kunci=nilai.")
+        if key in ('dari', 'sampai'):
+            day = int(parse_days([f"{value} 12:00:00"])[0]) # Tengah hari: konversi GMT+7 tidak menggeser tanggal
+            if day < 0:
+                raise ValueError(f"Tanggal '{value}' harus berformat YYYY-MM-DD.")
+            options['start_day' if key == 'dari' else 'end_day'] = day
+        elif key == 'user':
+            try:
+                options['user_ids'] = {int(part) for part in value.split(',') if part.strip()}
+            except ValueError:
+                raise ValueError("user harus berisi ID Telegram berupa angka, dipisah koma.")
+        elif key == 'format':
+            if value.lower() not in EXPORT_FORMATS:
+                raise ValueError(f"format harus salah satu dari {', '.join(EXPORT_FORMATS)}.")
+            options['format'] = value.lower()
+        else:
+            raise ValueError(f"Kunci '{key}' tidak dikenal.")
+    return options
+
+@observe_handler('export')
+@admin_only
+async def export_checkins(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mengekspor check-in (dengan filter tanggal/user) sebagai dokumen; baris dibaca dan ditulis per potongan."""
+    try:
+        options = parse_export_args(context.args or [])
+        exporter = CheckinExporter(CHECKIN_HEADERS, options['format'], options['start_day'], options['end_day'], options['user_ids'], spool_max_bytes=EXPORT_SPOOL_MAX_BYTES)
+    except (ValueError, ExportError) as e:
+        await update.message.reply_text(
+            f"{e}\nFormat: /export [dari=YYYY-MM-DD] [sampai=YYYY-MM-DD] [user=ID,ID] [format={'|'.join(EXPORT_FORMATS)}]"
+        )
+        return
+
+    await update.message.reply_text("Menyiapkan ekspor check-in, mohon tunggu...")
+    started = time.perf_counter()
+    try:
+        # Hanya partisi bulan yang beririsan dengan rentang tanggal (plus 'Check-in Data' lama)
+        titles = await sheets_pool.run_idempotent(checkin_partitions.titles_for_days, options['start_day'], options['end_day'])
+        for title in titles:
+            next_row = 2 # Baris 1 adalah header
+            while True:
+                rows = await sheets_pool.run_idempotent(read_row_range, storage_backend, title, next_row, EXPORT_CHUNK_ROWS, 'H')
+                await sheets_pool.pool.run(exporter.write_rows, rows)
+                next_row += len(rows)
+                if len(rows) < EXPORT_CHUNK_ROWS:
+                    break
+        document, size = await sheets_pool.pool.run(exporter.finish)
+
+        if size > TELEGRAM_DOCUMENT_LIMIT:
+            await update.message.reply_text(
+                f"Hasil ekspor {size / 1024 / 1024:.1f} MB melebihi batas dokumen Telegram (50 MB). "
+                "Persempit rentang tanggal/user atau gunakan format=csv.gz atau format=parquet."
+            )
+            return
+        first = day_to_date(options['start_day']) if options['start_day'] is not None else 'awal'
+        last = day_to_date(options['end_day']) if options['end_day'] is not None else 'akhir'
+        await update.message.reply_document(
+            document=document,
+            filename=f"checkin_{first}_{last}.{options['format']}",
+            caption=f"{exporter.rows_written} dari {exporter.rows_read} check-in ({first} s/d {last}), {time.perf_counter() - started:.1f} detik.",
+        )
+        logger.info(f"Admin {update.effective_user.id} ({update.effective_user.username}) mengekspor {exporter.rows_written} check-in ({options['format']}, {size} byte).")
+    except Exception as e:
+        await update.message.reply_text(f"Ekspor gagal: {e}")
+        logger.error(f"Ekspor check-in oleh {update.effective_user.id} gagal: {e}")
+    finally:
+        exporter.close()
+
 @admin_only
 async def listadmins(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not admin_ids:
@@ -238,6 +1092,43 @@ async def listuser(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"Daftar Pengguna Terdaftar ID:\n`{user_list}`", parse_mode='Markdown')
     logger.info(f"Admin {update.effective_user.id} ({update.effective_user.username}) meminta daftar pengguna terdaftar.")
 
+async def run_broadcast(bot_obj: Bot, admin_chat_id: int, text: str, recipients: list):
+    """Mengirim broadcast di prioritas terendah (rate limiter yang mengatur kecepatan), lalu melapor ke admin."""
+    started = time.perf_counter()
+    failures = {'diblokir': 0, 'gagal': 0}
+
+    async def send(user_id: int):
+        try:
+            await bot_obj.send_message(user_id, text, rate_limit_args=PRIORITY_BROADCAST)
+        except Forbidden:
+            failures['diblokir'] += 1 # Pengguna memblokir bot atau belum pernah memulai chat
+        except Exception as e:
+            failures['gagal'] += 1
+            logger.warning(f"Broadcast ke {user_id} gagal: {e}")
+
+    await asyncio.gather(*(send(user_id) for user_id in recipients))
+    delivered = len(recipients) - sum(failures.values())
+    elapsed = time.perf_counter() - started
+    await bot_obj.send_message(
+        admin_chat_id,
+        f"Broadcast selesai dalam {elapsed:.1f} detik: {delivered} terkirim, {failures['diblokir']} memblokir bot, {failures['gagal']} gagal.",
+    )
+    logger.info(f"Broadcast dari {admin_chat_id} selesai: {delivered}/{len(recipients)} terkirim dalam {elapsed:.1f} detik.")
+
+@observe_handler('broadcast')
+@admin_only
+async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: mengirim pesan ke semua pengguna terdaftar. Berjalan di latar belakang agar tidak menahan update admin."""
+    parts = update.message.text.split(maxsplit=1)
+    text = parts[1].strip() if len(parts) > 1 else ''
+    if not text:
+        await update.message.reply_text("Format: /broadcast <pesan>\nContoh: /broadcast Pengingat: shift pagi mulai pukul 08.00.")
+        return
+    recipients = sorted(user_ids - {update.effective_user.id})
+    await update.message.reply_text(f"Mengirim broadcast ke {len(recipients)} pengguna di latar belakang; ringkasan dikirim setelah selesai.")
+    context.application.create_task(run_broadcast(context.bot, update.effective_chat.id, text, recipients), update=update)
+    logger.info(f"Admin {update.effective_user.id} ({update.effective_user.username}) memulai broadcast ke {len(recipients)} pengguna.")
+
 async def kontak(update: Update, context: ContextTypes.DEFAULT_TYPE):
     contact_info = (
         "**HOTLINE**\n"
@@ -255,106 +1146,259 @@ async def kontak(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(contact_info, parse_mode='Markdown')
     logger.info(f"Pengguna {update.effective_user.id} ({update.effective_user.username}) meminta informasi kontak.")
 
+@observe_handler('checkin_start', 'checkin')
 @registered_user_only # Hanya pengguna terdaftar yang bisa checkin
 async def checkin_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Memulai percakapan check-in dan meminta nama lokasi."""
-    await update.message.reply_text("Yuk check-in yuk!.\nNama tempat/lokasi Anda:")
+    """Memulai percakapan check-in dan meminta nama lokasi (atau lokasi lebih dulu untuk saran outlet)."""
+    if NEARBY_OUTLET_SUGGESTIONS:
+        keyboard = [[KeyboardButton("Bagikan Lokasi Saya", request_location=True)]]
+        await update.message.reply_text(
+            "Yuk check-in yuk!.\nNama tempat/lokasi Anda:\n"
+            "(Atau bagikan lokasi lebih dulu untuk memilih dari outlet terdekat.)",
+            reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+        )
+    else:
+        await update.message.reply_text("Yuk check-in yuk!.\nNama tempat/lokasi Anda:")
     context.user_data['checkin_data'] = {} # Inisialisasi user_data untuk check-in ini
     logger.info(f"Pengguna {update.effective_user.id} ({update.effective_user.username}) memulai checkin.")
     return GET_LOCATION_NAME
 
+def remember_location(context: ContextTypes.DEFAULT_TYPE, message) -> dict:
+    """Menyimpan lokasi dari pesan ke checkin_data; pesan ini menjadi kunci idempotensi check-in."""
+    location = {
+        'latitude': message.location.latitude,
+        'longitude': message.location.longitude,
+        'message_id': message.message_id,
+        'date': message.date,
+    }
+    context.user_data.setdefault('checkin_data', {})['location'] = location
+    return location
+
+@observe_handler('checkin_location_first', 'checkin')
+async def get_location_first(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Menerima lokasi sebelum nama tempat dan menawarkan outlet terdekat sebagai tombol balasan cepat."""
+    location = remember_location(context, update.message)
+    with HANDLER_LATENCY.time(handler='outlet_lookup'):
+        nearby = outlet_index.nearest(location['latitude'], location['longitude'], NEARBY_OUTLET_SUGGESTIONS, NEARBY_OUTLET_RADIUS_M)
+    if not nearby:
+        await update.message.reply_text(
+            "Lokasi diterima. Belum ada outlet tercatat di sekitar lokasi ini.\nNama tempat/lokasi Anda:",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        logger.info(f"Pengguna {update.effective_user.id} membagikan lokasi lebih dulu, tidak ada outlet terdekat.")
+        return GET_LOCATION_NAME
+
+    # Teks tombol -> (nama_lokasi, wilayah); dicocokkan lagi di get_location_name
+    suggestions = {f"{outlet.name} — {outlet.region} ({distance:.0f} m)": (outlet.name, outlet.region) for outlet, distance in nearby}
+    context.user_data['checkin_data']['suggestions'] = suggestions
+    keyboard = [[KeyboardButton(label)] for label in suggestions]
+    await update.message.reply_text(
+        "Lokasi diterima. Pilih outlet terdekat di bawah, atau ketik nama tempat baru:",
+        reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+    )
+    logger.info(f"Pengguna {update.effective_user.id} membagikan lokasi lebih dulu, {len(suggestions)} outlet terdekat ditawarkan.")
+    return GET_LOCATION_NAME
+
+@observe_handler('checkin_location_name', 'checkin')
 async def get_location_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Menerima nama lokasi dan meminta wilayah."""
+    """Menerima nama lokasi (atau outlet terdekat yang dipilih) dan meminta wilayah."""
     location_name = update.message.text
-    context.user_data['checkin_data']['nama_lokasi'] = location_name
+    checkin_data = context.user_data['checkin_data']
+    chosen = checkin_data.get('suggestions', {}).get(location_name)
+    if chosen and 'location' in checkin_data:
+        checkin_data['nama_lokasi'], checkin_data['wilayah'] = chosen
+        logger.info(f"Pengguna {update.effective_user.id} memilih outlet terdekat: {chosen[0]} ({chosen[1]})")
+        return await save_checkin(update, context)
+    checkin_data['nama_lokasi'] = location_name
+    if region_index:
+        # Wilayah diambil dari koordinat; langsung ke langkah lokasi
+        logger.info(f"Pengguna {update.effective_user.id} memberikan nama lokasi: {location_name}")
+        if 'location' in checkin_data:
+            return await save_checkin_with_region(update, context)
+        return await ask_for_location(update, f"Lokasi Anda: **{location_name}**.\n")
     await update.message.reply_text(f"Lokasi Anda: **{location_name}**.\nWilayah/daerah/kota:")
     logger.info(f"Pengguna {update.effective_user.id} memberikan nama lokasi: {location_name}")
     return GET_REGION
 
+@observe_handler('checkin_region', 'checkin')
 async def get_region(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Menerima wilayah dan meminta lokasi."""
+    """Menerima wilayah dan meminta lokasi (atau langsung menyimpan jika lokasi sudah dibagikan)."""
     region = update.message.text
     context.user_data['checkin_data']['wilayah'] = region
+    if 'location' in context.user_data['checkin_data']:
+        logger.info(f"Pengguna {update.effective_user.id} memberikan wilayah: {region}. Lokasi sudah diterima.")
+        return await save_checkin(update, context)
+    logger.info(f"Pengguna {update.effective_user.id} memberikan wilayah: {region}. Meminta lokasi.")
+    return await ask_for_location(update, f"Wilayah Anda: **{region}**.\n")
 
+async def ask_for_location(update: Update, intro: str) -> int:
+    """Meminta pengguna membagikan lokasi (langkah terakhir check-in)."""
     # Membuat keyboard kustom dengan tombol "Bagikan Lokasi"
     keyboard = [[KeyboardButton("Bagikan Lokasi Saya", request_location=True)]]
     reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
 
     await update.message.reply_text(
-        f"Wilayah Anda: **{region}**.\n"
+        intro +
         "Terakhir, bagikan lokasi Google Maps Anda melalui fitur lampiran di Telegram.\n"
         "Anda bisa menekan tombol di bawah atau ikon klip kertas (attachment) lalu pilih 'Lokasi'.",
         reply_markup=reply_markup
     )
-    logger.info(f"Pengguna {update.effective_user.id} memberikan wilayah: {region}. Meminta lokasi.")
     return GET_LOCATION # Mengarahkan ke state GET_LOCATION untuk menerima lokasi
 
+async def save_checkin_with_region(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Mengisi wilayah dari koordinat (indeks batas wilayah) lalu menyimpan; di luar semua wilayah, wilayah ditanyakan."""
+    location = context.user_data['checkin_data']['location']
+    with HANDLER_LATENCY.time(handler='region_lookup'):
+        region = region_index.lookup(location['latitude'], location['longitude'])
+    if region is None:
+        await update.message.reply_text(
+            "Wilayah tidak dapat ditentukan dari lokasi ini.\nWilayah/daerah/kota:",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        logger.info(f"Pengguna {update.effective_user.id}: koordinat di luar batas wilayah yang dimuat, wilayah ditanyakan.")
+        return GET_REGION # get_region langsung menyimpan karena lokasi sudah diterima
+    context.user_data['checkin_data']['wilayah'] = region
+    return await save_checkin(update, context)
+
+@observe_handler('checkin_location', 'checkin')
 async def get_location_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Menerima data lokasi (latitude/longitude) dan menyimpan ke Google Sheet."""
     if update.message.location:
-        location = update.message.location
-        latitude = location.latitude
-        longitude = location.longitude
+        remember_location(context, update.message)
+        if region_index and 'wilayah' not in context.user_data['checkin_data']:
+            return await save_checkin_with_region(update, context)
+        return await save_checkin(update, context)
+    else:
+        await update.message.reply_text(
+            "Itu bukan lokasi yang valid. Mohon **bagikan lokasi Anda** dengan menekan ikon klip kertas (lampiran) lalu pilih 'Lokasi'."
+        )
+        logger.warning(f"Pengguna {update.effective_user.id} mengirim pesan non-lokasi selama langkah lokasi.")
+        return GET_LOCATION # Tetap di status yang sama sampai lokasi diterima
 
-        # Menggunakan format link Google Maps yang lebih umum dan disarankan
-        Maps_link = f"http://maps.google.com/maps?q={latitude},{longitude}" # Perbaikan format link Google Maps
+async def save_checkin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Mencatat check-in dari checkin_data (nama, wilayah, lokasi) ke jurnal dan Google Sheet lalu mengakhiri percakapan."""
+    location = context.user_data['checkin_data']['location']
+    latitude = location['latitude']
+    longitude = location['longitude']
 
-        context.user_data['checkin_data']['link_google_map'] = Maps_link
+    # Menggunakan format link Google Maps yang lebih umum dan disarankan
+    Maps_link = f"http://maps.google.com/maps?q={latitude},{longitude}" # Perbaikan format link Google Maps
 
-        user_id = update.effective_user.id
-        first_name = update.effective_user.first_name if update.effective_user.first_name else ''
-        username = update.effective_user.username if update.effective_user.username else ''
-        # timestamp ini mengambil waktu pesan dikirim dari Telegram
-        timestamp_telegram_message = update.message.date.strftime("%Y-%m-%d %H:%M:%S")
-        nama_lokasi = context.user_data['checkin_data'].get('nama_lokasi', 'N/A')
-        wilayah = context.user_data['checkin_data'].get('wilayah', 'N/A')
+    context.user_data['checkin_data']['link_google_map'] = Maps_link
 
-        # Get the current date and time for the confirmation message in GMT+7 (Asia/Jakarta)
-        jakarta_timezone = pytz.timezone('Asia/Jakarta') # Mendefinisikan zona waktu Jakarta
-        current_datetime_for_message = datetime.now(jakarta_timezone).strftime("%Y-%m-%d %H:%M:%S") # Menggunakan zona waktu Jakarta
+    user_id = update.effective_user.id
+    first_name = update.effective_user.first_name if update.effective_user.first_name else ''
+    username = update.effective_user.username if update.effective_user.username else ''
+    # timestamp ini mengambil waktu pesan lokasi dikirim dari Telegram
+    timestamp_telegram_message = location['date'].strftime("%Y-%m-%d %H:%M:%S")
+    nama_lokasi = context.user_data['checkin_data'].get('nama_lokasi', 'N/A')
+    wilayah = context.user_data['checkin_data'].get('wilayah', 'N/A')
+
+    # Get the current date and time for the confirmation message in GMT+7 (Asia/Jakarta)
+    jakarta_timezone = pytz.timezone('Asia/Jakarta') # Mendefinisikan zona waktu Jakarta
+    current_datetime_for_message = datetime.now(jakarta_timezone).strftime("%Y-%m-%d %H:%M:%S") # Menggunakan zona waktu Jakarta
+
+    # Kunci idempotensi: satu pesan lokasi Telegram = satu baris check-in
+    checkin_id = f"{update.effective_chat.id}:{location['message_id']}"
+
+    previous = duplicate_guard.find(user_id, latitude, longitude, nama_lokasi) if duplicate_guard else None
+    if previous and previous.checkin_id != checkin_id: # Kunci sama = update dikirim ulang, ditangani jurnal
+        return await reply_duplicate_checkin(update, context, previous)
+    # Data yang akan dimasukkan, cocok dengan kolom sheet:
+    # A User id, B nama, C username, D timestamp (pesan telegram), E nama lokasi, F wilayah, G link google map, H checkin_id
+    row_data = [
+        str(user_id),
+        first_name,
+        username,
+        timestamp_telegram_message, # Menggunakan timestamp dari pesan Telegram
+        nama_lokasi,
+        wilayah,
+        Maps_link,
+        checkin_id
+    ]
 
-        try:
-            client = get_google_sheet_client()
-            spreadsheet = client.open_by_url(SHEET_URL)
-            worksheet = spreadsheet.worksheet("Check-in Data") # Pastikan nama sheet yang benar "Check-in Data"
-
-            # Data yang akan dimasukkan, cocok dengan kolom sheet:
-            # A User id, B nama, C username, D timestamp (pesan telegram), E nama lokasi, F wilayah, G link google map
-            row_data = [
-                str(user_id),
-                first_name,
-                username,
-                timestamp_telegram_message, # Menggunakan timestamp dari pesan Telegram
-                nama_lokasi,
-                wilayah,
-                Maps_link
-            ]
-            worksheet.append_row(row_data) # Menambahkan ke baris kosong pertama
-
-            response_message = (
-                "Check-in berhasil dicatat!\n\n"
-                f"**Tanggal & Waktu Input:** {current_datetime_for_message} (GMT+7)\n" # Menampilkan timestamp respons bot dengan indikator GMT+7
-                f"**Nama Tempat:** {nama_lokasi}\n"
-                f"**Wilayah:** {wilayah}\n"
-                f"**Link Google Maps:** {Maps_link}"
-            )
-            await update.message.reply_text(response_message, parse_mode='Markdown')
-            logger.info(f"Check-in oleh {user_id} ({username}): Lokasi={nama_lokasi}, Wilayah={wilayah}, Peta={Maps_link}")
+    try:
+        sheet = checkin_partitions.sheet_for(timestamp_telegram_message) # Sama dengan tujuan antrean tulis
+        entry_id, inserted = await journal_pool.run(checkin_journal.append, checkin_id, sheet, row_data)
+    except Exception as e:
+        await update.message.reply_text(f"Terjadi kesalahan saat mencatat check-in: {e}. Mohon coba lagi nanti.")
+        logger.error(f"Kesalahan jurnal selama check-in untuk {user_id} ({username}): {e}")
+        context.user_data.clear()
+        return ConversationHandler.END
+
+    if inserted and duplicate_guard:
+        duplicate_guard.record(user_id, latitude, longitude, nama_lokasi, wilayah, checkin_id)
+    if inserted:
+        # Langsung tersedia sebagai saran outlet; baris yang sama dilewati saat nanti terbaca dari sheet
+        indexed_checkin_ids.add(checkin_id)
+        outlet_index.add(nama_lokasi, wilayah, latitude, longitude)
 
+    written = True
+    if not inserted:
+        # Update dikirim ulang: konfirmasi mengikuti status entri yang sudah ada (bisa masih menunggu replay)
+        try:
+            written = entry_id in await journal_pool.run(checkin_journal.sent_ids, [entry_id])
+        except Exception as e:
+            written = False
+            logger.warning(f"Gagal membaca status jurnal check-in {checkin_id}: {e}")
+    else:
+        journal_in_flight.add(entry_id)
+        write_task = asyncio.ensure_future(write_journaled_checkin(entry_id, row_data))
+        write_task.add_done_callback(lambda t: t.cancelled() or t.exception()) # Kegagalan sudah dicatat di jurnal
+        try:
+            # Tunggu konfirmasi tulis sebentar; jika Sheets lambat/down, replayer yang melanjutkan
+            await asyncio.wait_for(asyncio.shield(write_task), timeout=CHECKIN_CONFIRM_TIMEOUT)
         except Exception as e:
-            await update.message.reply_text(f"Terjadi kesalahan saat mencatat check-in ke Google Sheet: {e}. Mohon coba lagi nanti.")
-            logger.error(f"Kesalahan selama check-in untuk {user_id} ({username}): {e}")
+            written = False
+            logger.warning(f"Check-in {checkin_id} oleh {user_id} belum tertulis ke sheet, menunggu replay: {e!r}")
+
+    if written:
+        response_message = (
+            "Check-in berhasil dicatat!\n\n"
+            f"**Tanggal & Waktu Input:** {current_datetime_for_message} (GMT+7)\n" # Menampilkan timestamp respons bot dengan indikator GMT+7
+            f"**Nama Tempat:** {nama_lokasi}\n"
+            f"**Wilayah:** {wilayah}\n"
+            f"**Link Google Maps:** {Maps_link}"
+        )
+    else:
+        response_message = (
+            "Check-in Anda sudah tersimpan dan akan dikirim ke Google Sheet secara otomatis.\n\n"
+            f"**Tanggal & Waktu Input:** {current_datetime_for_message} (GMT+7)\n"
+            f"**Nama Tempat:** {nama_lokasi}\n"
+            f"**Wilayah:** {wilayah}\n"
+            f"**Link Google Maps:** {Maps_link}"
+        )
+    await update.message.reply_text(response_message, parse_mode='Markdown')
+    logger.info(f"Check-in oleh {user_id} ({username}): Lokasi={nama_lokasi}, Wilayah={wilayah}, Peta={Maps_link}, Tertulis={written}")
 
-        # Bersihkan user_data dan akhiri percakapan
-        context.user_data.clear()
-        return ConversationHandler.END
+    # Bersihkan user_data dan akhiri percakapan
+    context.user_data.clear()
+    return ConversationHandler.END
+
+async def reply_duplicate_checkin(update: Update, context: ContextTypes.DEFAULT_TYPE, previous) -> int:
+    """Membalas check-in ulang ke outlet yang sama tanpa menulis apa pun ke jurnal/penyimpanan."""
+    jakarta_timezone = pytz.timezone('Asia/Jakarta')
+    previous_time = datetime.fromtimestamp(previous.at, jakarta_timezone).strftime("%H:%M")
+    nama_lokasi = context.user_data['checkin_data'].get('nama_lokasi', 'N/A')
+    if DUPLICATE_CHECKIN_ACTION == ACTION_REJECT:
+        wait_minutes = max(1, round((previous.at + DUPLICATE_WINDOW_SECONDS - time.time()) / 60))
+        message = (
+            f"Check-in ditolak: Anda sudah check-in di **{nama_lokasi}** pukul {previous_time} (GMT+7).\n"
+            f"Check-in ulang di lokasi yang sama bisa dilakukan sekitar {wait_minutes} menit lagi."
+        )
     else:
-        await update.message.reply_text(
-            "Itu bukan lokasi yang valid. Mohon **bagikan lokasi Anda** dengan menekan ikon klip kertas (lampiran) lalu pilih 'Lokasi'."
+        message = (
+            f"Anda sudah check-in di **{nama_lokasi}** pukul {previous_time} (GMT+7).\n"
+            "Check-in ini digabung dengan check-in tersebut dan tidak dicatat dua kali."
         )
-        logger.warning(f"Pengguna {update.effective_user.id} mengirim pesan non-lokasi selama langkah lokasi.")
-        return GET_LOCATION # Tetap di status yang sama sampai lokasi diterima
+    DUPLICATES_SUPPRESSED.inc(action=DUPLICATE_CHECKIN_ACTION)
+    duplicate_guard.mark_suppressed()
+    await update.message.reply_text(message, parse_mode='Markdown', reply_markup=ReplyKeyboardRemove())
+    logger.info(f"Check-in duplikat oleh {update.effective_user.id} di {nama_lokasi} ({DUPLICATE_CHECKIN_ACTION}); check-in sebelumnya {previous.checkin_id}.")
+    context.user_data.clear()
+    return ConversationHandler.END
 
+@observe_handler('cancel', '*')
 async def cancel_checkin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Membatalkan percakapan check-in."""
     if 'checkin_data' in context.user_data:
@@ -367,255 +1411,356 @@ async def cancel_checkin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return ConversationHandler.END
 
 # --- Owner-only dan Admin-only User Management Commands ---
-async def manage_user_in_sheet(user_id: int, role: str, add_or_remove: str, initiator_id: int, initiator_name: str, bot_obj: Bot = None):
+def get_users_lock() -> asyncio.Lock:
+    global users_lock
+    if users_lock is None:
+        users_lock = asyncio.Lock()
+    return users_lock
+
+async def fetch_chat_users(bot_obj: Bot, user_ids: list) -> dict:
+    """Info akun (telegram.User) untuk setiap ID lewat get_chat_member paralel; None jika tidak bisa diambil."""
+    semaphore = asyncio.Semaphore(USER_BATCH_CONCURRENCY)
+
+    async def fetch(user_id: int):
+        async with semaphore:
+            try:
+                member = await bot_obj.get_chat_member(user_id, user_id)
+                return member.user if member else None
+            except Exception:
+                logger.warning(f"Tidak dapat mengambil info chat_member untuk ID {user_id} saat menambahkan.")
+                return None
+
+    if not bot_obj:
+        return {user_id: None for user_id in user_ids}
+    users = await asyncio.gather(*(fetch(user_id) for user_id in user_ids))
+    return dict(zip(user_ids, users))
+
+async def notify_users(bot_obj: Bot, notifications: list):
+    """Mengirim notifikasi (user_id, teks) secara paralel; kegagalan hanya dicatat di log."""
+    semaphore = asyncio.Semaphore(USER_BATCH_CONCURRENCY)
+
+    async def send(user_id: int, text: str):
+        async with semaphore:
+            try:
+                await bot_obj.send_message(user_id, text, rate_limit_args=PRIORITY_NOTIFICATION)
+            except Exception as e:
+                logger.warning(f"Gagal mengirim notifikasi ke user {user_id}: {e}")
+
+    await asyncio.gather(*(send(user_id, text) for user_id, text in notifications))
+
+@timed(HANDLER_LATENCY, handler='manage_user_in_sheet')
+async def manage_users_in_sheet(target_ids: list, role: str, add_or_remove: str, initiator_id: int, initiator_name: str, bot_obj: Bot = None) -> list:
     """
-    Fungsi bantu untuk menambah/menghapus/memperbarui peran pengguna di Google Sheet.
+    Fungsi bantu untuk menambah/menghapus/memperbarui peran banyak pengguna sekaligus di Google Sheet.
+    Perubahan peran dan penghapusan (tombstone) ditulis dengan satu batch_update, pengguna baru dengan satu append_rows, dan
+    notifikasi dikirim paralel setelah semua penulisan selesai.
     Args:
-        user_id (int): ID pengguna yang akan dikelola.
+        target_ids (list): ID pengguna yang akan dikelola.
         role (str): Peran yang akan diberikan ('admin' atau 'user').
         add_or_remove (str): 'add', 'remove_admin', 'remove_user'.
         initiator_id (int): ID pengguna yang memulai aksi.
         initiator_name (str): Nama pengguna yang memulai aksi.
-        bot_obj (Bot): Objek bot, opsional untuk mengirim notifikasi ke user_id yang diubah.
+        bot_obj (Bot): Objek bot, opsional untuk info akun dan notifikasi ke pengguna yang diubah.
     Returns:
-        tuple: (bool success, str message)
+        list: (user_id, bool success, str message) untuk setiap ID, urut sesuai target_ids
     """
-    try:
-        client = get_google_sheet_client()
-        sheet = client.open_by_url(SHEET_URL).worksheet("Users")
-
-        # Dapatkan semua data untuk mencari ID pengguna
-        data = sheet.get_all_values()
-        header = data[0] if data else []
-        rows = data[1:]
-
-        # Pastikan kolom yang diperlukan ada di header
-        required_headers = ['user_id', 'role', 'first_name', 'username', 'added_by_id', 'added_by_name', 'added_date']
-        for h in required_headers:
-            if h not in header:
-                logger.warning(f"Header '{h}' tidak ditemukan di sheet 'Users'. Pastikan header sudah lengkap.")
-                return False, f"Kesalahan: Kolom '{h}' tidak ditemukan di sheet 'Users'. Harap lengkapi header sheet."
-
-        user_id_col_idx = header.index('user_id')
-        role_col_idx = header.index('role')
-        first_name_col_idx = header.index('first_name')
-        username_col_col_idx = header.index('username')
-        added_by_id_col_idx = header.index('added_by_id')
-        added_by_name_col_idx = header.index('added_by_name')
-        added_date_col_idx = header.index('added_date')
-
-        # Cari baris dengan user_id yang cocok
-        target_row_idx = -1
-        for i, row in enumerate(rows):
-            try:
-                # Pastikan baris cukup panjang dan user_id_col_idx valid
-                if len(row) > user_id_col_idx and int(row[user_id_col_idx]) == user_id:
-                    target_row_idx = i + 2 # +2 karena header dan 0-indexed list
-                    break
-            except (ValueError, IndexError):
-                continue # Skip invalid rows or rows that are too short
-
+    async with get_users_lock():
+        try:
+            results, notifications = await _manage_users_locked(target_ids, role, add_or_remove, initiator_id, initiator_name, bot_obj)
+        except Exception as e:
+            logger.error(f"Kesalahan saat mengelola {len(target_ids)} pengguna ({add_or_remove} {role}): {e}")
+            return [(user_id, False, f"Terjadi kesalahan: {escape_markdown(str(e))}") for user_id in target_ids]
+    if bot_obj and notifications:
+        await notify_users(bot_obj, notifications)
+    return [(user_id, *results[user_id]) for user_id in target_ids]
+
+async def _manage_users_locked(target_ids: list, role: str, add_or_remove: str, initiator_id: int, initiator_name: str, bot_obj: Bot = None):
+    """Isi manage_users_in_sheet; dipanggil saat users_lock sudah dipegang. Mengembalikan (hasil per ID, notifikasi)."""
+    if role_refresh_status['source'] != 'sheets':
+        # Tabel masih dari snapshot (nomor baris bisa usang): muat dari sheet dulu sebelum menulis
+        await sheets_pool.run_idempotent(load_user_roles)
+    # Pastikan kolom yang diperlukan ada di header
+    for h in user_table.missing_headers(REQUIRED_HEADERS):
+        logger.warning(f"Header '{h}' tidak ditemukan di sheet 'Users'. Pastikan header sudah lengkap.")
+        message = f"Kesalahan: Kolom '{h}' tidak ditemukan di sheet 'Users'. Harap lengkapi header sheet."
+        return {user_id: (False, message) for user_id in target_ids}, []
+
+    results = {}
+    updates = [] # (user_id, nomor_baris, {header: nilai baru}, pesan_hasil, notifikasi)
+    appends = [] # user_id yang belum ada di sheet
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Rencanakan perubahan lewat indeks lokal (tanpa membaca sheet); baris tombstone dianggap tidak ada
+    for user_id in target_ids:
+        record = user_table.get(user_id)
+        removed = record is not None and record.role == REMOVED_ROLE
         if add_or_remove == 'add':
-            if target_row_idx != -1:
-                # User sudah ada, perbarui perannya
-                current_role = sheet.cell(target_row_idx, role_col_idx + 1).value
-                if current_role and current_role.lower() == role:
-                    return False, f"Pengguna ID `{user_id}` sudah terdaftar sebagai **{role}**."
-                sheet.update_cell(target_row_idx, role_col_idx + 1, role)
-                logger.info(f"Memperbarui peran pengguna {user_id} menjadi {role}.")
-                if bot_obj:
-                    try:
-                        await bot_obj.send_message(user_id, f"Peran Anda di bot telah diperbarui menjadi **{role.upper()}** oleh admin.")
-                    except Exception as e:
-                        logger.warning(f"Gagal mengirim notifikasi ke user {user_id}: {e}")
-                return True, f"Berhasil memperbarui peran pengguna ID `{user_id}` menjadi **{role}**."
+            if not record:
+                appends.append(user_id)
+            elif removed:
+                # Baris tombstone yang belum dipadatkan dipakai lagi
+                cells = {'role': role, REMOVED_AT_HEADER: ''} if REMOVED_AT_HEADER in user_table.columns else {'role': role}
+                updates.append((user_id, record.row_number, cells,
+                                f"Berhasil menambahkan pengguna ID `{user_id}` sebagai **{role}**.",
+                                f"Anda telah ditambahkan ke bot dengan peran **{role.upper()}** oleh admin."))
+            elif record.role == role:
+                results[user_id] = (False, f"Pengguna ID `{user_id}` sudah terdaftar sebagai **{role}**.")
             else:
-                # User belum ada, tambahkan baris baru
-                # Pastikan ukuran baris cukup besar untuk semua kolom yang diperlukan
-                new_row = [''] * (max(user_id_col_idx, role_col_idx, first_name_col_idx, username_col_col_idx, added_by_id_col_idx, added_by_name_col_idx, added_date_col_idx) + 1)
-                new_row[user_id_col_idx] = str(user_id)
-                new_row[role_col_idx] = role
-                # Ambil info user jika memungkinkan
-                user_info = None
-                try:
-                    member = await bot_obj.get_chat_member(user_id, user_id) if bot_obj else None
-                    if member and member.user:
-                        user_info = member.user
-                except Exception:
-                    logger.warning(f"Tidak dapat mengambil info chat_member untuk ID {user_id} saat menambahkan.")
-
-                new_row[first_name_col_idx] = user_info.first_name if user_info and user_info.first_name else 'N/A'
-                new_row[username_col_col_idx] = user_info.username if user_info and user_info.username else 'N/A'
-                new_row[added_by_id_col_idx] = str(initiator_id)
-                new_row[added_by_name_col_idx] = initiator_name
-                new_row[added_date_col_idx] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                sheet.append_row(new_row)
-                logger.info(f"Menambahkan pengguna {user_id} dengan peran {role}.")
-                if bot_obj:
-                    try:
-                        await bot_obj.send_message(user_id, f"Anda telah ditambahkan ke bot dengan peran **{role.upper()}** oleh admin.")
-                    except Exception as e:
-                        logger.warning(f"Gagal mengirim notifikasi ke user {user_id}: {e}")
-                return True, f"Berhasil menambahkan pengguna ID `{user_id}` sebagai **{role}**."
-
+                # User sudah ada, perbarui perannya
+                updates.append((user_id, record.row_number, {'role': role},
+                                f"Berhasil memperbarui peran pengguna ID `{user_id}` menjadi **{role}**.",
+                                f"Peran Anda di bot telah diperbarui menjadi **{role.upper()}** oleh admin."))
         elif add_or_remove == 'remove_admin':
-            if target_row_idx != -1:
-                current_role = sheet.cell(target_row_idx, role_col_idx + 1).value
-                if not current_role or current_role.lower() != 'admin':
-                    return False, f"Pengguna ID `{user_id}` bukan seorang admin."
-                if user_id == OWNER_ID:
-                    return False, "Anda tidak dapat menghapus pemilik bot dari peran admin."
-
-                # Perbarui peran menjadi 'user' biasa
-                sheet.update_cell(target_row_idx, role_col_idx + 1, 'user')
-                logger.info(f"Menghapus pengguna {user_id} dari peran admin.")
-                if bot_obj:
-                    try:
-                        await bot_obj.send_message(user_id, "Peran admin Anda di bot telah dihapus.")
-                    except Exception as e:
-                        logger.warning(f"Gagal mengirim notifikasi ke user {user_id}: {e}")
-                return True, f"Berhasil menghapus pengguna ID `{user_id}` dari peran admin."
+            if not record or removed:
+                results[user_id] = (False, f"Pengguna ID `{user_id}` tidak ditemukan dalam daftar pengguna.")
+            elif record.role != 'admin':
+                results[user_id] = (False, f"Pengguna ID `{user_id}` bukan seorang admin.")
+            elif user_id == OWNER_ID:
+                results[user_id] = (False, "Anda tidak dapat menghapus pemilik bot dari peran admin.")
             else:
-                return False, f"Pengguna ID `{user_id}` tidak ditemukan dalam daftar pengguna."
-
+                # Perbarui peran menjadi 'user' biasa
+                updates.append((user_id, record.row_number, {'role': 'user'},
+                                f"Berhasil menghapus pengguna ID `{user_id}` dari peran admin.",
+                                "Peran admin Anda di bot telah dihapus."))
         elif add_or_remove == 'remove_user':
-            if target_row_idx != -1:
-                if user_id == OWNER_ID:
-                    return False, "Anda tidak dapat menghapus pemilik bot."
-                sheet.delete_rows(target_row_idx)
-                logger.info(f"Menghapus pengguna {user_id} sepenuhnya dari sheet.")
-                if bot_obj:
-                    try:
-                        await bot_obj.send_message(user_id, "Anda telah dihapus sepenuhnya dari bot.")
-                    except Exception as e:
-                        logger.warning(f"Gagal mengirim notifikasi ke user {user_id}: {e}")
-                return True, f"Berhasil menghapus pengguna ID `{user_id}` sepenuhnya dari daftar."
+            if not record or removed:
+                results[user_id] = (False, f"Pengguna ID `{user_id}` tidak ditemukan dalam daftar pengguna.")
+            elif user_id == OWNER_ID:
+                results[user_id] = (False, "Anda tidak dapat menghapus pemilik bot.")
             else:
-                return False, f"Pengguna ID `{user_id}` tidak ditemukan dalam daftar pengguna."
+                # Tombstone, bukan delete_rows: nomor baris lain tidak bergeser, baris dibuang saat compaction
+                updates.append((user_id, record.row_number, {'role': REMOVED_ROLE, REMOVED_AT_HEADER: now},
+                                f"Berhasil menghapus pengguna ID `{user_id}` sepenuhnya dari daftar.",
+                                "Anda telah dihapus sepenuhnya dari bot."))
 
+    notifications = []
+    if updates:
+        try:
+            data = []
+            new_column = REMOVED_AT_HEADER not in user_table.columns and any(REMOVED_AT_HEADER in cells for _, _, cells, _, _ in updates)
+            if new_column:
+                # Lembar lama tanpa kolom removed_at: grid diperlebar bila perlu, header ditulis di batch yang sama
+                await sheets_pool.run_idempotent(ensure_users_columns, len(user_table.header) + 1)
+                data.append({'range': rowcol_to_a1(1, len(user_table.header) + 1), 'values': [[REMOVED_AT_HEADER]]})
+            columns = dict(user_table.columns, **({REMOVED_AT_HEADER: len(user_table.header) + 1} if new_column else {}))
+            for _, row_number, cells, _, _ in updates:
+                data += [{'range': rowcol_to_a1(row_number, columns[name]), 'values': [[value]]} for name, value in cells.items()]
+            await run_on_worksheet("Users", "batch_update", data, idempotent=True)
+            if new_column:
+                user_table.add_column(REMOVED_AT_HEADER)
+            for user_id, _, cells, message, notification in updates:
+                user_table.record_cells(user_id, cells)
+                results[user_id] = (True, message)
+                notifications.append((user_id, notification))
+            logger.info(f"Memperbarui {len(updates)} pengguna ({add_or_remove} {role}) dalam satu batch_update.")
+        except Exception as e:
+            logger.error(f"Gagal memperbarui {len(updates)} pengguna: {e}")
+            results.update((user_id, (False, f"Terjadi kesalahan: {escape_markdown(str(e))}")) for user_id, *_ in updates)
+
+    if appends:
+        # User belum ada, tambahkan baris baru; info akun diambil paralel jika memungkinkan
+        user_infos = await fetch_chat_users(bot_obj, appends)
+        added_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        new_rows = []
+        for user_id in appends:
+            user_info = user_infos[user_id]
+            new_rows.append(user_table.build_row({
+                'user_id': str(user_id),
+                'role': role,
+                'first_name': user_info.first_name if user_info and user_info.first_name else 'N/A',
+                'username': user_info.username if user_info and user_info.username else 'N/A',
+                'added_by_id': str(initiator_id),
+                'added_by_name': initiator_name,
+                'added_date': added_date,
+            }))
+        try:
+            response = await run_on_worksheet("Users", "append_rows", new_rows)
+            if not user_table.record_appends(new_rows, response):
+                await sheets_pool.run_idempotent(load_user_roles) # Nomor baris tidak diketahui, muat ulang tabel
+            for user_id in appends:
+                results[user_id] = (True, f"Berhasil menambahkan pengguna ID `{user_id}` sebagai **{role}**.")
+                notifications.append((user_id, f"Anda telah ditambahkan ke bot dengan peran **{role.upper()}** oleh admin."))
+            logger.info(f"Menambahkan {len(appends)} pengguna dengan peran {role} dalam satu append_rows.")
+        except Exception as e:
+            logger.error(f"Gagal menambahkan {len(appends)} pengguna: {e}")
+            results.update((user_id, (False, f"Terjadi kesalahan: {escape_markdown(str(e))}")) for user_id in appends)
+
+    return results, notifications
+
+async def read_user_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ID target dari argumen perintah, teks pesan atau dokumen CSV yang diunggah: (daftar ID, token tidak valid)."""
+    document = update.message.document
+    if document:
+        if document.file_size and document.file_size > USER_CSV_MAX_BYTES:
+            raise ValueError(f"File terlalu besar (maks {USER_CSV_MAX_BYTES // 1024} KB).")
+        telegram_file = await document.get_file()
+        return parse_user_ids_csv(bytes(await telegram_file.download_as_bytearray()))
+    return parse_user_ids(' '.join(context.args) if context.args else update.message.text)
+
+def format_user_batch_summary(command: str, results: list, invalid: list) -> list:
+    """Ringkasan hasil per ID, dipecah menjadi beberapa pesan agar tidak melewati batas panjang pesan Telegram."""
+    succeeded = sum(1 for _, success, _ in results if success)
+    lines = [f"Hasil /{command}: {succeeded} berhasil, {len(results) - succeeded} gagal" + (f", {len(invalid)} tidak valid" if invalid else "") + "."]
+    lines += [f"{'✅' if success else '⚠️'} {message if str(user_id) in message else f'`{user_id}`: {message}'}" for user_id, success, message in results]
+    lines += [f"❌ `{escape_markdown(token.replace('`', ''))}` bukan ID Telegram yang valid." for token in invalid]
+    messages = [""]
+    for line in lines:
+        if len(messages[-1]) + len(line) + 1 > 3500:
+            messages.append("")
+        messages[-1] += line + "\n"
+    return messages
+
+async def process_user_batch(update: Update, context: ContextTypes.DEFAULT_TYPE, command: str, role: str, add_or_remove: str, retry_state: int) -> int:
+    """Menjalankan /adduser, /removeuser, /addadmin atau /removeadmin untuk satu atau banyak ID."""
+    try:
+        target_ids, invalid = await read_user_ids(update, context)
     except Exception as e:
-        logger.error(f"Kesalahan saat mengelola pengguna ID {user_id} ({add_or_remove} {role}): {e}")
-        return False, f"Terjadi kesalahan: {e}"
+        await update.message.reply_text(f"Gagal membaca daftar ID: {e}")
+        return retry_state
+    if not target_ids:
+        await update.message.reply_text("ID tidak valid. Harap masukkan ID Telegram yang berupa angka (boleh beberapa, dipisah spasi/koma/baris baru) atau unggah file CSV.")
+        return retry_state # Tetap di state ini
+    if len(target_ids) > USER_BATCH_MAX_IDS:
+        await update.message.reply_text(f"Terlalu banyak ID ({len(target_ids)}); maksimal {USER_BATCH_MAX_IDS} per perintah.")
+        return retry_state
+
+    initiator_id = update.effective_user.id
+    initiator_name = update.effective_user.first_name if update.effective_user.first_name else update.effective_user.username
 
+    results = await manage_users_in_sheet(target_ids, role, add_or_remove, initiator_id, initiator_name, context.bot)
+    if any(success for _, success, _ in results):
+        # Set peran dihitung ulang dari tabel lokal (tanpa membaca ulang sheet); di thread pool karena
+        # snapshot peran ikut ditulis (json + fsync) dan tidak boleh menahan event loop
+        await sheets_pool.pool.run(apply_user_roles)
+    if len(results) == 1 and not invalid:
+        await update.message.reply_text(results[0][2], parse_mode='Markdown')
+    else:
+        for message in format_user_batch_summary(command, results, invalid):
+            await update.message.reply_text(message, parse_mode='Markdown')
+        logger.info(f"{initiator_id} menjalankan /{command} untuk {len(target_ids)} ID ({sum(1 for _, s, _ in results if s)} berhasil, {len(invalid)} tidak valid).")
+    return ConversationHandler.END
+
+# Semua perintah kelola pengguna menerima ID langsung sebagai argumen (/adduser 111 222), daftar ID
+# dalam satu pesan, atau file CSV; tanpa argumen bot menanyakan ID-nya.
+USER_BATCH_PROMPT_HINT = "\n(Bisa beberapa ID sekaligus, dipisah spasi/koma/baris baru, atau unggah file CSV berkolom user_id.)"
+
+@observe_handler('addadmin_command', 'addadmin')
 @owner_only
 async def addadmin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Owner: Memulai proses penambahan admin."""
-    await update.message.reply_text("Silakan kirim ID Telegram pengguna yang ingin Anda jadikan admin:")
+    if context.args:
+        return await process_user_batch(update, context, 'addadmin', 'admin', 'add', ConversationHandler.END)
+    await update.message.reply_text("Silakan kirim ID Telegram pengguna yang ingin Anda jadikan admin:" + USER_BATCH_PROMPT_HINT)
     return ADD_ADMIN_ID
 
+@observe_handler('addadmin_process', 'addadmin')
 async def addadmin_process(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Owner: Memproses ID untuk menambah admin."""
-    try:
-        target_user_id = int(update.message.text.strip())
-    except ValueError:
-        await update.message.reply_text("ID tidak valid. Harap masukkan ID Telegram yang berupa angka.")
-        return ADD_ADMIN_ID # Tetap di state ini
-
-    initiator_id = update.effective_user.id
-    initiator_name = update.effective_user.first_name if update.effective_user.first_name else update.effective_user.username
-
-    success, message = await manage_user_in_sheet(target_user_id, 'admin', 'add', initiator_id, initiator_name, context.bot)
-    await update.message.reply_text(message, parse_mode='Markdown')
-    if success:
-        load_user_roles() # Muat ulang peran setelah perubahan
-    return ConversationHandler.END
+    return await process_user_batch(update, context, 'addadmin', 'admin', 'add', ADD_ADMIN_ID)
 
+@observe_handler('removeadmin_command', 'removeadmin')
 @owner_only
 async def removeadmin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Owner: Memulai proses penghapusan admin."""
-    await update.message.reply_text("Silakan kirim ID Telegram admin yang ingin Anda hapus dari peran admin:")
+    if context.args:
+        return await process_user_batch(update, context, 'removeadmin', 'admin', 'remove_admin', ConversationHandler.END)
+    await update.message.reply_text("Silakan kirim ID Telegram admin yang ingin Anda hapus dari peran admin:" + USER_BATCH_PROMPT_HINT)
     return REMOVE_ADMIN_ID
 
+@observe_handler('removeadmin_process', 'removeadmin')
 async def removeadmin_process(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Owner: Memproses ID untuk menghapus admin."""
-    try:
-        target_user_id = int(update.message.text.strip())
-    except ValueError:
-        await update.message.reply_text("ID tidak valid. Harap masukkan ID Telegram yang berupa angka.")
-        return REMOVE_ADMIN_ID # Tetap di state ini
-
-    initiator_id = update.effective_user.id
-    initiator_name = update.effective_user.first_name if update.effective_user.first_name else update.effective_user.username
-
-    success, message = await manage_user_in_sheet(target_user_id, 'admin', 'remove_admin', initiator_id, initiator_name, context.bot)
-    await update.message.reply_text(message, parse_mode='Markdown')
-    if success:
-        load_user_roles() # Muat ulang peran setelah perubahan
-    return ConversationHandler.END
+    return await process_user_batch(update, context, 'removeadmin', 'admin', 'remove_admin', REMOVE_ADMIN_ID)
 
+@observe_handler('adduser_command', 'adduser')
 @admin_only # Perubahan: Admin bisa add user
 async def adduser_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Admin/Owner: Memulai proses penambahan user."""
-    await update.message.reply_text("Silakan kirim ID Telegram pengguna yang ingin Anda tambahkan sebagai user biasa:")
+    if context.args:
+        return await process_user_batch(update, context, 'adduser', 'user', 'add', ConversationHandler.END)
+    await update.message.reply_text("Silakan kirim ID Telegram pengguna yang ingin Anda tambahkan sebagai user biasa:" + USER_BATCH_PROMPT_HINT)
     return ADD_USER_ID
 
+@observe_handler('adduser_process', 'adduser')
 async def adduser_process(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Admin/Owner: Memproses ID untuk menambah user."""
-    try:
-        target_user_id = int(update.message.text.strip())
-    except ValueError:
-        await update.message.reply_text("ID tidak valid. Harap masukkan ID Telegram yang berupa angka.")
-        return ADD_USER_ID # Tetap di state ini
-
-    initiator_id = update.effective_user.id
-    initiator_name = update.effective_user.first_name if update.effective_user.first_name else update.effective_user.username
-
-    success, message = await manage_user_in_sheet(target_user_id, 'user', 'add', initiator_id, initiator_name, context.bot)
-    await update.message.reply_text(message, parse_mode='Markdown')
-    if success:
-        load_user_roles() # Muat ulang peran setelah perubahan
-    return ConversationHandler.END
+    return await process_user_batch(update, context, 'adduser', 'user', 'add', ADD_USER_ID)
 
+@observe_handler('removeuser_command', 'removeuser')
 @admin_only # Perubahan: Admin bisa remove user
 async def removeuser_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Admin/Owner: Memulai proses penghapusan user."""
-    await update.message.reply_text("Silakan kirim ID Telegram pengguna yang ingin Anda hapus sepenuhnya dari daftar:")
+    if context.args:
+        return await process_user_batch(update, context, 'removeuser', '', 'remove_user', ConversationHandler.END)
+    await update.message.reply_text("Silakan kirim ID Telegram pengguna yang ingin Anda hapus sepenuhnya dari daftar:" + USER_BATCH_PROMPT_HINT)
     return REMOVE_USER_ID
 
+@observe_handler('removeuser_process', 'removeuser')
 async def removeuser_process(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Admin/Owner: Memproses ID untuk menghapus user."""
-    try:
-        target_user_id = int(update.message.text.strip())
-    except ValueError:
-        await update.message.reply_text("ID tidak valid. Harap masukkan ID Telegram yang berupa angka.")
-        return REMOVE_USER_ID # Tetap di state ini
-
-    if target_user_id == OWNER_ID:
-        await update.message.reply_text("Anda tidak dapat menghapus pemilik bot.")
-        return ConversationHandler.END
-
-    initiator_id = update.effective_user.id
-    initiator_name = update.effective_user.first_name if update.effective_user.first_name else update.effective_user.username
-
-    success, message = await manage_user_in_sheet(target_user_id, '', 'remove_user', initiator_id, initiator_name, context.bot)
-    await update.message.reply_text(message, parse_mode='Markdown')
-    if success:
-        load_user_roles() # Muat ulang peran setelah perubahan
-    return ConversationHandler.END
+    return await process_user_batch(update, context, 'removeuser', '', 'remove_user', REMOVE_USER_ID)
 
 async def unknown(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Maaf, perintah tersebut tidak saya kenali. Gunakan /help untuk melihat daftar perintah.")
     logger.info(f"Perintah tidak dikenal diterima dari {update.effective_user.id} ({update.effective_user.username}): {update.message.text}")
 
-# --- Main Function ---
-def main():
-    logger.info("Memulai inisialisasi bot...")
+# Server /metrics berjalan di event loop yang sama dengan webhook
+metrics_server = MetricsServer(REGISTRY, METRICS_PORT) if METRICS_PORT else None
 
-    try:
-        get_google_sheet_client()
-        load_user_roles() # Ini akan memuat peran pengguna
-    except Exception:
-        logger.critical("Inisialisasi bot gagal. Keluar.")
-        exit(1)
+async def on_startup(application, serve_metrics: bool = True):
+    """
+    Dipanggil PTB setelah aplikasi diinisialisasi: jalankan worker antrean tulis, isi jendela duplikat
+    dan endpoint metrik. serve_metrics=False jika /metrics sudah disajikan server lain (asgi.py).
+    """
+    await checkin_write_queue.start()
+    if duplicate_guard:
+        try:
+            entries = await journal_pool.run(checkin_journal.recent, time.time() - DUPLICATE_WINDOW_SECONDS)
+            seeded = duplicate_guard.seed([entry for entry in entries if is_checkin_sheet(entry.sheet)])
+            if seeded:
+                logger.info(f"Jendela check-in duplikat diisi {seeded} check-in terakhir dari jurnal.")
+        except Exception as e:
+            logger.error(f"Gagal mengisi jendela check-in duplikat dari jurnal: {e}")
+    if metrics_server and serve_metrics:
+        metrics_server.start()
+    if update_capture:
+        update_capture.start()
+
+async def on_shutdown(application):
+    """Dipanggil PTB setelah aplikasi berhenti: flush antrean, tunggu panggilan Sheets yang tersisa lalu tutup pool."""
+    if metrics_server:
+        metrics_server.stop()
+    if update_capture:
+        update_capture.stop()
+    await checkin_write_queue.stop()
+    sheets_pool.shutdown(wait=True)
+    if token_refresher:
+        token_refresher.stop()
+    journal_pool.shutdown(wait=True)
+    checkin_journal.close()
+    storage_backend.close()
+
+# --- Application ---
+def build_application(builder: ApplicationBuilder = None):
+    """
+    Membangun Application dengan semua handler terdaftar. `builder` opsional untuk memakai
+    ApplicationBuilder yang sudah dikonfigurasi (misalnya request palsu di loadtest.py).
+    """
+    if builder is None:
+        builder = ApplicationBuilder().token(TELEGRAM_TOKEN)
+    application = builder.concurrent_updates(update_processor).rate_limiter(outbound_limiter).post_init(on_startup).post_shutdown(on_shutdown).build()
 
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    # Perekam berjalan di group -1 sebelum semua handler lain dan tidak menghentikan pemrosesan update
+    if update_capture:
+        application.add_handler(TypeHandler(Update, update_capture.record), group=-1)
 
     # Conversation Handler for check-in process
     checkin_conversation_handler = ConversationHandler(
         entry_points=[CommandHandler("checkin", checkin_start)],
         states={
-            GET_LOCATION_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_location_name)],
+            GET_LOCATION_NAME: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, get_location_name),
+                MessageHandler(filters.LOCATION, get_location_first), # Lokasi lebih dulu: tawarkan outlet terdekat
+            ],
             GET_REGION: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_region)],
             GET_LOCATION: [MessageHandler(filters.LOCATION, get_location_data)], # Mengarahkan ke get_location_data
         },
@@ -628,7 +1773,7 @@ def main():
     add_admin_handler = ConversationHandler(
         entry_points=[CommandHandler("addadmin", addadmin_command)],
         states={
-            ADD_ADMIN_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, addadmin_process)],
+            ADD_ADMIN_ID: [MessageHandler((filters.TEXT & ~filters.COMMAND) | filters.Document.ALL, addadmin_process)],
         },
         fallbacks=[CommandHandler("cancel", cancel_checkin)],
         allow_reentry=True
@@ -638,7 +1783,7 @@ def main():
     remove_admin_handler = ConversationHandler(
         entry_points=[CommandHandler("removeadmin", removeadmin_command)],
         states={
-            REMOVE_ADMIN_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, removeadmin_process)],
+            REMOVE_ADMIN_ID: [MessageHandler((filters.TEXT & ~filters.COMMAND) | filters.Document.ALL, removeadmin_process)],
         },
         fallbacks=[CommandHandler("cancel", cancel_checkin)],
         allow_reentry=True
@@ -649,7 +1794,7 @@ def main():
     add_user_handler = ConversationHandler(
         entry_points=[CommandHandler("adduser", adduser_command)],
         states={
-            ADD_USER_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, adduser_process)],
+            ADD_USER_ID: [MessageHandler((filters.TEXT & ~filters.COMMAND) | filters.Document.ALL, adduser_process)],
         },
         fallbacks=[CommandHandler("cancel", cancel_checkin)],
         allow_reentry=True
@@ -659,7 +1804,7 @@ def main():
     remove_user_handler = ConversationHandler(
         entry_points=[CommandHandler("removeuser", removeuser_command)],
         states={
-            REMOVE_USER_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, removeuser_process)],
+            REMOVE_USER_ID: [MessageHandler((filters.TEXT & ~filters.COMMAND) | filters.Document.ALL, removeuser_process)],
         },
         fallbacks=[CommandHandler("cancel", cancel_checkin)],
         allow_reentry=True
@@ -672,12 +1817,51 @@ def main():
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("myid", myid))
     application.add_handler(CommandHandler("reloadroles", reload_roles))
+    application.add_handler(CommandHandler("rolestatus", role_status))
+    application.add_handler(CommandHandler("pending", pending_checkins))
+    application.add_handler(CommandHandler("rekap", rekap))
+    application.add_handler(CommandHandler("export", export_checkins))
     application.add_handler(CommandHandler("listadmins", listadmins))
     application.add_handler(CommandHandler("listuser", listuser))
+    application.add_handler(CommandHandler("broadcast", broadcast))
     application.add_handler(CommandHandler("kontak", kontak))
 
     # Message Handler for unknown commands (should be after specific command handlers)
     application.add_handler(MessageHandler(filters.COMMAND, unknown))
+    return application
+
+def schedule_jobs(application):
+    """Mendaftarkan job berkala (butuh python-telegram-bot[job-queue])."""
+    # Job pertama berjalan setelah webhook aktif: catat waktu siap lalu muat peran dari Google Sheets
+    application.job_queue.run_once(warm_start_job, when=0, name="warm_start")
+
+    # Refresh peran berkala di latar belakang
+    if ROLE_REFRESH_INTERVAL:
+        application.job_queue.run_repeating(refresh_roles_job, interval=ROLE_REFRESH_INTERVAL, first=ROLE_REFRESH_INTERVAL, name="refresh_roles")
+
+    # Replayer jurnal: kirim ulang check-in yang belum sampai ke Google Sheet
+    application.job_queue.run_repeating(replay_journal_job, interval=JOURNAL_REPLAY_INTERVAL, first=JOURNAL_REPLAY_INTERVAL, name="replay_journal")
+    # Entri jurnal yang sudah terkirim dihapus setelah masa simpannya agar file jurnal tidak terus membesar
+    application.job_queue.run_repeating(prune_journal_job, interval=JOURNAL_PRUNE_INTERVAL, first=60, name="prune_journal")
+
+    # Cache riwayat check-in (outlet terdekat, /rekap): putaran pertama segera membaca riwayat di latar belakang, lalu hanya baris baru
+    application.job_queue.run_repeating(refresh_checkin_history_job, interval=CHECKIN_HISTORY_REFRESH_INTERVAL, first=1, name="refresh_checkin_history")
+
+    # Compaction harian lembar 'Users' (jam WIB); offset tetap agar tidak kena LMT dari pytz
+    if USERS_COMPACTION_HOUR >= 0:
+        application.job_queue.run_daily(compact_users_job, time=dt_time(hour=USERS_COMPACTION_HOUR, tzinfo=timezone(timedelta(hours=7))), name="compact_users")
+
+# --- Main Function ---
+def main():
+    logger.info("Memulai inisialisasi bot...")
+
+    # Warm start: webhook tidak menunggu Google Sheets; peran dari snapshot lokal (jika ada) dipakai
+    # sampai warm_start_job selesai memuat lembar 'Users' di latar belakang
+    if not load_roles_snapshot():
+        logger.warning("Snapshot peran tidak tersedia: sampai Google Sheets termuat, hanya owner yang dikenali.")
+
+    application = build_application()
+    schedule_jobs(application)
 
     # --- Webhook setup for Render ---
     logger.info(f"Menyiapkan webhook: https://{WEBHOOK_HOST}/{TELEGRAM_TOKEN} pada port {PORT}")
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import numpy as np
+
+from spatial import normalize_name
+
+# Timestamp di 'Check-in Data' adalah waktu pesan Telegram (UTC); laporan memakai tanggal GMT+7
+JAKARTA_OFFSET = np.timedelta64(7, 'h')
+# 1970-01-01 adalah hari Kamis; (hari + 3) // 7 memberi nomor minggu yang dimulai hari Senin
+_WEEK_SHIFT = 3
+
+
+def parse_days(timestamps: list) -> np.ndarray:
+    """Nomor hari (sejak 1970-01-01, GMT+7) dari string 'YYYY-MM-DD HH:MM:SS'; -1 jika tidak terbaca."""
+    try:
+        parsed = np.array(timestamps, dtype='datetime64[s]')
+    except ValueError:
+        # Ada nilai rusak di potongan ini: parse satu per satu
+        parsed = np.array([_parse_one(t) for t in timestamps], dtype='datetime64[s]')
+    days = ((parsed + JAKARTA_OFFSET).astype('datetime64[D]')).astype(np.int64)
+    days[np.isnat(parsed)] = -1
+    return days.astype(np.int32)
+
+
+def _parse_one(timestamp: str):
+    try:
+        return np.datetime64(timestamp, 's')
+    except ValueError:
+        return np.datetime64('NaT')
+
+
+def day_to_date(day: int) -> str:
+    return str(np.datetime64(int(day), 'D'))
+
+
+def today_day() -> int:
+    return int((np.datetime64(int(time.time()), 's') + JAKARTA_OFFSET).astype('datetime64[D]').astype(np.int64))
+
+
+class _Dictionary:
+    """Dictionary encoding: nilai -> kode int32 berurutan, dengan label tampilan terakhir."""
+
+    def __init__(self):
+        self.codes = {}
+        self.labels = []
+
+    def encode(self, key, label: str) -> int:
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.labels)
+            self.labels.append(label)
+        elif label:
+            self.labels[code] = label
+        return code
+
+
+class CheckinColumns:
+    """
+    Cache kolumnar check-in di memori untuk laporan: setiap check-in disimpan sebagai tiga kolom
+    int32 (kode pengguna, kode wilayah, nomor hari GMT+7) dalam array numpy yang tumbuh berlipat.
+    Baris ditambahkan bertahap (append()) dari baris sheet yang baru terbaca, dan agregasi
+    per pengguna/wilayah/hari/minggu dihitung dengan np.bincount di atas kolom tersebut.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._users = _Dictionary()
+        self._regions = _Dictionary()
+        self._user_code = np.empty(initial_capacity, dtype=np.int32)
+        self._region_code = np.empty(initial_capacity, dtype=np.int32)
+        self._day = np.empty(initial_capacity, dtype=np.int32)
+        self.size = 0
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        if needed <= len(self._day):
+            return
+        capacity = max(needed, 2 * len(self._day))
+        for name in ('_user_code', '_region_code', '_day'):
+            grown = np.empty(capacity, dtype=np.int32)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+
+    def append(self, rows: list) -> int:
+        """Menambahkan baris 'Check-in Data' (A user_id, B nama, C username, D timestamp, F wilayah). Mengembalikan jumlahnya."""
+        rows = [row for row in rows if len(row) >= 4 and row[0]]
+        if not rows:
+            return 0
+        days = parse_days([row[3] for row in rows])
+        with self._lock:
+            user_codes = np.fromiter((self._users.encode(row[0], _user_label(row)) for row in rows), dtype=np.int32, count=len(rows))
+            region_codes = np.fromiter((self._regions.encode(normalize_name(row[5] if len(row) > 5 else ''), (row[5] if len(row) > 5 else '').strip() or '(kosong)') for row in rows), dtype=np.int32, count=len(rows))
+            self._reserve(len(rows))
+            end = self.size + len(rows)
+            self._user_code[self.size:end] = user_codes
+            self._region_code[self.size:end] = region_codes
+            self._day[self.size:end] = days
+            self.size = end
+            self.updated_at = time.time()
+        return len(rows)
+
+    def _window(self, start_day: int, end_day: int):
+        """Salinan kolom untuk check-in dengan start_day <= hari <= end_day."""
+        with self._lock:
+            day = self._day[:self.size]
+            mask = (day >= start_day) & (day <= end_day)
+            return self._user_code[:self.size][mask], self._region_code[:self.size][mask], day[mask]
+
+    def count_by(self, dimension: str, start_day: int, end_day: int) -> list:
+        """
+        Jumlah check-in per 'user', 'wilayah', 'hari' atau 'minggu' dalam rentang hari (inklusif),
+        sebagai list (label, jumlah). Pengguna/wilayah urut dari yang terbanyak, hari/minggu urut waktu.
+        """
+        users, regions, days = self._window(start_day, end_day)
+        if dimension in ('user', 'wilayah'):
+            codes, dictionary = (users, self._users) if dimension == 'user' else (regions, self._regions)
+            counts = np.bincount(codes, minlength=len(dictionary.labels))
+            order = np.argsort(-counts, kind='stable')
+            return [(dictionary.labels[code], int(counts[code])) for code in order if counts[code]]
+        if dimension == 'hari':
+            counts = np.bincount(days - start_day, minlength=end_day - start_day + 1)
+            return [(day_to_date(start_day + offset), int(count)) for offset, count in enumerate(counts)]
+        if dimension == 'minggu':
+            first_week = (start_day + _WEEK_SHIFT) // 7
+            weeks = (days + _WEEK_SHIFT) // 7 - first_week
+            counts = np.bincount(weeks, minlength=(end_day + _WEEK_SHIFT) // 7 - first_week + 1)
+            return [(f"mulai {day_to_date((first_week + offset) * 7 - _WEEK_SHIFT)}", int(count)) for offset, count in enumerate(counts)]
+        raise ValueError(f"Dimensi rekap tidak dikenal: {dimension}")
+
+    def stats(self) -> dict:
+        return {'rows': self.size, 'users': len(self._users.labels), 'regions': len(self._regions.labels), 'updated_at': self.updated_at}
+
+
+def _user_label(row: list) -> str:
+    first_name = row[1] if len(row) > 1 else ''
+    username = row[2] if len(row) > 2 else ''
+    label = first_name or row[0]
+    return f"{label} (@{username})" if username else f"{label} ({row[0]})"
@@ -0,0 +1,232 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    sheet TEXT NOT NULL,
+    row_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    claimed_until REAL
+);
+CREATE INDEX IF NOT EXISTS entries_pending ON entries (sent_at, id);
+CREATE INDEX IF NOT EXISTS entries_created ON entries (created_at);
+"""
+
+
+class JournalEntry:
+    __slots__ = ('id', 'idempotency_key', 'sheet', 'row', 'created_at', 'attempts')
+
+    def __init__(self, id, idempotency_key, sheet, row, created_at, attempts):
+        self.id = id
+        self.idempotency_key = idempotency_key
+        self.sheet = sheet
+        self.row = row
+        self.created_at = created_at
+        self.attempts = attempts
+
+
+class CheckinJournal:
+    """
+    Jurnal lokal append-only (SQLite, mode WAL, synchronous=FULL) untuk baris yang harus
+    sampai ke Google Sheet. Setiap baris dicatat di sini lebih dulu dengan kunci idempotensi;
+    baris yang belum terkirim (misalnya saat Sheets down atau kena kuota) dikirim ulang
+    oleh replayer. Koneksi dibuka saat pertama dipakai dan aman dipakai lintas thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL") # fsync setiap commit: check-in tidak hilang saat proses mati
+            conn.executescript(_SCHEMA)
+            if 'claimed_until' not in {column[1] for column in conn.execute("PRAGMA table_info(entries)")}:
+                conn.execute("ALTER TABLE entries ADD COLUMN claimed_until REAL") # Jurnal dari versi sebelum claim_pending()
+            self._conn = conn
+            logger.info(f"Jurnal check-in dibuka di {self.path}.")
+        return self._conn
+
+    def append(self, idempotency_key: str, sheet: str, row: list):
+        """
+        Mencatat satu baris. Mengembalikan (entry_id, inserted); inserted False berarti kunci
+        yang sama sudah pernah dicatat (misalnya update Telegram yang dikirim ulang).
+        """
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO entries (idempotency_key, sheet, row_json, created_at) VALUES (?, ?, ?, ?)",
+                (idempotency_key, sheet, json.dumps(row, ensure_ascii=False), time.time()),
+            )
+            if cursor.rowcount:
+                return cursor.lastrowid, True
+            existing = conn.execute("SELECT id FROM entries WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+            return existing[0], False
+
+    def append_many(self, entries: list) -> list:
+        """
+        Mencatat banyak baris [(idempotency_key, sheet, row), ...] dalam satu transaksi (satu fsync).
+        Mengembalikan [(entry_id, inserted), ...] dengan urutan yang sama seperti `entries`.
+        """
+        if not entries:
+            return []
+        now = time.time()
+        results = []
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                for key, sheet, row in entries:
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO entries (idempotency_key, sheet, row_json, created_at) VALUES (?, ?, ?, ?)",
+                        (key, sheet, json.dumps(row, ensure_ascii=False), now),
+                    )
+                    if cursor.rowcount:
+                        results.append((cursor.lastrowid, True))
+                    else:
+                        existing = conn.execute("SELECT id FROM entries WHERE idempotency_key = ?", (key,)).fetchone()
+                        results.append((existing[0], False))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return results
+
+    def mark_sent(self, entry_ids: list):
+        if not entry_ids:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("UPDATE entries SET sent_at = ?, claimed_until = NULL WHERE id = ? AND sent_at IS NULL", [(time.time(), i) for i in entry_ids])
+
+    def sent_ids(self, entry_ids: list) -> set:
+        """Bagian dari `entry_ids` yang sudah terkirim (misalnya oleh pengirim lain)."""
+        if not entry_ids:
+            return set()
+        with self._lock:
+            conn = self._connection()
+            sent = set()
+            for start in range(0, len(entry_ids), 500): # Batas jumlah parameter SQLite
+                chunk = list(entry_ids[start:start + 500])
+                sent.update(r[0] for r in conn.execute(
+                    f"SELECT id FROM entries WHERE sent_at IS NOT NULL AND id IN ({','.join('?' * len(chunk))})", chunk
+                ))
+        return sent
+
+    def record_failure(self, entry_ids: list, error: str, uncertain: bool = True):
+        """
+        Mencatat pengiriman yang gagal. uncertain=False jika permintaan pasti ditolak sebelum
+        diproses (misalnya 429); hanya percobaan yang hasilnya tidak pasti yang menambah `attempts`,
+        sehingga replayer tahu kapan perlu mengecek duplikat di sheet.
+        """
+        if not entry_ids:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "UPDATE entries SET attempts = attempts + ?, last_error = ?, claimed_until = NULL WHERE id = ?",
+                [(1 if uncertain else 0, error[:500], i) for i in entry_ids],
+            )
+
+    def pending(self, limit: int = 500, exclude_ids=(), sheet: str = None) -> list:
+        """Baris yang belum terkirim (opsional hanya untuk satu worksheet), urut dari yang paling lama."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, idempotency_key, sheet, row_json, created_at, attempts FROM entries "
+                "WHERE sent_at IS NULL AND (? IS NULL OR sheet = ?) ORDER BY id LIMIT ?",
+                (sheet, sheet, limit + len(exclude_ids)),
+            ).fetchall()
+        excluded = set(exclude_ids)
+        entries = [
+            JournalEntry(r[0], r[1], r[2], json.loads(r[3]), r[4], r[5])
+            for r in rows if r[0] not in excluded
+        ]
+        return entries[:limit]
+
+    def claim_pending(self, limit: int = 500, sheet: str = None, lease: float = 60.0) -> list:
+        """
+        Seperti pending(), tetapi entri yang dikembalikan diklaim selama `lease` detik sehingga tidak
+        diambil pengirim lain (thread atau proses lain yang memakai file jurnal yang sama). Klaim dilepas
+        oleh mark_sent()/record_failure(), atau kedaluwarsa sendiri jika pengirimnya mati di tengah jalan.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE") # Kunci tulis SQLite: klaim atomik lintas proses
+            try:
+                rows = conn.execute(
+                    "SELECT id, idempotency_key, sheet, row_json, created_at, attempts FROM entries "
+                    "WHERE sent_at IS NULL AND (? IS NULL OR sheet = ?) AND (claimed_until IS NULL OR claimed_until < ?) "
+                    "ORDER BY id LIMIT ?",
+                    (sheet, sheet, now, limit),
+                ).fetchall()
+                conn.executemany("UPDATE entries SET claimed_until = ? WHERE id = ?", [(now + lease, r[0]) for r in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [JournalEntry(r[0], r[1], r[2], json.loads(r[3]), r[4], r[5]) for r in rows]
+
+    def recent(self, since: float, sheet: str = None) -> list:
+        """Baris (terkirim maupun belum) yang dicatat sejak timestamp `since`, urut dari yang paling lama."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, idempotency_key, sheet, row_json, created_at, attempts FROM entries "
+                "WHERE created_at >= ? AND (? IS NULL OR sheet = ?) ORDER BY id",
+                (since, sheet, sheet),
+            ).fetchall()
+        return [JournalEntry(r[0], r[1], r[2], json.loads(r[3]), r[4], r[5]) for r in rows]
+
+    def stats(self) -> dict:
+        """Ringkasan backlog: jumlah pending, umur entri tertua, percobaan gagal dan error terakhir."""
+        with self._lock:
+            conn = self._connection()
+            count, oldest, failed = conn.execute(
+                "SELECT COUNT(*), MIN(created_at), SUM(CASE WHEN last_error IS NOT NULL THEN 1 ELSE 0 END) FROM entries WHERE sent_at IS NULL"
+            ).fetchone()
+            last_error = conn.execute(
+                "SELECT last_error FROM entries WHERE sent_at IS NULL AND last_error IS NOT NULL ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        return {
+            'pending': count,
+            'oldest_age_seconds': (time.time() - oldest) if oldest else 0.0,
+            'failed': failed or 0,
+            'last_error': last_error[0] if last_error else None,
+        }
+
+    def prune(self, max_age_seconds: float, chunk: int = 5000) -> int:
+        """
+        Menghapus entri yang sudah terkirim lebih dari `max_age_seconds` lalu; entri yang belum terkirim
+        tidak pernah dihapus. Dihapus per `chunk` baris agar kunci tulis tidak menahan pencatatan check-in.
+        Mengembalikan jumlah entri yang dihapus.
+        """
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        while True:
+            with self._lock:
+                cursor = self._connection().execute(
+                    "DELETE FROM entries WHERE id IN (SELECT id FROM entries WHERE sent_at IS NOT NULL AND sent_at < ? LIMIT ?)",
+                    (cutoff, chunk),
+                )
+            removed += cursor.rowcount
+            if cursor.rowcount < chunk:
+                return removed
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
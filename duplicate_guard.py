@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import deque
+
+from spatial import distance_m, normalize_name, parse_maps_link
+
+ACTION_REJECT = 'reject' # Tolak check-in ulang dan beri tahu pengguna
+ACTION_MERGE = 'merge' # Anggap sama dengan check-in sebelumnya (tidak ditulis ulang), balas seperti berhasil
+
+
+class RecentCheckin:
+    __slots__ = ('at', 'latitude', 'longitude', 'name', 'region', 'checkin_id')
+
+    def __init__(self, at, latitude, longitude, name, region, checkin_id):
+        self.at = at
+        self.latitude = latitude
+        self.longitude = longitude
+        self.name = name
+        self.region = region
+        self.checkin_id = checkin_id
+
+
+class DuplicateGuard:
+    """
+    Jendela geser per pengguna berisi check-in terakhir di memori. Check-in ke outlet yang sama
+    (nama sama, dalam radius `radius_m`) dalam `window_seconds` sejak check-in sebelumnya
+    dianggap duplikat dan tidak perlu ditulis ke penyimpanan. Jendela bisa diisi ulang dari jurnal
+    check-in saat startup, sehingga tetap berlaku setelah restart. Aman dipakai lintas thread.
+    """
+
+    def __init__(self, window_seconds: float, radius_m: float, max_per_user: int = 20):
+        self.window_seconds = window_seconds
+        self.radius_m = radius_m
+        self.max_per_user = max_per_user
+        self._recent = {} # user_id -> deque[RecentCheckin], urut dari yang paling lama
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def _prune(self, user_id: int, now: float):
+        recent = self._recent.get(user_id)
+        while recent and now - recent[0].at > self.window_seconds:
+            recent.popleft()
+        if recent is not None and not recent:
+            del self._recent[user_id]
+
+    def find(self, user_id: int, latitude: float, longitude: float, name: str, now: float = None):
+        """Check-in terakhir pengguna yang sama outletnya dan masih dalam jendela, atau None."""
+        now = time.time() if now is None else now
+        key = normalize_name(name)
+        with self._lock:
+            self._prune(user_id, now)
+            for previous in reversed(self._recent.get(user_id, ())):
+                if previous.name == key and distance_m(previous.latitude, previous.longitude, latitude, longitude) <= self.radius_m:
+                    return previous
+        return None
+
+    def record(self, user_id: int, latitude: float, longitude: float, name: str, region: str, checkin_id: str, at: float = None):
+        at = time.time() if at is None else at
+        with self._lock:
+            recent = self._recent.setdefault(user_id, deque(maxlen=self.max_per_user))
+            recent.append(RecentCheckin(at, latitude, longitude, normalize_name(name), region, checkin_id))
+            self._prune(user_id, at)
+
+    def mark_suppressed(self):
+        """Mencatat satu check-in yang dianggap duplikat (ditolak atau digabung)."""
+        with self._lock:
+            self.suppressed += 1
+
+    def seed(self, entries: list) -> int:
+        """Mengisi jendela dari entri jurnal 'Check-in Data' (lihat CheckinJournal.recent). Mengembalikan jumlahnya."""
+        seeded = 0
+        for entry in entries:
+            row = entry.row
+            coordinates = parse_maps_link(row[6]) if len(row) > 6 else None
+            if not coordinates:
+                continue
+            try:
+                user_id = int(row[0])
+            except ValueError:
+                continue
+            self.record(user_id, coordinates[0], coordinates[1], row[4], row[5], entry.idempotency_key, at=entry.created_at)
+            seeded += 1
+        return seeded
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'users': len(self._recent), 'checkins': sum(len(r) for r in self._recent.values()), 'suppressed': self.suppressed}
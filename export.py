@@ -0,0 +1,113 @@
+import csv
+import gzip
+import io
+import tempfile
+
+import numpy as np
+
+from checkin_cache import parse_days
+
+FORMAT_CSV = 'csv'
+FORMAT_CSV_GZ = 'csv.gz'
+FORMAT_PARQUET = 'parquet'
+EXPORT_FORMATS = (FORMAT_CSV, FORMAT_CSV_GZ, FORMAT_PARQUET)
+
+
+class ExportError(Exception):
+    """Ekspor tidak bisa dibuat (format tidak didukung, dependensi opsional tidak terpasang, ...)."""
+
+
+class CheckinExporter:
+    """
+    Menulis baris check-in yang lolos filter (rentang hari GMT+7, daftar user_id) per potongan ke
+    SpooledTemporaryFile: data tetap di memori sampai `spool_max_bytes`, setelah itu dipindah ke
+    file sementara di disk, sehingga ekspor jutaan baris hanya memakai memori sebesar satu potongan.
+    Format: CSV, CSV ber-gzip, atau Parquet (butuh pyarrow, satu row group per potongan).
+    """
+
+    def __init__(self, headers: list, fmt: str = FORMAT_CSV, start_day: int = None, end_day: int = None, user_ids=None, spool_max_bytes: int = 8 * 1024 * 1024):
+        if fmt not in EXPORT_FORMATS:
+            raise ExportError(f"Format '{fmt}' tidak didukung; pilih salah satu dari {', '.join(EXPORT_FORMATS)}.")
+        self.headers = headers
+        self.format = fmt
+        self.start_day = start_day
+        self.end_day = end_day
+        self.user_ids = np.array(sorted(str(u) for u in user_ids), dtype=object) if user_ids else None
+        self.rows_read = 0
+        self.rows_written = 0
+        if spool_max_bytes <= 0:
+            raise ExportError("spool_max_bytes harus lebih dari 0 agar ekspor besar dipindah ke disk.")
+        self.spool_max_bytes = spool_max_bytes
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes, mode='w+b')
+        self._target = self.file
+        self._gzip = None
+        self._parquet = None
+        self._pa = None
+
+        if fmt == FORMAT_PARQUET:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                self.file.close()
+                raise ExportError("Format parquet membutuhkan paket pyarrow (pip install pyarrow).")
+            self._pa = pa
+            schema = pa.schema([(name, pa.string()) for name in headers])
+            self._parquet = pq.ParquetWriter(pa.PythonFile(self.file, mode='w'), schema, compression='snappy')
+        else:
+            if fmt == FORMAT_CSV_GZ:
+                self._gzip = self._target = gzip.GzipFile(fileobj=self.file, mode='wb')
+            else:
+                self._target.write('\ufeff'.encode('utf-8')) # BOM agar Excel mengenali UTF-8
+            self._write_csv([headers])
+
+    def _write_csv(self, rows: list):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        self._target.write(buffer.getvalue().encode('utf-8'))
+
+    def _select(self, rows: list) -> list:
+        mask = np.ones(len(rows), dtype=bool)
+        if self.start_day is not None or self.end_day is not None:
+            days = parse_days([row[3] if len(row) > 3 else '' for row in rows])
+            if self.start_day is not None:
+                mask &= days >= self.start_day
+            if self.end_day is not None:
+                mask &= days <= self.end_day
+        if self.user_ids is not None:
+            mask &= np.isin(np.array([row[0] if row else '' for row in rows], dtype=object), self.user_ids)
+        return [rows[i] for i in np.flatnonzero(mask)]
+
+    def write_rows(self, rows: list) -> int:
+        """Menyaring dan menulis satu potongan baris. Mengembalikan jumlah baris yang ditulis."""
+        self.rows_read += len(rows)
+        selected = self._select(rows) if rows else []
+        width = len(self.headers)
+        selected = [(list(row) + [''] * width)[:width] for row in selected]
+        if selected:
+            if self._parquet is not None:
+                columns = list(zip(*selected))
+                self._parquet.write_table(self._pa.table({name: list(column) for name, column in zip(self.headers, columns)}))
+            else:
+                self._write_csv(selected)
+        self.rows_written += len(selected)
+        return len(selected)
+
+    def finish(self):
+        """
+        Menutup writer dan mengembalikan isi ekspor beserta ukurannya dalam byte: bytes jika masih di
+        memori (SpooledTemporaryFile di memori tidak punya nama file, yang dibutuhkan InputFile PTB),
+        atau file di disk dengan posisi di awal.
+        """
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self._gzip is not None:
+            self._gzip.close() # Menulis trailer gzip; file di bawahnya tetap terbuka
+        size = self.file.tell()
+        self.file.seek(0)
+        if size <= self.spool_max_bytes:
+            return self.file.read(), size
+        return self.file, size
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,248 @@
+"""
+Reverse geocoding offline: menentukan wilayah (kabupaten/kota) dari koordinat dengan uji
+point-in-polygon terhadap file batas administrasi lokal (GeoJSON), tanpa layanan geocoding.
+
+GeoJSON dikompilasi sekali menjadi file indeks biner (vertex, ring, bounding box dan grid sel)
+yang dibuka dengan mmap, sehingga memuatnya saat startup hampir instan dan halaman yang tidak
+dipakai tidak pernah dibaca dari disk.
+
+    python geocode.py compile batas_kabkota.geojson batas_kabkota.idx --name-property WADMKK
+    python geocode.py lookup batas_kabkota.idx -6.2 106.8
+"""
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RGNIDX1\n"
+DEFAULT_CELL_DEG = 0.25
+# Properti nama wilayah yang umum di dataset batas administrasi Indonesia, dicoba berurutan
+NAME_PROPERTY_CANDIDATES = ('WADMKK', 'NAME_2', 'kab_kota', 'kabupaten', 'KABKOT', 'nama', 'name', 'NAME')
+
+
+class BoundaryFormatError(ValueError):
+    """File batas wilayah tidak bisa dibaca sebagai GeoJSON atau file indeks."""
+
+
+def _feature_name(properties: dict, name_property: str = None) -> str:
+    if name_property:
+        return str(properties.get(name_property) or '').strip()
+    for key in NAME_PROPERTY_CANDIDATES:
+        if properties.get(key):
+            return str(properties[key]).strip()
+    return ''
+
+
+def _polygons(geometry: dict) -> list:
+    """List polygon (masing-masing list ring [[lng, lat], ...]) dari geometri Polygon/MultiPolygon."""
+    if not geometry:
+        return []
+    if geometry.get('type') == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry.get('type') == 'MultiPolygon':
+        return geometry['coordinates']
+    if geometry.get('type') == 'GeometryCollection':
+        return [p for g in geometry.get('geometries', []) for p in _polygons(g)]
+    return []
+
+
+def compile_boundaries(geojson_path: str, output_path: str, name_property: str = None, cell_deg: float = DEFAULT_CELL_DEG) -> dict:
+    """Mengompilasi GeoJSON batas wilayah menjadi file indeks biner. Mengembalikan ringkasan."""
+    try:
+        with open(geojson_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise BoundaryFormatError(f"Tidak bisa membaca GeoJSON {geojson_path}: {e}")
+    features = data.get('features') if isinstance(data, dict) else None
+    if not isinstance(features, list):
+        raise BoundaryFormatError(f"{geojson_path} bukan FeatureCollection GeoJSON.")
+
+    names = []
+    name_ids = {}
+    vertices = []
+    ring_offsets = [0]
+    polygon_rings = [0]
+    polygon_region = []
+    polygon_bbox = []
+    skipped = 0
+    for feature in features:
+        name = _feature_name(feature.get('properties') or {}, name_property)
+        parts = _polygons(feature.get('geometry'))
+        if not name or not parts:
+            skipped += 1
+            continue
+        region_id = name_ids.setdefault(name, len(names))
+        if region_id == len(names):
+            names.append(name)
+        for rings in parts:
+            ring_count = 0
+            for ring in rings:
+                if len(ring) < 3:
+                    continue
+                points = [(float(p[0]), float(p[1])) for p in ring]
+                if points[0] != points[-1]:
+                    points.append(points[0]) # Ring harus tertutup untuk uji ray casting
+                vertices.extend(points)
+                ring_offsets.append(len(vertices))
+                ring_count += 1
+            if not ring_count:
+                continue
+            outer = np.asarray(vertices[ring_offsets[-ring_count - 1]:ring_offsets[-ring_count]])
+            polygon_bbox.append((outer[:, 0].min(), outer[:, 1].min(), outer[:, 0].max(), outer[:, 1].max()))
+            polygon_rings.append(polygon_rings[-1] + ring_count)
+            polygon_region.append(region_id)
+
+    if not polygon_region:
+        raise BoundaryFormatError(f"Tidak ada poligon bernama di {geojson_path} (periksa --name-property).")
+
+    bbox = np.asarray(polygon_bbox, dtype=np.float64)
+    # Grid: setiap sel menyimpan poligon yang bounding box-nya menyentuh sel tersebut (format CSR)
+    cell_entries = {}
+    for polygon_id, (min_x, min_y, max_x, max_y) in enumerate(bbox):
+        for i in range(math.floor(min_y / cell_deg), math.floor(max_y / cell_deg) + 1):
+            for j in range(math.floor(min_x / cell_deg), math.floor(max_x / cell_deg) + 1):
+                cell_entries.setdefault((i, j), []).append(polygon_id)
+    cells = sorted(cell_entries)
+    cell_keys = np.asarray([i * (1 << 32) + j for i, j in cells], dtype=np.int64)
+    cell_offsets = np.cumsum([0] + [len(cell_entries[c]) for c in cells]).astype(np.int64)
+    cell_polygons = np.asarray([p for c in cells for p in cell_entries[c]], dtype=np.int32)
+
+    arrays = {
+        'vertices': np.asarray(vertices, dtype=np.float64),
+        'ring_offsets': np.asarray(ring_offsets, dtype=np.int64),
+        'polygon_rings': np.asarray(polygon_rings, dtype=np.int64),
+        'polygon_region': np.asarray(polygon_region, dtype=np.int32),
+        'polygon_bbox': bbox,
+        'cell_keys': cell_keys,
+        'cell_offsets': cell_offsets,
+        'cell_polygons': cell_polygons,
+    }
+    _write_index(output_path, names, cell_deg, arrays)
+    summary = {'regions': len(names), 'polygons': len(polygon_region), 'vertices': len(vertices), 'cells': len(cells), 'skipped_features': skipped}
+    logger.info(f"Indeks wilayah {output_path} dibuat dari {geojson_path}: {summary}")
+    return summary
+
+
+def _write_index(output_path: str, names: list, cell_deg: float, arrays: dict):
+    """Header JSON diikuti array mentah (rata 8 byte); ditulis ke file sementara lalu diganti atomik."""
+    specs = {}
+    offset = 0
+    for key, array in arrays.items():
+        specs[key] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += (array.nbytes + 7) // 8 * 8
+    header = json.dumps({'names': names, 'cell_deg': cell_deg, 'arrays': specs}, ensure_ascii=False).encode('utf-8')
+    header += b" " * (-(len(MAGIC) + 8 + len(header)) % 8)
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for array in arrays.values():
+            data = np.ascontiguousarray(array).tobytes()
+            f.write(data)
+            f.write(b"\0" * (-len(data) % 8))
+    os.replace(tmp_path, output_path)
+
+
+class RegionIndex:
+    """Indeks wilayah dari file hasil compile_boundaries(), dibuka lewat mmap (hanya baca)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise BoundaryFormatError(f"{path} bukan file indeks wilayah.")
+        (header_length,) = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        data_start = len(MAGIC) + 8 + header_length
+        header = json.loads(self._mmap[len(MAGIC) + 8:data_start].decode('utf-8'))
+        self.names = header['names']
+        self.cell_deg = header['cell_deg']
+        for key, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'])) if spec['shape'] else 1
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=data_start + spec['offset'])
+            setattr(self, key, array.reshape(spec['shape']))
+
+    def _contains(self, polygon_id: int, longitude: float, latitude: float) -> bool:
+        """Ray casting (aturan even-odd) terhadap semua ring poligon, sehingga lubang ikut diperhitungkan."""
+        crossings = 0
+        for ring in range(self.polygon_rings[polygon_id], self.polygon_rings[polygon_id + 1]):
+            ring_vertices = self.vertices[self.ring_offsets[ring]:self.ring_offsets[ring + 1]]
+            x1, y1 = ring_vertices[:-1, 0], ring_vertices[:-1, 1]
+            x2, y2 = ring_vertices[1:, 0], ring_vertices[1:, 1]
+            straddles = (y1 > latitude) != (y2 > latitude)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = x1 + (latitude - y1) * (x2 - x1) / (y2 - y1)
+            crossings += int(np.count_nonzero(straddles & (longitude < x_cross)))
+        return crossings % 2 == 1
+
+    def lookup(self, latitude: float, longitude: float):
+        """Nama wilayah yang memuat titik, atau None jika titik di luar semua poligon."""
+        key = math.floor(latitude / self.cell_deg) * (1 << 32) + math.floor(longitude / self.cell_deg)
+        position = int(np.searchsorted(self.cell_keys, key))
+        if position >= len(self.cell_keys) or self.cell_keys[position] != key:
+            return None
+        for polygon_id in self.cell_polygons[self.cell_offsets[position]:self.cell_offsets[position + 1]]:
+            min_x, min_y, max_x, max_y = self.polygon_bbox[polygon_id]
+            if not (min_x <= longitude <= max_x and min_y <= latitude <= max_y):
+                continue
+            if self._contains(int(polygon_id), longitude, latitude):
+                return self.names[self.polygon_region[polygon_id]]
+        return None
+
+    def stats(self) -> dict:
+        return {'regions': len(self.names), 'polygons': len(self.polygon_region), 'vertices': len(self.vertices), 'bytes': len(self._mmap)}
+
+
+def load_region_index(path: str, name_property: str = None) -> RegionIndex:
+    """
+    Membuka indeks wilayah. Jika `path` adalah GeoJSON (.geojson/.json), indeks dikompilasi ke
+    `path + '.idx'` saat belum ada atau lebih lama dari GeoJSON-nya, lalu file indeks itu yang dibuka.
+    """
+    if path.lower().endswith(('.geojson', '.json')):
+        index_path = path + '.idx'
+        if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path):
+            compile_boundaries(path, index_path, name_property)
+        path = index_path
+    return RegionIndex(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reverse geocoding offline dari file batas wilayah.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    compile_parser = commands.add_parser('compile', help="Kompilasi GeoJSON menjadi file indeks")
+    compile_parser.add_argument('geojson')
+    compile_parser.add_argument('output')
+    compile_parser.add_argument('--name-property', default=None, help=f"Properti nama wilayah (default: coba {', '.join(NAME_PROPERTY_CANDIDATES)})")
+    compile_parser.add_argument('--cell-deg', type=float, default=DEFAULT_CELL_DEG, help="Ukuran sel grid dalam derajat")
+    lookup_parser = commands.add_parser('lookup', help="Cari wilayah untuk satu koordinat")
+    lookup_parser.add_argument('index')
+    lookup_parser.add_argument('latitude', type=float)
+    lookup_parser.add_argument('longitude', type=float)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'compile':
+            print(json.dumps(compile_boundaries(args.geojson, args.output, args.name_property, args.cell_deg)))
+        else:
+            print(load_region_index(args.index).lookup(args.latitude, args.longitude) or "(di luar semua wilayah)")
+    except (BoundaryFormatError, OSError) as e:
+        print(f"Gagal: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    sys.exit(main())
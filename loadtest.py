@@ -0,0 +1,425 @@
+"""
+Load test offline untuk bot.py: mengirim Update sintetis lewat Application dan handler asli,
+dengan backend penyimpanan 'memory' (fake Sheets) dan API Telegram palsu.
+
+Setiap pengguna simulasi menjalankan alur /checkin -> nama -> wilayah -> lokasi dan menunggu
+balasan bot di setiap langkah; beberapa admin simulasi menjalankan perintah admin secara
+bersamaan. Hasilnya throughput dan latensi p50/p95/p99 per langkah.
+
+Contoh:
+    python loadtest.py --users 2000 --sheets-latency-ms 150
+    python loadtest.py --users 500 --flows 3 --json hasil.json --max-p95-ms 2000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+OWNER_ID = 1
+ADMIN_ID_BASE = 100
+USER_ID_BASE = 100_000
+NEW_USER_ID_BASE = 9_000_000 # ID untuk /adduser dan /removeuser oleh admin simulasi
+
+ADMIN_COMMANDS = ['/listuser', '/listadmins', '/rolestatus', '/pending', '/myid']
+
+
+def add_backend_arguments(parser: argparse.ArgumentParser):
+    """Opsi bersama loadtest.py dan replay.py: perilaku fake Sheets/Telegram dan keluaran laporan."""
+    parser.add_argument('--sheets-latency-ms', type=int, default=100, help="Latensi setiap panggilan fake Sheets (ms)")
+    parser.add_argument('--sheets-error-rate', type=float, default=0.0, help="Peluang panggilan fake Sheets gagal dengan 429")
+    parser.add_argument('--telegram-latency-ms', type=int, default=0, help="Latensi setiap panggilan API Telegram palsu (ms)")
+    parser.add_argument('--telegram-global-rate', type=float, default=0.0, help="Batas pesan/detik global rate limiter keluar (0 = tanpa batas; 25 meniru produksi)")
+    parser.add_argument('--telegram-chat-rate', type=float, default=0.0, help="Batas pesan/detik per chat rate limiter keluar (0 = tanpa batas)")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Batas waktu menunggu balasan bot per langkah (detik)")
+    parser.add_argument('--json', dest='json_path', default=None, help="Tulis hasil ke file JSON (untuk membandingkan antar versi)")
+    parser.add_argument('--max-p95-ms', type=float, default=None, help="Keluar dengan kode 1 jika p95 salah satu langkah melebihi nilai ini")
+    parser.add_argument('--verbose', action='store_true', help="Tampilkan log INFO dari bot")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test offline untuk alur check-in bot.")
+    parser.add_argument('--users', type=int, default=1000, help="Jumlah pengguna simulasi yang check-in bersamaan")
+    parser.add_argument('--flows', type=int, default=1, help="Jumlah alur check-in per pengguna")
+    parser.add_argument('--admins', type=int, default=3, help="Jumlah admin simulasi yang menjalankan perintah admin")
+    parser.add_argument('--admin-ops', type=int, default=20, help="Jumlah operasi per admin simulasi")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="Sebar waktu mulai pengguna selama N detik")
+    parser.add_argument('--think-ms', type=int, default=0, help="Jeda antar langkah tiap pengguna (ms)")
+    parser.add_argument('--seed', type=int, default=None)
+    add_backend_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir: str, owner_id: int = OWNER_ID):
+    """Harus dipanggil sebelum `import bot`: bot membaca konfigurasi dari environment saat diimpor."""
+    os.environ['STORAGE_BACKEND'] = 'memory'
+    os.environ['FAKE_SHEETS_LATENCY_MS'] = str(args.sheets_latency_ms)
+    os.environ['FAKE_SHEETS_ERROR_RATE'] = str(args.sheets_error_rate)
+    os.environ['CHECKIN_JOURNAL_PATH'] = os.path.join(workdir, 'checkin_journal.db')
+    os.environ['ROLES_SNAPSHOT_PATH'] = os.path.join(workdir, 'roles_snapshot.json')
+    os.environ['METRICS_PORT'] = '0'
+    os.environ['TELEGRAM_GLOBAL_RATE'] = str(args.telegram_global_rate)
+    os.environ['TELEGRAM_CHAT_RATE'] = str(args.telegram_chat_rate)
+    os.environ['CAPTURE_UPDATES_DIR'] = '' # Jangan merekam update sintetis
+    os.environ['OWNER_ID'] = str(owner_id)
+    os.environ.setdefault('TELEGRAM_TOKEN', '123456:LOADTEST')
+    os.environ.setdefault('WEBHOOK_HOST', 'loadtest.invalid')
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Persentil nearest-rank dari list yang sudah terurut."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def make_fake_request_class():
+    from telegram.request import BaseRequest
+
+    class FakeRequest(BaseRequest):
+        """
+        Pengganti HTTP ke API Telegram: mengembalikan JSON kanonik untuk getMe/sendMessage/sendDocument/getFile
+        dan meneruskan setiap pesan keluar ke antrean balasan per chat.
+        """
+
+        BOT_USER = {'id': 42, 'is_bot': True, 'first_name': 'LoadTestBot', 'username': 'loadtest_bot'}
+
+        def __init__(self, latency: float = 0.0):
+            self.latency = latency
+            self.replies = {} # chat_id -> asyncio.Queue berisi (waktu perf_counter, teks balasan)
+            self.calls = {}
+            self.documents = {} # chat_id -> list (nama file, isi) dari sendDocument
+            self.files = {} # file_id -> isi file yang "diunggah" pengguna (lihat UpdateFactory.document)
+            self._message_ids = itertools.count(1)
+
+        def reply_queue(self, chat_id: int) -> asyncio.Queue:
+            queue = self.replies.get(chat_id)
+            if queue is None:
+                queue = self.replies[chat_id] = asyncio.Queue()
+            return queue
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+            endpoint = url.rsplit('/', 1)[-1]
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if '/file/bot' in url: # Unduhan file hasil getFile
+                return 200, self.files.get(endpoint, b'')
+            params = request_data.parameters if request_data is not None else {}
+            if endpoint == 'getMe':
+                result = self.BOT_USER
+            elif endpoint == 'sendMessage':
+                chat_id = int(params['chat_id'])
+                result = {
+                    'message_id': next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': self.BOT_USER,
+                    'text': params.get('text', ''),
+                }
+                queue = self.replies.get(chat_id)
+                if queue is not None: # Notifikasi ke pengguna yang tidak disimulasikan diabaikan
+                    queue.put_nowait((time.perf_counter(), result['text']))
+            elif endpoint == 'sendDocument':
+                chat_id = int(params['chat_id'])
+                document = next(iter((request_data.multipart_data or {}).values()), ('document', b'', None))
+                self.documents.setdefault(chat_id, []).append((document[0], document[1]))
+                result = {
+                    'message_id': next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': self.BOT_USER,
+                    'document': {'file_id': 'fake', 'file_unique_id': 'fake', 'file_name': document[0]},
+                    'caption': params.get('caption', ''),
+                }
+                queue = self.replies.get(chat_id)
+                if queue is not None:
+                    queue.put_nowait((time.perf_counter(), result['caption']))
+            elif endpoint == 'getFile':
+                file_id = params['file_id']
+                result = {'file_id': file_id, 'file_unique_id': file_id, 'file_size': len(self.files.get(file_id, b'')), 'file_path': f"documents/{file_id}"}
+            elif endpoint == 'getChatMember':
+                user_id = int(params['user_id'])
+                result = {'status': 'member', 'user': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}", 'username': f"user{user_id}"}}
+            else:
+                result = True
+            return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+    return FakeRequest
+
+
+class UpdateFactory:
+    """Membangun Update Telegram sintetis (pesan pribadi) dengan update_id/message_id unik."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _message(self, user_id: int, **fields):
+        from telegram import Update
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': f"User{user_id}"},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}", 'username': f"user{user_id}"},
+        }
+        message.update(fields)
+        return Update.de_json({'update_id': next(self._update_ids), 'message': message}, self.bot)
+
+    def text(self, user_id: int, text: str):
+        if text.startswith('/'):
+            command = text.split()[0]
+            return self._message(user_id, text=text, entities=[{'type': 'bot_command', 'offset': 0, 'length': len(command)}])
+        return self._message(user_id, text=text)
+
+    def location(self, user_id: int, latitude: float, longitude: float):
+        return self._message(user_id, location={'latitude': latitude, 'longitude': longitude})
+
+    def document(self, user_id: int, file_id: str, file_name: str, file_size: int):
+        """Pesan berisi dokumen; isi filenya didaftarkan di FakeRequest.files[file_id]."""
+        return self._message(user_id, document={'file_id': file_id, 'file_unique_id': file_id, 'file_name': file_name, 'file_size': file_size, 'mime_type': 'text/csv'})
+
+
+class LoadTest:
+    def __init__(self, args, application, fake_request):
+        self.args = args
+        self.application = application
+        self.fake_request = fake_request
+        self.updates = UpdateFactory(application.bot)
+        self.latencies = {} # langkah -> list detik
+        self.errors = {} # langkah -> jumlah timeout/balasan gagal
+        self.flows_completed = 0
+        self.updates_sent = 0
+        self._random = random.Random(args.seed)
+        self._new_user_ids = itertools.count(NEW_USER_ID_BASE)
+
+    async def send(self, step: str, user_id: int, update, expect: str = None):
+        """Mengirim satu update lewat update_queue Application dan menunggu balasan bot ke chat pengguna."""
+        queue = self.fake_request.reply_queue(user_id)
+        started = time.perf_counter()
+        self.updates_sent += 1
+        await self.application.update_queue.put(update)
+        try:
+            replied_at, reply = await asyncio.wait_for(queue.get(), timeout=self.args.timeout)
+        except asyncio.TimeoutError:
+            self.errors[step] = self.errors.get(step, 0) + 1
+            return None
+        self.latencies.setdefault(step, []).append(replied_at - started)
+        if expect and expect not in reply:
+            self.errors[step] = self.errors.get(step, 0) + 1
+        return reply
+
+    async def think(self):
+        if self.args.think_ms:
+            await asyncio.sleep(self.args.think_ms / 1000 * self._random.uniform(0.5, 1.5))
+
+    async def checkin_user(self, user_id: int, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        for flow in range(self.args.flows):
+            steps = [
+                ('checkin_start', self.updates.text(user_id, '/checkin'), 'Nama tempat'),
+                ('checkin_location_name', self.updates.text(user_id, f"Outlet {user_id}-{flow}"), 'Wilayah'),
+                ('checkin_region', self.updates.text(user_id, self._random.choice(['Jakarta', 'Bandung', 'Surabaya', 'Medan'])), 'bagikan lokasi'),
+                ('checkin_location', self.updates.location(user_id, -6.2 + self._random.uniform(-0.5, 0.5), 106.8 + self._random.uniform(-0.5, 0.5)), 'Check-in'),
+            ]
+            completed = True
+            for step, update, expect in steps:
+                if await self.send(step, user_id, update, expect) is None:
+                    completed = False
+                    break
+                await self.think()
+            if completed:
+                self.flows_completed += 1
+            else:
+                # Percakapan macet: batalkan agar alur berikutnya mulai dari awal
+                await self.send('cancel', user_id, self.updates.text(user_id, '/cancel'))
+
+    async def admin_user(self, admin_id: int):
+        for _ in range(self.args.admin_ops):
+            choice = self._random.random()
+            if choice < 0.15:
+                new_id = next(self._new_user_ids)
+                await self.send('adduser', admin_id, self.updates.text(admin_id, '/adduser'))
+                await self.send('adduser_process', admin_id, self.updates.text(admin_id, str(new_id)))
+                await self.think()
+                await self.send('removeuser', admin_id, self.updates.text(admin_id, '/removeuser'))
+                await self.send('removeuser_process', admin_id, self.updates.text(admin_id, str(new_id)))
+            else:
+                command = self._random.choice(ADMIN_COMMANDS)
+                await self.send(command.lstrip('/'), admin_id, self.updates.text(admin_id, command))
+            await self.think()
+
+    async def run(self) -> float:
+        tasks = []
+        for i in range(self.args.users):
+            delay = self._random.uniform(0, self.args.ramp_up) if self.args.ramp_up else 0.0
+            tasks.append(self.checkin_user(USER_ID_BASE + i, delay))
+        for i in range(self.args.admins):
+            tasks.append(self.admin_user(ADMIN_ID_BASE + i))
+        started = time.perf_counter()
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+
+def build_report(latencies: dict, errors: dict, elapsed: float, updates_sent: int, extra: dict = None) -> dict:
+    """Ringkasan latensi per langkah (p50/p95/p99/max dalam ms) dan throughput."""
+    steps = {}
+    for step, values in sorted(latencies.items()):
+        values = sorted(values)
+        steps[step] = {
+            'count': len(values),
+            'errors': errors.get(step, 0),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000,
+        }
+    for step, count in errors.items():
+        steps.setdefault(step, {'count': 0, 'errors': count, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0})
+    return {
+        'elapsed_seconds': elapsed,
+        'updates_sent': updates_sent,
+        'updates_per_second': updates_sent / elapsed if elapsed else 0.0,
+        'steps': steps,
+        **(extra or {}),
+    }
+
+
+def print_report(result: dict, header: list):
+    print()
+    for line in header:
+        print(line)
+    print(f"Durasi: {result['elapsed_seconds']:.2f} s | Update: {result['updates_sent']} ({result['updates_per_second']:.1f}/s)")
+    print()
+    print(f"{'langkah':<24}{'jumlah':>8}{'gagal':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, s in result['steps'].items():
+        print(f"{step:<24}{s['count']:>8}{s['errors']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    print()
+    print(f"Panggilan fake Sheets: {result['storage']['calls']}")
+    print(f"Sheets pool: {result['sheets_pool']}")
+    print(f"Update dibuang (antrean per pengguna penuh): {result['updates_dropped']}")
+
+
+async def start_application(bot_module, telegram_latency: float = 0.0):
+    """Membangun dan menjalankan Application bot dengan API Telegram palsu; mengembalikan (application, fake_request)."""
+    from telegram.ext import ApplicationBuilder
+
+    FakeRequest = make_fake_request_class()
+    fake_request = FakeRequest(latency=telegram_latency)
+    builder = (
+        ApplicationBuilder()
+        .token(bot_module.TELEGRAM_TOKEN)
+        .request(fake_request)
+        .get_updates_request(FakeRequest())
+        .updater(None)
+    )
+    application = bot_module.build_application(builder)
+
+    await application.initialize()
+    await bot_module.on_startup(application) # post_init hanya dipanggil oleh run_webhook/run_polling
+    await application.start()
+    return application, fake_request
+
+
+async def stop_application(bot_module, application):
+    await application.stop()
+    await bot_module.on_shutdown(application)
+    await application.shutdown()
+
+
+def backend_stats(bot_module, fake_request) -> dict:
+    return {
+        'storage': bot_module.storage_backend.stats(),
+        'sheets_pool': bot_module.sheets_pool.stats(),
+        'updates_dropped': bot_module.update_processor.dropped,
+        'telegram_calls': dict(fake_request.calls),
+    }
+
+
+async def run_load_test(args, bot_module) -> dict:
+    application, fake_request = await start_application(bot_module, args.telegram_latency_ms / 1000)
+    try:
+        loadtest = LoadTest(args, application, fake_request)
+        elapsed = await loadtest.run()
+    finally:
+        await stop_application(bot_module, application)
+
+    return build_report(loadtest.latencies, loadtest.errors, elapsed, loadtest.updates_sent, {
+        'flows_completed': loadtest.flows_completed,
+        'flows_per_second': loadtest.flows_completed / elapsed if elapsed else 0.0,
+        **backend_stats(bot_module, fake_request),
+    })
+
+
+def seed_users(bot_module, admin_ids: list, user_ids: list):
+    """Mendaftarkan pengguna dan admin simulasi di lembar 'Users' fake Sheets lalu memuat peran."""
+    storage = bot_module.storage_backend
+    latency, error_rate = storage.latency, storage.error_rate
+    storage.latency, storage.error_rate = 0.0, 0.0 # Persiapan data tidak ikut diukur atau digagalkan
+    try:
+        bot_module.load_user_roles() # Memuat header agar build_row tahu urutan kolom
+        rows = [bot_module.user_table.build_row({'user_id': str(i), 'role': 'admin', 'first_name': f"Admin{i}"}) for i in admin_ids]
+        rows += [bot_module.user_table.build_row({'user_id': str(i), 'role': 'user', 'first_name': f"User{i}"}) for i in user_ids]
+        if rows:
+            storage.run("Users", lambda ws: ws.append_rows(rows))
+        bot_module.load_user_roles()
+        storage.calls.clear()
+    finally:
+        storage.latency, storage.error_rate = latency, error_rate
+
+
+def finish(result: dict, args, header: list) -> int:
+    """Mencetak laporan, menulis JSON bila diminta, dan mengembalikan kode keluar."""
+    print_report(result, header)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, default=str)
+
+    failed = sum(s['errors'] for s in result['steps'].values())
+    if failed:
+        print(f"GAGAL: {failed} langkah timeout atau mendapat balasan tak terduga.")
+        return 1
+    if args.max_p95_ms is not None:
+        slow = [step for step, s in result['steps'].items() if s['p95_ms'] > args.max_p95_ms]
+        if slow:
+            print(f"GAGAL: p95 melebihi {args.max_p95_ms} ms untuk langkah: {', '.join(slow)}")
+            return 1
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix='loadtest-') as workdir:
+        configure_environment(args, workdir)
+        import bot as bot_module
+
+        logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+        seed_users(bot_module, [ADMIN_ID_BASE + i for i in range(args.admins)], [USER_ID_BASE + i for i in range(args.users)])
+
+        # Objek asyncio di bot.py dibuat saat impor dan terikat ke event loop default
+        loop = asyncio.get_event_loop()
+        result = loop.run_until_complete(run_load_test(args, bot_module))
+
+    return finish(result, args, [
+        f"Pengguna: {args.users} x {args.flows} alur, admin: {args.admins} x {args.admin_ops} operasi, "
+        f"latensi fake Sheets: {args.sheets_latency_ms} ms, error rate: {args.sheets_error_rate}",
+        f"Alur check-in selesai: {result['flows_completed']} ({result['flows_per_second']:.1f}/s)",
+    ])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
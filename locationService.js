@@ -45,5 +45,6 @@ const saveToIndexedDB = async (data) => {
       db.createObjectStore('unsaved', { keyPath: 'id', autoIncrement: true });
     }
   });
-  await db.add('unsaved', data);
+  // client_id unik per titik: server memakainya untuk mendeteksi kiriman ulang saat sinkronisasi batch
+  await db.add('unsaved', { ...data, client_id: data.client_id || crypto.randomUUID() });
 };
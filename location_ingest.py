@@ -0,0 +1,331 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+from checkin_journal import CheckinJournal
+from resilience import CircuitBreaker, is_rejected
+from storage import WorksheetMissing
+
+logger = logging.getLogger(__name__)
+
+LOCATIONS_SHEET = "Locations"
+# Kunci idempotensi (client_id) sengaja di kolom terakhir, seperti checkin_id di 'Check-in Data'
+LOCATION_HEADERS = ['latitude', 'longitude', 'timestamp', 'device', 'received_at', 'client_id']
+
+MAX_CLIENT_ID_LENGTH = 128
+MAX_TEXT_LENGTH = 200
+
+STATUS_STORED = 'stored' # Tertulis ke penyimpanan pada permintaan ini
+STATUS_DUPLICATE = 'duplicate' # client_id sudah pernah diterima (kiriman ulang)
+STATUS_QUEUED = 'queued' # Tercatat di jurnal, akan ditulis pada permintaan berikutnya
+STATUS_INVALID = 'invalid'
+
+
+class BatchFormatError(ValueError):
+    """Body permintaan tidak bisa dibaca sebagai array JSON atau NDJSON."""
+
+
+def parse_batch(body, content_type: str = '') -> list:
+    """
+    Membaca body menjadi list item. Menerima array JSON, objek {"locations": [...]}, atau
+    NDJSON (satu objek per baris; `body` boleh iterable baris, misalnya request.stream).
+    Baris NDJSON yang rusak tetap menjadi item (string mentah) agar dilaporkan per item.
+    """
+    if 'ndjson' in (content_type or ''):
+        lines = body.splitlines() if isinstance(body, (bytes, str)) else body
+        items = []
+        for line in lines:
+            line = line.decode('utf-8', 'replace') if isinstance(line, bytes) else line
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                items.append(line.strip())
+        return items
+    try:
+        data = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError, TypeError) as e:
+        raise BatchFormatError(f"Body bukan JSON yang valid: {e}")
+    if isinstance(data, dict) and isinstance(data.get('locations'), list):
+        data = data['locations']
+    if not isinstance(data, list):
+        raise BatchFormatError("Body harus berupa array lokasi, {\"locations\": [...]}, atau NDJSON.")
+    return data
+
+
+def _coordinate(item: dict, *names):
+    """Nilai koordinat pertama yang ada di item (format datar atau {"location": {...}})."""
+    location = item.get('location') if isinstance(item.get('location'), dict) else {}
+    for name in names:
+        for source in (item, location):
+            if source.get(name) is not None:
+                return source[name]
+    return None
+
+
+def _to_float(value) -> float:
+    if isinstance(value, bool):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _text(value) -> str:
+    return '' if value is None else str(value)[:MAX_TEXT_LENGTH]
+
+
+def client_key(item: dict, latitude: float, longitude: float, timestamp: str, device: str) -> str:
+    """client_id dari klien; jika tidak ada, hash isi item agar kiriman ulang yang identik tetap terdeteksi."""
+    client_id = item.get('client_id')
+    if client_id is not None and str(client_id).strip():
+        return str(client_id).strip()
+    digest = hashlib.sha1(json.dumps([latitude, longitude, timestamp, device]).encode('utf-8')).hexdigest()
+    return f"auto-{digest[:20]}"
+
+
+def validate_batch(items: list):
+    """
+    Memvalidasi semua item sekaligus: koordinat dikumpulkan ke array numpy lalu diperiksa
+    (angka hingga, dalam rentang, bukan 0,0) dalam satu operasi vektor.
+    Mengembalikan (valid, errors): valid = [(index, client_id, row)], errors = {index: pesan}.
+    """
+    count = len(items)
+    is_object = np.fromiter((isinstance(item, dict) for item in items), dtype=bool, count=count)
+    lat = np.fromiter((_to_float(_coordinate(item, 'latitude', 'lat')) if isinstance(item, dict) else np.nan for item in items), dtype=float, count=count)
+    lng = np.fromiter((_to_float(_coordinate(item, 'longitude', 'lng', 'lon')) if isinstance(item, dict) else np.nan for item in items), dtype=float, count=count)
+
+    with np.errstate(invalid='ignore'):
+        finite = np.isfinite(lat) & np.isfinite(lng)
+        in_range = finite & (np.abs(lat) <= 90) & (np.abs(lng) <= 180)
+    null_island = (lat == 0) & (lng == 0)
+    ok = is_object & in_range & ~null_island
+
+    errors = {}
+    for index in np.flatnonzero(~ok):
+        if not is_object[index]:
+            errors[int(index)] = "Item harus berupa objek JSON."
+        elif not finite[index]:
+            errors[int(index)] = "Latitude dan longitude diperlukan dan harus berupa angka."
+        elif not in_range[index]:
+            errors[int(index)] = "Latitude harus di antara -90..90 dan longitude di antara -180..180."
+        else:
+            errors[int(index)] = "Koordinat 0,0 ditolak (GPS belum mendapat posisi)."
+
+    received_at = datetime.now(pytz.timezone('Asia/Jakarta')).strftime("%Y-%m-%d %H:%M:%S")
+    valid = []
+    for index in np.flatnonzero(ok):
+        item = items[index]
+        metadata = item.get('metadata') if isinstance(item.get('metadata'), dict) else {}
+        timestamp = _text(item.get('timestamp', metadata.get('timestamp')))
+        device = _text(item.get('device', metadata.get('device')))
+        latitude, longitude = float(lat[index]), float(lng[index])
+        key = client_key(item, latitude, longitude, timestamp, device)
+        if len(key) > MAX_CLIENT_ID_LENGTH:
+            errors[int(index)] = f"client_id maksimal {MAX_CLIENT_ID_LENGTH} karakter."
+            continue
+        row = [latitude, longitude, timestamp, device, received_at, key]
+        valid.append((int(index), key, row))
+    return valid, errors
+
+
+class LocationIngestor:
+    """
+    Menerima batch lokasi dari aplikasi (sinkronisasi offline) dan menulisnya ke lembar
+    'Locations' di backend penyimpanan yang sama dengan bot, dalam satu append_rows.
+    Setiap item dicatat dulu di jurnal dengan kunci client_id, sehingga kiriman ulang
+    terdeteksi sebagai duplikat dan item yang gagal ditulis ikut terkirim pada batch berikutnya.
+    Entri tertunda diklaim di jurnal (claim_pending) sebelum dikirim, sehingga beberapa thread atau
+    worker tidak mengirim entri yang sama tanpa perlu memegang lock selama panggilan ke Sheets.
+    """
+
+    def __init__(self, storage, journal: CheckinJournal, max_pending_retry: int = 500, claim_lease: float = 120.0):
+        self.storage = storage
+        self.journal = journal
+        self.max_pending_retry = max_pending_retry
+        self.claim_lease = claim_lease # Detik; lebih lama dari panggilan Sheets terlama termasuk retry
+
+    def ingest(self, items: list) -> dict:
+        """Memproses satu batch (blocking). Mengembalikan {'results': [...], 'summary': {...}}."""
+        results, new_ids = self._record(items)
+        written_ids, error = self._flush()
+        written_ids |= self._sent_elsewhere(new_ids, written_ids)
+        return self._summarize(results, new_ids, written_ids, error)
+
+    async def ingest_async(self, items: list, sheets_pool, journal_pool) -> dict:
+        """
+        Seperti ingest() untuk kode async: jurnal diakses lewat `journal_pool` (BlockingCallPool) dan
+        panggilan Sheets lewat `sheets_pool` (ResilientPool, dengan retry dan circuit breaker). Saat
+        breaker terbuka, Sheets tidak dihubungi sama sekali dan item baru dilaporkan 'queued'.
+        """
+        results, new_ids = await journal_pool.run(self._record, items)
+        if sheets_pool.breaker.state == CircuitBreaker.OPEN:
+            written_ids, error = set(), "Google Sheets sedang tidak sehat; lokasi ditulis pada batch berikutnya."
+        else:
+            written_ids, error = await self._flush_async(sheets_pool, journal_pool)
+        written_ids |= await journal_pool.run(self._sent_elsewhere, new_ids, written_ids)
+        return self._summarize(results, new_ids, written_ids, error)
+
+    def _record(self, items: list):
+        """Validasi dan pencatatan jurnal (tanpa Sheets). Mengembalikan (results, {entry_id: (index, client_id)})."""
+        valid, errors = validate_batch(items)
+        results = [None] * len(items)
+        for index, message in errors.items():
+            results[index] = {'index': index, 'status': STATUS_INVALID, 'error': message}
+
+        # Duplikat di dalam batch yang sama: hanya kemunculan pertama yang dicatat
+        first_by_key = {}
+        unique = []
+        for index, key, row in valid:
+            if key in first_by_key:
+                results[index] = {'index': index, 'client_id': key, 'status': STATUS_DUPLICATE}
+                continue
+            first_by_key[key] = index
+            unique.append((index, key, row))
+
+        journaled = self.journal.append_many([(key, LOCATIONS_SHEET, row) for _, key, row in unique])
+        new_ids = {}
+        for (index, key, _), (entry_id, inserted) in zip(unique, journaled):
+            if inserted:
+                new_ids[entry_id] = (index, key)
+            else:
+                results[index] = {'index': index, 'client_id': key, 'status': STATUS_DUPLICATE}
+        return results, new_ids
+
+    def _sent_elsewhere(self, new_ids: dict, written_ids: set) -> set:
+        """Entri baru dari batch ini yang tertulis oleh pengirim lain (thread atau worker yang mengklaimnya lebih dulu)."""
+        return self.journal.sent_ids([entry_id for entry_id in new_ids if entry_id not in written_ids])
+
+    @staticmethod
+    def _summarize(results: list, new_ids: dict, written_ids: set, error) -> dict:
+        for entry_id, (index, key) in new_ids.items():
+            if entry_id in written_ids:
+                results[index] = {'index': index, 'client_id': key, 'status': STATUS_STORED}
+            else:
+                results[index] = {'index': index, 'client_id': key, 'status': STATUS_QUEUED, 'error': error}
+
+        summary = {status: 0 for status in (STATUS_STORED, STATUS_DUPLICATE, STATUS_QUEUED, STATUS_INVALID)}
+        for result in results:
+            summary[result['status']] += 1
+        summary['total'] = len(results)
+        return {'results': results, 'summary': summary}
+
+    def _run(self, func):
+        """
+        storage.run() pada worksheet 'Locations'. Backend 'sheets' tidak membuat worksheet dari
+        default_headers, jadi saat belum ada worksheet dibuat dengan header lalu panggilan diulang.
+        """
+        try:
+            return self.storage.run(LOCATIONS_SHEET, func)
+        except WorksheetMissing:
+            self.storage.add_worksheet(LOCATIONS_SHEET, LOCATION_HEADERS)
+            logger.info(f"Worksheet '{LOCATIONS_SHEET}' belum ada; dibuat dengan header {LOCATION_HEADERS}.")
+            return self.storage.run(LOCATIONS_SHEET, func)
+
+    def _claim(self) -> list:
+        return self.journal.claim_pending(limit=self.max_pending_retry, sheet=LOCATIONS_SHEET, lease=self.claim_lease)
+
+    def _skip_written(self, entries: list, existing: set, written: set) -> list:
+        """Menandai terkirim entri yang kuncinya sudah ada di sheet; mengembalikan sisanya."""
+        already = [entry for entry in entries if entry.idempotency_key in existing]
+        self.journal.mark_sent([entry.id for entry in already])
+        written.update(entry.id for entry in already)
+        return [entry for entry in entries if entry.idempotency_key not in existing]
+
+    def _mark_written(self, entries: list, written: set):
+        self.journal.mark_sent([entry.id for entry in entries])
+        written.update(entry.id for entry in entries)
+        logger.info(f"{len(entries)} lokasi ditulis ke '{LOCATIONS_SHEET}'.")
+
+    def _record_failure(self, entries: list, error: Exception) -> str:
+        logger.warning(f"Gagal menulis {len(entries)} lokasi ke '{LOCATIONS_SHEET}', dicoba lagi pada batch berikutnya: {error}")
+        self.journal.record_failure([entry.id for entry in entries], str(error), not is_rejected(error))
+        return str(error)
+
+    def _flush(self):
+        """
+        Menulis semua entri 'Locations' yang belum terkirim (termasuk sisa batch sebelumnya)
+        dengan satu append_rows. Mengembalikan (set entry_id yang tertulis, pesan error atau None).
+        """
+        entries = self._claim()
+        if not entries:
+            return set(), None
+        written = set()
+        try:
+            if any(entry.attempts for entry in entries):
+                # Percobaan sebelumnya tidak pasti: lewati baris yang ternyata sudah tertulis
+                existing = set(self._run(lambda ws: ws.col_values(len(LOCATION_HEADERS))))
+                entries = self._skip_written(entries, existing, written)
+            if entries:
+                rows = [entry.row for entry in entries]
+                self._run(lambda ws: ws.append_rows(rows))
+                self._mark_written(entries, written)
+            return written, None
+        except Exception as e:
+            return set(), self._record_failure(entries, e)
+
+    async def _flush_async(self, sheets_pool, journal_pool):
+        """Seperti _flush(); col_values diulang sebagai panggilan idempoten, append_rows hanya untuk 429."""
+        entries = await journal_pool.run(self._claim)
+        if not entries:
+            return set(), None
+        written = set()
+        try:
+            if any(entry.attempts for entry in entries):
+                existing = set(await sheets_pool.call("col_values", self._run, lambda ws: ws.col_values(len(LOCATION_HEADERS)), idempotent=True))
+                entries = await journal_pool.run(self._skip_written, entries, existing, written)
+            if entries:
+                rows = [entry.row for entry in entries]
+                await sheets_pool.call("append_rows", self._run, lambda ws: ws.append_rows(rows))
+                await journal_pool.run(self._mark_written, entries, written)
+            return written, None
+        except Exception as e:
+            return set(), await journal_pool.run(self._record_failure, entries, e)
+
+
+def _read_batch(body, content_type: str, max_items: int):
+    """Mengembalikan (items, None), atau (None, (kode status HTTP, payload)) jika body ditolak."""
+    try:
+        items = parse_batch(body, content_type)
+    except BatchFormatError as e:
+        return None, (400, {"error": str(e)})
+    if len(items) > max_items:
+        return None, (413, {"error": f"Maksimal {max_items} item per batch, diterima {len(items)}."})
+    return items, None
+
+
+def handle_batch(ingestor: LocationIngestor, body, content_type: str, max_items: int):
+    """
+    Logika endpoint batch yang dipakai app.py (Flask). Mengembalikan (kode status HTTP, payload JSON).
+    Blocking; kode async memakai handle_batch_async().
+    """
+    items, rejected = _read_batch(body, content_type, max_items)
+    if rejected:
+        return rejected
+    try:
+        result = ingestor.ingest(items)
+    except Exception as e:
+        logger.error(f"Gagal memproses batch {len(items)} lokasi: {e}")
+        return 500, {"error": str(e)}
+    logger.info(f"Batch lokasi diproses: {result['summary']}")
+    return 200, {"status": "success", **result}
+
+
+async def handle_batch_async(ingestor: LocationIngestor, body, content_type: str, max_items: int, sheets_pool, journal_pool):
+    """Seperti handle_batch() untuk asgi.py (Starlette); lihat LocationIngestor.ingest_async()."""
+    items, rejected = await journal_pool.run(_read_batch, body, content_type, max_items)
+    if rejected:
+        return rejected
+    try:
+        result = await ingestor.ingest_async(items, sheets_pool, journal_pool)
+    except Exception as e:
+        logger.error(f"Gagal memproses batch {len(items)} lokasi: {e}")
+        return 500, {"error": str(e)}
+    logger.info(f"Batch lokasi diproses: {result['summary']}")
+    return 200, {"status": "success", **result}
@@ -1,21 +1,44 @@
-// Sync otomatis saat online
+// Jumlah titik maksimal per permintaan (sesuaikan dengan MAX_BATCH_ITEMS di server)
+const SYNC_BATCH_SIZE = 500;
+
+// Sync otomatis saat online: seluruh antrean dikirim per batch, bukan satu POST per titik
 window.addEventListener('online', async () => {
   const db = await openDB('LocationCache', 1);
-  const tx = db.transaction('unsaved', 'readwrite');
-  const store = tx.objectStore('unsaved');
-  
-  let cursor = await store.openCursor();
-  while (cursor) {
+  const entries = await db.getAll('unsaved');
+
+  for (let start = 0; start < entries.length; start += SYNC_BATCH_SIZE) {
+    const batch = entries.slice(start, start + SYNC_BATCH_SIZE);
     try {
-      await fetch('https://your-app.koyeb.app/api/locations', {
+      const response = await fetch('https://your-app.koyeb.app/api/locations/batch', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(cursor.value)
+        body: JSON.stringify(batch.map(({ id, location, metadata, client_id }) => ({
+          // Data lama tanpa client_id: pakai id IndexedDB (server juga mendeteksi duplikat dari isi titik)
+          client_id: client_id || `idb-${metadata?.device || 'unknown'}-${id}-${metadata?.timestamp || ''}`,
+          latitude: location?.lat,
+          longitude: location?.lng,
+          timestamp: metadata?.timestamp,
+          device: metadata?.device
+        })))
       });
-      await cursor.delete();
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      const { results } = await response.json();
+
+      // stored/duplicate/queued sudah aman di server; invalid tidak akan pernah diterima, jadi ikut dibuang
+      const tx = db.transaction('unsaved', 'readwrite');
+      results.forEach((result) => {
+        const entry = batch[result.index];
+        if (result.status === 'invalid') {
+          console.warn('Titik lokasi ditolak server:', entry, result.error);
+        }
+        tx.store.delete(entry.id);
+      });
+      await tx.done;
     } catch (error) {
       console.error('Sync failed:', error);
+      break; // Sisa antrean dicoba lagi saat online berikutnya
     }
-    cursor = await cursor.continue();
   }
 });
@@ -0,0 +1,132 @@
+import logging
+import re
+import threading
+
+import numpy as np
+
+from checkin_cache import parse_days, today_day
+from storage import SheetTailReader
+
+logger = logging.getLogger(__name__)
+
+LEGACY_CHECKIN_SHEET = "Check-in Data" # Worksheet tunggal sebelum partisi bulanan; tetap dibaca
+_PARTITION_TITLE = re.compile(r"^Check-in (\d{4}-\d{2})$")
+
+
+def partition_title(month: str) -> str:
+    """Nama worksheet partisi untuk bulan 'YYYY-MM', misalnya 'Check-in 2026-10'."""
+    return f"Check-in {month}"
+
+
+def partition_month(title: str):
+    """Bulan 'YYYY-MM' dari nama worksheet partisi, atau None jika bukan partisi."""
+    match = _PARTITION_TITLE.match(title)
+    return match.group(1) if match else None
+
+
+def day_to_month(day: int) -> str:
+    return str(np.datetime64(int(day), 'D').astype('datetime64[M]'))
+
+
+def is_checkin_sheet(title: str) -> bool:
+    return title == LEGACY_CHECKIN_SHEET or partition_month(title) is not None
+
+
+class CheckinPartitions:
+    """
+    Worksheet check-in per bulan (GMT+7, sama dengan tanggal di /rekap): baris masuk ke
+    'Check-in YYYY-MM' sesuai timestamp-nya, dan worksheet bulan baru dibuat dengan header saat
+    baris pertamanya ditulis. 'Check-in Data' lama tetap ikut dibaca. Daftar worksheet di-cache
+    agar penulisan biasa tidak butuh panggilan metadata. Blocking: jalankan lewat BlockingCallPool.
+    """
+
+    def __init__(self, storage, header: list, enabled: bool = True):
+        self.storage = storage
+        self.header = header
+        self.enabled = enabled
+        self._known = None # Nama worksheet check-in yang diketahui ada
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def sheet_for(self, timestamp: str) -> str:
+        """Worksheet tujuan untuk baris check-in dengan timestamp (UTC) tersebut."""
+        if not self.enabled:
+            return LEGACY_CHECKIN_SHEET
+        day = int(parse_days([timestamp])[0])
+        return partition_title(day_to_month(day if day >= 0 else today_day()))
+
+    def titles(self, refresh: bool = False) -> list:
+        """Worksheet check-in yang ada: 'Check-in Data' (jika ada) lalu partisi urut bulan."""
+        with self._lock:
+            if self._known is None or refresh:
+                self._known = {title for title in self.storage.worksheet_titles() if is_checkin_sheet(title)}
+            known = set(self._known)
+        partitions = sorted(title for title in known if title != LEGACY_CHECKIN_SHEET)
+        return ([LEGACY_CHECKIN_SHEET] if LEGACY_CHECKIN_SHEET in known else []) + partitions
+
+    def titles_for_days(self, start_day: int = None, end_day: int = None) -> list:
+        """Worksheet yang mungkin berisi check-in dalam rentang hari (inklusif); sheet lama selalu ikut."""
+        first = day_to_month(start_day) if start_day is not None else None
+        last = day_to_month(end_day) if end_day is not None else None
+        selected = []
+        for title in self.titles(refresh=True):
+            month = partition_month(title)
+            if month is None or ((first is None or month >= first) and (last is None or month <= last)):
+                selected.append(title)
+        return selected
+
+    def ensure(self, title: str):
+        """Membuat worksheet partisi `title` dengan header jika belum ada (rollover bulan)."""
+        if partition_month(title) is None:
+            return
+        with self._lock:
+            if self._known is not None and title in self._known:
+                return
+            existing = set(self.storage.worksheet_titles())
+            if title not in existing:
+                self.storage.add_worksheet(title, self.header)
+                self.created += 1
+                logger.info(f"Worksheet partisi '{title}' dibuat untuk check-in bulan {partition_month(title)}.")
+            self._known = {t for t in existing if is_checkin_sheet(t)} | {title}
+
+    def forget(self, title: str):
+        """Membuang `title` dari cache (misalnya worksheet dihapus manual) agar dibuat ulang saat ditulis."""
+        with self._lock:
+            if self._known is not None:
+                self._known.discard(title)
+
+
+class PartitionedTailReader:
+    """
+    SheetTailReader untuk semua worksheet check-in. Setelah pembacaan pertama, partisi yang bulannya
+    sudah lewat lebih dari `open_months` bulan tidak dibaca lagi (tidak ada lagi check-in baru ke sana),
+    sehingga setiap putaran hanya memeriksa partisi yang masih aktif.
+    """
+
+    def __init__(self, partitions: CheckinPartitions, last_column: str, open_months: int = 2, chunk_rows: int = 10000):
+        self.partitions = partitions
+        self.last_column = last_column
+        self.open_months = max(1, open_months)
+        self.chunk_rows = chunk_rows
+        self._readers = {}
+        self._lock = threading.Lock()
+
+    def _closed(self, title: str) -> bool:
+        month = partition_month(title)
+        if month is None:
+            return False
+        current = np.datetime64(day_to_month(today_day()), 'M')
+        return np.datetime64(month, 'M') <= current - self.open_months
+
+    def read_new(self) -> list:
+        """Baris baru sejak pembacaan terakhir dari semua worksheet, sebagai list (worksheet, nomor_baris, nilai)."""
+        with self._lock:
+            result = []
+            for title in self.partitions.titles(refresh=True):
+                reader = self._readers.get(title)
+                if reader is None:
+                    reader = self._readers[title] = SheetTailReader(self.partitions.storage, title, self.last_column, chunk_rows=self.chunk_rows)
+                elif self._closed(title):
+                    continue
+                result.extend((title, row_number, row) for row_number, row in reader.read_new())
+            return result
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+from collections import deque
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Prioritas lewat rate_limit_args (angka kecil didahulukan); tanpa rate_limit_args = PRIORITY_INTERACTIVE
+PRIORITY_INTERACTIVE = 0 # Balasan langsung ke input pengguna (check-in, perintah)
+PRIORITY_NOTIFICATION = 1 # Notifikasi kelola pengguna
+PRIORITY_BROADCAST = 2 # /broadcast dan pengiriman massal lain
+PRIORITY_NAMES = ('interactive', 'notification', 'broadcast')
+
+
+class TokenBucket:
+    """Token bucket: `rate` token per detik, paling banyak `capacity` token tersimpan (burst)."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Detik sampai satu token tersedia (0 jika sudah ada)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Pending:
+    __slots__ = ('chat_id', 'future', 'enqueued_at')
+
+    def __init__(self, chat_id, future, enqueued_at):
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """
+    Rate limiter PTB untuk semua request keluar: token bucket global dan per chat (grup memakai
+    batas per menit yang lebih ketat), dengan antrean per prioritas. Request yang siap diberi giliran
+    mulai dari prioritas tertinggi; request yang bucket chat-nya kosong dilewati tanpa menahan chat
+    lain, sehingga broadcast ribuan pesan tetap berjalan secepat batas mengizinkan tanpa menunda
+    balasan interaktif. RetryAfter dari Telegram menjeda semua pengiriman selama waktu yang diminta
+    lalu request diulang. Rate 0 berarti tanpa batas untuk bucket tersebut.
+    """
+
+    def __init__(self, global_rate: float = 25.0, chat_rate: float = 1.0, chat_burst: float = 3.0, group_rate_per_minute: float = 20.0, max_retries: int = 3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_minute / 60
+        self.max_retries = max(0, max_retries)
+        self._lanes = [deque() for _ in PRIORITY_NAMES]
+        self._global = None
+        self._chats = {} # chat_id -> TokenBucket; bucket yang penuh (chat menganggur) dibuang berkala
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._dispatcher = None
+        self._last_prune = 0.0
+        self.sent = [0] * len(PRIORITY_NAMES)
+        self.retry_after_total = 0
+        self.on_wait = None # Opsional: fungsi (nama_prioritas, detik_menunggu) untuk metrik
+
+    async def initialize(self) -> None:
+        if self._dispatcher:
+            return
+        loop = asyncio.get_running_loop()
+        self._global = TokenBucket(self.global_rate, self.global_rate, loop.time()) if self.global_rate > 0 else None
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._run())
+        logger.info(f"Rate limiter keluar aktif: global {self.global_rate}/detik, per chat {self.chat_rate}/detik (burst {self.chat_burst}), grup {self.group_rate * 60:.0f}/menit.")
+
+    async def shutdown(self) -> None:
+        if not self._dispatcher:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+        for lane in self._lanes:
+            while lane:
+                pending = lane.popleft()
+                if not pending.future.done():
+                    pending.future.set_exception(RuntimeError("Rate limiter dihentikan."))
+
+    def queue_depths(self) -> dict:
+        """Jumlah request yang menunggu giliran per nama prioritas."""
+        return {name: len(lane) for name, lane in zip(PRIORITY_NAMES, self._lanes)}
+
+    @staticmethod
+    def _priority(rate_limit_args) -> int:
+        if isinstance(rate_limit_args, int) and 0 <= rate_limit_args < len(PRIORITY_NAMES):
+            return rate_limit_args
+        return PRIORITY_INTERACTIVE
+
+    def _chat_bucket(self, chat_id, now: float):
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0) # Grup/channel
+            rate, burst = (self.group_rate, 1.0) if is_group else (self.chat_rate, self.chat_burst)
+            if rate <= 0:
+                return None
+            bucket = self._chats[chat_id] = TokenBucket(rate, burst, now)
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = self._priority(rate_limit_args)
+        chat_id = data.get('chat_id') if data else None
+        attempt = 0
+        while True:
+            await self._acquire(priority, chat_id)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+                self.retry_after_total += 1
+                loop = asyncio.get_running_loop()
+                self._paused_until = max(self._paused_until, loop.time() + retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"Telegram meminta jeda {retry_after:.0f} detik ({endpoint} ke {chat_id}); semua pengiriman ditunda, percobaan ulang ke-{attempt}.")
+
+    async def _acquire(self, priority: int, chat_id):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None: # Belum di-initialize (misalnya dipakai di luar Application)
+            return
+        future = loop.create_future()
+        enqueued_at = loop.time()
+        self._lanes[priority].append(_Pending(chat_id, future, enqueued_at))
+        self._wakeup.set()
+        await future
+        if self.on_wait:
+            self.on_wait(PRIORITY_NAMES[priority], loop.time() - enqueued_at)
+
+    def _dispatch(self, now: float):
+        """Memberi giliran sebanyak yang diizinkan bucket. Mengembalikan detik sampai perlu dicek lagi, atau None jika antrean kosong."""
+        if now < self._paused_until:
+            return self._paused_until - now if any(self._lanes) else None
+        next_check = None
+        for priority, lane in enumerate(self._lanes):
+            skipped = []
+            while lane:
+                if self._global is not None:
+                    wait = self._global.wait_time(now)
+                    if wait > 0:
+                        lane.extendleft(reversed(skipped))
+                        return wait if next_check is None else min(wait, next_check)
+                pending = lane.popleft()
+                if pending.future.done(): # Pemanggil sudah dibatalkan
+                    continue
+                bucket = self._chat_bucket(pending.chat_id, now)
+                if bucket is not None:
+                    wait = bucket.wait_time(now)
+                    if wait > 0:
+                        skipped.append(pending)
+                        next_check = wait if next_check is None else min(wait, next_check)
+                        continue
+                    bucket.take()
+                if self._global is not None:
+                    self._global.take()
+                self.sent[priority] += 1
+                pending.future.set_result(None)
+            lane.extendleft(reversed(skipped))
+        return next_check
+
+    def _prune(self, now: float):
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        waiting = {pending.chat_id for lane in self._lanes for pending in lane}
+        for chat_id in [c for c, bucket in self._chats.items() if c not in waiting and bucket.full(now)]:
+            del self._chats[chat_id]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            now = loop.time()
+            delay = self._dispatch(now)
+            self._prune(now)
+            try:
+                if delay is None:
+                    await self._wakeup.wait()
+                else:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
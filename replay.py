@@ -0,0 +1,206 @@
+"""
+Memutar ulang update yang direkam bot (CAPTURE_UPDATES_DIR) lewat Application dan handler asli,
+dengan backend penyimpanan 'memory' (fake Sheets) dan API Telegram palsu, lalu mencetak laporan
+latensi/throughput yang sama dengan loadtest.py sehingga hasil antar versi bisa dibandingkan.
+
+Update dari pengguna yang sama dikirim berurutan (update berikutnya menunggu yang sebelumnya
+selesai), update dari pengguna berbeda berjalan paralel. Dengan --speed 1 jeda asli antar
+update dipertahankan; --fast mengirim secepat mungkin.
+
+Contoh:
+    python replay.py captures/ --fast --json pagi-buruk.json
+    python replay.py captures/updates.ndjson.3.gz --speed 2 --sheets-latency-ms 300
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+
+from loadtest import (
+    add_backend_arguments,
+    backend_stats,
+    build_report,
+    configure_environment,
+    finish,
+    seed_users,
+    start_application,
+    stop_application,
+)
+from update_capture import read_capture
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Putar ulang rekaman update bot terhadap fake Sheets.")
+    parser.add_argument('paths', nargs='+', help="File rekaman (.ndjson / .ndjson.N.gz) atau direktori CAPTURE_UPDATES_DIR")
+    parser.add_argument('--speed', type=float, default=1.0, help="Pengali kecepatan terhadap jeda asli (2 = dua kali lebih cepat)")
+    parser.add_argument('--fast', action='store_true', help="Abaikan jeda asli, kirim secepat mungkin")
+    parser.add_argument('--limit', type=int, default=None, help="Hanya putar N update pertama")
+    parser.add_argument('--reply-grace', type=float, default=None,
+                        help="Lama menunggu balasan setelah handler selesai (detik); default CHECKIN_CONFIRM_TIMEOUT + 1")
+    add_backend_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def load_records(paths: list, limit: int = None) -> list:
+    records = []
+    for path in paths:
+        records.extend(read_capture(path))
+    records.sort(key=lambda r: r['t'])
+    return records[:limit] if limit else records
+
+
+def sender_id(update_data: dict):
+    """ID pengirim/chat dari update mentah; dipakai untuk mengelompokkan urutan per pengguna."""
+    for value in update_data.values():
+        if isinstance(value, dict):
+            sender = value.get('from') or value.get('chat')
+            if isinstance(sender, dict) and 'id' in sender:
+                return sender['id']
+    return None
+
+
+def step_label(update) -> str:
+    message = update.effective_message
+    if message is None:
+        return 'other'
+    if message.text and message.text.startswith('/'):
+        return message.text.split()[0].split('@')[0].lstrip('/')
+    if message.location:
+        return 'location'
+    if message.text:
+        return 'text'
+    return 'other'
+
+
+def roles_from_records(records: list):
+    """(owner_id, admin_ids, user_ids) dari peran yang dicatat saat perekaman."""
+    owner_id, admins, users = None, set(), set()
+    for record in records:
+        uid = sender_id(record['update'])
+        role = record.get('role')
+        if uid is None or not role:
+            continue
+        if role == 'owner':
+            owner_id = uid
+        elif role == 'admin':
+            admins.add(uid)
+        else:
+            users.add(uid)
+    return owner_id, sorted(admins), sorted(users - admins)
+
+
+class Replay:
+    def __init__(self, args, application, fake_request, reply_grace: float):
+        self.args = args
+        self.application = application
+        self.fake_request = fake_request
+        self.reply_grace = reply_grace
+        self.latencies = {}
+        self.errors = {}
+        self.no_reply = {} # langkah -> update yang selesai diproses tanpa balasan
+        self.updates_sent = 0
+
+    async def dispatch(self, update):
+        """
+        Memproses satu update lewat update processor Application (jalur yang sama dengan webhook).
+        Latensi = sampai balasan pertama bot ke chat tersebut; jika tidak ada balasan dalam
+        reply_grace setelah handler selesai, dipakai durasi pemrosesan handler.
+        """
+        label = step_label(update)
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        queue = self.fake_request.reply_queue(chat_id) if chat_id is not None else None
+        while queue is not None and not queue.empty():
+            queue.get_nowait() # Balasan terlambat milik update sebelumnya
+
+        started = time.perf_counter()
+        self.updates_sent += 1
+        try:
+            await self.application.update_processor.process_update(update, self.application.process_update(update))
+        except Exception as e:
+            self.errors[label] = self.errors.get(label, 0) + 1
+            logging.getLogger(__name__).warning(f"Update {update.update_id} gagal diproses: {e}")
+            return
+        processed = time.perf_counter() - started
+
+        if queue is not None:
+            try:
+                replied_at, _ = await asyncio.wait_for(queue.get(), timeout=self.reply_grace)
+                self.latencies.setdefault(label, []).append(replied_at - started)
+                return
+            except asyncio.TimeoutError:
+                pass
+        self.no_reply[label] = self.no_reply.get(label, 0) + 1
+        self.latencies.setdefault(label, []).append(processed)
+
+    async def replay_sender(self, items: list, first_t: float, started: float):
+        from telegram import Update
+        for record in items:
+            if not self.args.fast:
+                target = started + (record['t'] - first_t) / self.args.speed
+                delay = target - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = Update.de_json(record['update'], self.application.bot)
+            await self.dispatch(update)
+
+    async def run(self, records: list) -> float:
+        by_sender = {}
+        for record in records:
+            by_sender.setdefault(sender_id(record['update']), []).append(record)
+        first_t = records[0]['t'] if records else 0.0
+        started = time.perf_counter()
+        await asyncio.gather(*(self.replay_sender(items, first_t, started) for items in by_sender.values()))
+        return time.perf_counter() - started
+
+
+async def run_replay(args, bot_module, records: list) -> dict:
+    application, fake_request = await start_application(bot_module, args.telegram_latency_ms / 1000)
+    reply_grace = args.reply_grace if args.reply_grace is not None else bot_module.CHECKIN_CONFIRM_TIMEOUT + 1
+    try:
+        replay = Replay(args, application, fake_request, reply_grace)
+        elapsed = await replay.run(records)
+    finally:
+        await stop_application(bot_module, application)
+
+    original = (records[-1]['t'] - records[0]['t']) if records else 0.0
+    return build_report(replay.latencies, replay.errors, elapsed, replay.updates_sent, {
+        'original_duration_seconds': original,
+        'no_reply': replay.no_reply,
+        **backend_stats(bot_module, fake_request),
+    })
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.speed <= 0:
+        print("--speed harus lebih besar dari 0 (gunakan --fast untuk tanpa jeda).")
+        return 2
+    records = load_records(args.paths, args.limit)
+    if not records:
+        print("Tidak ada update di rekaman.")
+        return 1
+    owner_id, admin_ids, user_ids = roles_from_records(records)
+
+    with tempfile.TemporaryDirectory(prefix='replay-') as workdir:
+        configure_environment(args, workdir, **({'owner_id': owner_id} if owner_id else {}))
+        import bot as bot_module
+
+        logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+        seed_users(bot_module, admin_ids, user_ids)
+
+        # Objek asyncio di bot.py dibuat saat impor dan terikat ke event loop default
+        loop = asyncio.get_event_loop()
+        result = loop.run_until_complete(run_replay(args, bot_module, records))
+
+    mode = 'secepat mungkin' if args.fast else f"kecepatan {args.speed}x"
+    return finish(result, args, [
+        f"Replay {len(records)} update dari {len(set(sender_id(r['update']) for r in records))} pengirim ({mode}), "
+        f"latensi fake Sheets: {args.sheets_latency_ms} ms, error rate: {args.sheets_error_rate}",
+        f"Durasi asli rekaman: {result['original_duration_seconds']:.1f} s | Tanpa balasan: {result['no_reply']}",
+    ])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
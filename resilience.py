@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import random
+import sys
+import time
+
+from storage import TransientStorageError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(TransientStorageError):
+    """Panggilan ditolak tanpa menghubungi API karena circuit breaker sedang terbuka."""
+
+
+def classify_error(error: Exception):
+    """
+    Mengembalikan (transient, status, retry_after) untuk sebuah exception.
+    transient True berarti API sedang tidak sehat (429, 5xx, gangguan koneksi) dan panggilan
+    boleh dicoba ulang; status None untuk gangguan koneksi/timeout.
+    """
+    if isinstance(error, TransientStorageError):
+        return True, error.status, error.retry_after
+    # gspread/requests diimpor malas oleh backend 'sheets'; jika belum dimuat, error ini pasti bukan dari sana
+    gspread = sys.modules.get('gspread')
+    requests = sys.modules.get('requests')
+    if gspread is not None and isinstance(error, gspread.exceptions.APIError):
+        status = getattr(error, 'code', None)
+        retry_after = None
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                retry_after = None
+        if status == 429 or (isinstance(status, int) and status >= 500):
+            return True, status, retry_after
+        return False, status, None
+    if requests is not None and isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True, None, None
+    return False, None, None
+
+
+def is_rejected(error: Exception) -> bool:
+    """True jika permintaan pasti tidak diproses API (ditolak kuota atau breaker terbuka)."""
+    transient, status, _ = classify_error(error)
+    return isinstance(error, CircuitOpenError) or (transient and status == 429)
+
+
+class RetryPolicy:
+    """Exponential backoff dengan full jitter; Retry-After dari server selalu dihormati."""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after:
+            return max(retry_after, backoff)
+        return backoff
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker tiga keadaan. Setelah `failure_threshold` kegagalan transient berturut-turut,
+    breaker terbuka dan semua panggilan langsung ditolak selama `reset_timeout` detik; setelah itu
+    satu panggilan percobaan (half-open) menentukan apakah breaker ditutup kembali.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.opened_total = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self._state != self.CLOSED:
+            logger.info("Circuit breaker Google Sheets ditutup kembali: API sudah merespons normal.")
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+        self._trial_in_flight = False
+        if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.opened_total += 1
+                logger.warning(f"Circuit breaker Google Sheets dibuka selama {self.reset_timeout:.0f} detik setelah {self._consecutive_failures} kegagalan berturut-turut.")
+            self._state = self.OPEN
+            self._opened_at = self._clock()
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+
+class ResilientPool:
+    """
+    Membungkus BlockingCallPool dengan retry + circuit breaker bersama untuk semua panggilan Sheets.
+    `run()` untuk panggilan yang tidak idempoten (append, delete): hanya diulang untuk 429, karena
+    permintaan yang ditolak kuota pasti belum diproses. `run_idempotent()` untuk baca/update nilai
+    yang sama: juga diulang untuk 5xx dan gangguan koneksi. Jeda antar percobaan memakai
+    asyncio.sleep sehingga tidak menahan thread pool.
+    """
+
+    def __init__(self, pool, retry_policy: RetryPolicy, breaker: CircuitBreaker):
+        self.pool = pool
+        self.retry_policy = retry_policy
+        self.breaker = breaker
+        # Hook opsional untuk metrik: on_call(label, detik, status_error_atau_None), on_retry(label, status)
+        self.on_call = None
+        self.on_retry = None
+        self.retries = {} # status -> jumlah retry
+        self.failures = {} # status -> jumlah kegagalan transient
+        self.rejected = 0 # Panggilan yang ditolak karena breaker terbuka
+
+    @property
+    def max_workers(self) -> int:
+        return self.pool.max_workers
+
+    @property
+    def in_flight(self) -> int:
+        return self.pool.in_flight
+
+    async def run(self, func, *args, **kwargs):
+        return await self._call(func.__name__, func, args, kwargs, idempotent=False)
+
+    async def run_idempotent(self, func, *args, **kwargs):
+        return await self._call(func.__name__, func, args, kwargs, idempotent=True)
+
+    async def call(self, label: str, func, *args, idempotent: bool = False, **kwargs):
+        """Seperti run()/run_idempotent(), dengan label eksplisit untuk log dan metrik (misalnya nama method gspread)."""
+        return await self._call(label, func, args, kwargs, idempotent=idempotent)
+
+    async def _call(self, label: str, func, args, kwargs, idempotent: bool):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise CircuitOpenError("Google Sheets sedang tidak sehat (circuit breaker terbuka).", retry_after=self.breaker.retry_after())
+            started = time.perf_counter()
+            try:
+                result = await self.pool.run(func, *args, **kwargs)
+            except Exception as e:
+                transient, status, retry_after = classify_error(e)
+                if self.on_call:
+                    self.on_call(label, time.perf_counter() - started, str(status or ('connection' if transient else 'error')))
+                if not transient:
+                    self.breaker.record_success() # API merespons; kesalahan ada di permintaan
+                    raise
+                key = str(status or 'connection')
+                self.failures[key] = self.failures.get(key, 0) + 1
+                self.breaker.record_failure()
+                retryable = status == 429 or idempotent
+                if not retryable or attempt >= self.retry_policy.max_retries or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                delay = self.retry_policy.delay(attempt, retry_after)
+                self.retries[key] = self.retries.get(key, 0) + 1
+                if self.on_retry:
+                    self.on_retry(label, key)
+                attempt += 1
+                logger.warning(f"Panggilan Sheets {label} gagal ({e}); percobaan ulang ke-{attempt} dalam {delay:.2f} detik.")
+                await asyncio.sleep(delay)
+                continue
+            if self.on_call:
+                self.on_call(label, time.perf_counter() - started, None)
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        return {
+            'breaker_state': self.breaker.state,
+            'breaker_opened_total': self.breaker.opened_total,
+            'rejected': self.rejected,
+            'retries': dict(self.retries),
+            'failures': dict(self.failures),
+        }
+
+    def shutdown(self, wait: bool = True):
+        self.pool.shutdown(wait=wait)
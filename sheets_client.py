@@ -0,0 +1,111 @@
+import logging
+import threading
+from datetime import datetime
+
+import gspread
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2 import service_account
+
+logger = logging.getLogger(__name__)
+
+# Scope bawaan gspread; Drive dipakai untuk probe revisi spreadsheet (modifiedTime)
+SHEETS_SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+
+
+class LockedServiceAccountCredentials(service_account.Credentials):
+    """
+    Kredensial service account yang refresh-nya diserialkan dengan lock: jika beberapa thread
+    BlockingCallPool mendapati token kedaluwarsa bersamaan, hanya satu yang menghubungi endpoint
+    OAuth dan sisanya memakai token barunya.
+    """
+
+    _refresh_lock = threading.Lock()
+    on_refresh = None # Opsional: fungsi (pemicu, berhasil) untuk metrik
+
+    def seconds_remaining(self) -> float:
+        """Detik sampai token kedaluwarsa; 0 jika belum ada token."""
+        if not self.token or not self.expiry:
+            return 0.0
+        return (self.expiry - datetime.utcnow()).total_seconds()
+
+    def refresh(self, request):
+        # Dipanggil AuthorizedSession saat token tidak valid lagi (refresh lazy sebagai cadangan)
+        self.refresh_if_expiring(request, 0, 'request')
+
+    def refresh_if_expiring(self, request, margin: float, trigger: str = 'background') -> bool:
+        """Refresh jika token tidak valid atau tersisa kurang dari `margin` detik. True jika token diperbarui."""
+        with self._refresh_lock:
+            if self.valid and self.seconds_remaining() > margin:
+                return False # Sudah diperbarui thread lain selagi menunggu lock
+            try:
+                super().refresh(request)
+            except Exception:
+                if self.on_refresh:
+                    self.on_refresh(trigger, False)
+                raise
+            if self.on_refresh:
+                self.on_refresh(trigger, True)
+            return True
+
+
+class TokenRefresher:
+    """
+    Thread latar belakang yang memperbarui access token `margin` detik sebelum kedaluwarsa, sehingga
+    panggilan Sheets tidak pernah menanggung round-trip OAuth. Jika refresh gagal, dicoba lagi dengan
+    jeda yang membesar; selama token lama masih berlaku panggilan tetap berjalan.
+    """
+
+    def __init__(self, credentials: LockedServiceAccountCredentials, auth_request, margin: float = 300, retry_interval: float = 15):
+        self.credentials = credentials
+        self.auth_request = auth_request
+        self.margin = margin
+        self.retry_interval = retry_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-token-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                if self.credentials.refresh_if_expiring(self.auth_request, self.margin):
+                    logger.info(f"Token Google Sheets diperbarui di latar belakang; berlaku {self.credentials.seconds_remaining():.0f} detik.")
+                failures = 0
+                wait = max(1.0, self.credentials.seconds_remaining() - self.margin)
+            except Exception as e:
+                failures += 1
+                wait = min(300.0, self.retry_interval * 2 ** (failures - 1))
+                logger.warning(f"Refresh token Google Sheets gagal (percobaan ke-{failures}), dicoba lagi dalam {wait:.0f} detik: {e}")
+            self._stop.wait(wait)
+
+
+def create_client(credentials_info: dict, pool_size: int, refresh_margin: float = 300, on_refresh=None):
+    """
+    Klien gspread dengan AuthorizedSession keep-alive yang pool koneksinya seukuran jumlah thread
+    pemanggil, plus TokenRefresher yang sudah berjalan. Mengembalikan (client, refresher).
+    """
+    credentials = LockedServiceAccountCredentials.from_service_account_info(credentials_info, scopes=SHEETS_SCOPES)
+    credentials.on_refresh = on_refresh
+    # Satu sesi keep-alive untuk endpoint token, dipakai bersama refresh latar belakang dan lazy
+    auth_request = Request(requests.Session())
+    session = AuthorizedSession(credentials, auth_request=auth_request)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(1, pool_size))
+    session.mount('https://', adapter)
+    credentials.refresh_if_expiring(auth_request, refresh_margin, 'startup') # Token pertama sebelum panggilan API
+    refresher = TokenRefresher(credentials, auth_request, margin=refresh_margin)
+    refresher.start()
+    return gspread.Client(credentials, session=session), refresher
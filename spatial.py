@@ -0,0 +1,128 @@
+import math
+import re
+import threading
+import time
+
+# Link Google Maps yang disimpan bot ("...maps?q=lat,lng") atau format "@lat,lng"
+_COORDINATES = re.compile(r"(?:[?&]q=|@)(-?\d+(?:\.\d+)?),\s*(-?\d+(?:\.\d+)?)")
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def parse_maps_link(link: str):
+    """(latitude, longitude) dari link Google Maps di kolom 'link'; None jika tidak dikenali."""
+    match = _COORDINATES.search(link or '')
+    if not match:
+        return None
+    latitude, longitude = float(match.group(1)), float(match.group(2))
+    if abs(latitude) > 90 or abs(longitude) > 180:
+        return None
+    return latitude, longitude
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Jarak equirectangular dalam meter; cukup akurat untuk jarak hingga beberapa kilometer."""
+    dy = (lat2 - lat1) * METERS_PER_DEGREE
+    dx = (lng2 - lng1) * METERS_PER_DEGREE * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(dx, dy)
+
+
+def normalize_name(text: str) -> str:
+    """Nama outlet/wilayah untuk perbandingan: spasi dirapikan, huruf besar-kecil diabaikan."""
+    return ' '.join(str(text).split()).casefold()
+
+
+class Outlet:
+    """Satu outlet (nama + wilayah) di satu sel grid; koordinatnya rata-rata semua check-in di sana."""
+
+    __slots__ = ('name', 'region', 'lat_sum', 'lng_sum', 'visits', 'cell')
+
+    def __init__(self, name: str, region: str, cell: tuple):
+        self.name = name
+        self.region = region
+        self.lat_sum = 0.0
+        self.lng_sum = 0.0
+        self.visits = 0
+        self.cell = cell
+
+    @property
+    def latitude(self) -> float:
+        return self.lat_sum / self.visits
+
+    @property
+    def longitude(self) -> float:
+        return self.lng_sum / self.visits
+
+
+class OutletIndex:
+    """
+    Indeks spasial grid di memori untuk outlet yang pernah dipakai check-in. Check-in dengan nama
+    dan wilayah yang sama di sel yang sama digabung menjadi satu outlet, sehingga ukuran indeks
+    mengikuti jumlah outlet, bukan jumlah check-in. Pencarian hanya memeriksa sel di sekitar titik
+    (jumlahnya tetap untuk radius tertentu), jadi tetap di bawah satu milidetik walau riwayatnya
+    ratusan ribu check-in. Aman dipakai dari beberapa thread.
+    """
+
+    def __init__(self, cell_size_m: float = 250.0):
+        self.cell_size_m = cell_size_m
+        self.cell_deg = cell_size_m / METERS_PER_DEGREE
+        self._cells = {} # (i, j) -> {(nama, wilayah): Outlet}
+        self._lock = threading.Lock()
+        self.points = 0
+        self.outlets = 0
+        self.updated_at = None
+
+    def _cell(self, latitude: float, longitude: float) -> tuple:
+        return (math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg))
+
+    def add(self, name: str, region: str, latitude: float, longitude: float):
+        name, region = ' '.join(str(name).split()), ' '.join(str(region).split())
+        if not name:
+            return
+        cell = self._cell(latitude, longitude)
+        key = (normalize_name(name), normalize_name(region))
+        with self._lock:
+            bucket = self._cells.setdefault(cell, {})
+            outlet = bucket.get(key)
+            if outlet is None:
+                outlet = bucket[key] = Outlet(name, region, cell)
+                self.outlets += 1
+            outlet.name, outlet.region = name, region # Ejaan terbaru yang dipakai pengguna
+            outlet.lat_sum += latitude
+            outlet.lng_sum += longitude
+            outlet.visits += 1
+            self.points += 1
+            self.updated_at = time.time()
+
+    def nearest(self, latitude: float, longitude: float, limit: int = 5, max_distance_m: float = 500.0) -> list:
+        """
+        Outlet terdekat dalam radius `max_distance_m`, urut dari yang paling dekat, sebagai list
+        (Outlet, jarak_meter). Nama+wilayah yang sama di sel bertetangga hanya muncul sekali.
+        """
+        cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+        ring_i = math.ceil(max_distance_m / self.cell_size_m)
+        ring_j = math.ceil(max_distance_m / (self.cell_size_m * cos_lat))
+        center_i, center_j = self._cell(latitude, longitude)
+
+        best = {}
+        with self._lock:
+            for i in range(center_i - ring_i, center_i + ring_i + 1):
+                for j in range(center_j - ring_j, center_j + ring_j + 1):
+                    bucket = self._cells.get((i, j))
+                    if not bucket:
+                        continue
+                    for key, outlet in bucket.items():
+                        # Equirectangular: cukup akurat untuk jarak ratusan meter
+                        dy = (outlet.latitude - latitude) * METERS_PER_DEGREE
+                        dx = (outlet.longitude - longitude) * METERS_PER_DEGREE * cos_lat
+                        distance = math.hypot(dx, dy)
+                        if distance > max_distance_m:
+                            continue
+                        current = best.get(key)
+                        if current is None or distance < current[1]:
+                            best[key] = (outlet, distance)
+        return sorted(best.values(), key=lambda item: (item[1], -item[0].visits))[:limit]
+
+    def stats(self) -> dict:
+        return {'points': self.points, 'outlets': self.outlets, 'cells': len(self._cells), 'updated_at': self.updated_at}
@@ -0,0 +1,711 @@
+import asyncio
+import functools
+import json
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+# gspread (beserta library auth di belakangnya) baru diimpor saat backend 'sheets' pertama kali dipakai,
+# agar start bot tidak menunggu impor berat; helper A1 di bawah menggantikan gspread.utils
+
+logger = logging.getLogger(__name__)
+
+_A1_CELL = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+class StorageError(Exception):
+    """Kesalahan umum dari backend penyimpanan."""
+
+
+class WorksheetMissing(StorageError):
+    """Worksheet yang diminta tidak ada di backend."""
+
+
+class TransientStorageError(StorageError):
+    """Kesalahan sementara (misalnya kuota 429 atau 5xx); aman dicoba ulang nanti."""
+
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class BlockingCallPool:
+    """
+    Menjalankan panggilan blocking (gspread) di thread pool terbatas.
+    Handler async cukup melakukan `await pool.run(func, *args)` sehingga event loop
+    tetap melayani pengguna lain selama satu round-trip ke Google Sheets berjalan.
+    Jumlah worker sekaligus menjadi batas konkurensi panggilan ke Sheets; panggilan
+    berikutnya menunggu di antrean executor.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "sheets"):
+        if max_workers < 1:
+            raise ValueError("max_workers harus minimal 1.")
+        self.max_workers = max_workers
+        self.name = thread_name_prefix
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.in_flight = 0 # Jumlah panggilan yang sedang berjalan atau mengantre
+
+    async def run(self, func, *args, **kwargs):
+        """Menjalankan func(*args, **kwargs) di thread pool dan menunggu hasilnya."""
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+        logger.info(f"Thread pool '{self.name}' dihentikan.")
+
+
+class WorksheetCache:
+    """
+    Menyimpan handle Spreadsheet dan Worksheet yang sudah dibuka agar setiap panggilan
+    tidak perlu mengulang `open_by_url` + `.worksheet(...)` (dua request metadata).
+    Handle dibuang otomatis saat panggilan gagal karena sheet hilang/berganti nama
+    atau izin berubah, sehingga panggilan berikutnya membuka ulang dari awal.
+    Aman dipakai dari beberapa thread di BlockingCallPool.
+    """
+
+    # Status HTTP yang menandakan handle sudah tidak valid (sheet/spreadsheet hilang). 400 sengaja tidak
+    # termasuk: itu kesalahan request (range atau nilai salah) yang harus sampai ke pemanggil apa adanya
+    STALE_STATUS_CODES = (404, 410)
+
+    def __init__(self, open_spreadsheet):
+        self._open_spreadsheet = open_spreadsheet # Fungsi tanpa argumen yang mengembalikan gspread.Spreadsheet
+        self._lock = threading.Lock()
+        self._spreadsheet = None
+        self._worksheets = {}
+        self.hits = 0
+        self.misses = 0
+
+    def spreadsheet(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = self._open_spreadsheet()
+            return self._spreadsheet
+
+    def worksheet(self, title: str):
+        """Mengembalikan handle worksheet `title`, membuka dari API hanya jika belum ada di cache."""
+        with self._lock:
+            worksheet = self._worksheets.get(title)
+            if worksheet is not None:
+                self.hits += 1
+                return worksheet
+            self.misses += 1
+        worksheet = self.spreadsheet().worksheet(title)
+        with self._lock:
+            self._worksheets[title] = worksheet
+        return worksheet
+
+    def run(self, title: str, func, *args, **kwargs):
+        """Menjalankan func(worksheet, *args, **kwargs); membuang cache jika handle ternyata basi."""
+        try:
+            return func(self.worksheet(title), *args, **kwargs)
+        except Exception as e:
+            if self.is_stale_error(e):
+                logger.warning(f"Handle worksheet '{title}' dibuang dari cache karena error: {e}")
+                self.invalidate()
+            raise
+
+    def remember(self, title: str, worksheet):
+        """Menyimpan handle worksheet yang baru dibuat agar tidak perlu dibuka ulang."""
+        with self._lock:
+            self._worksheets[title] = worksheet
+
+    def invalidate(self):
+        with self._lock:
+            self._spreadsheet = None
+            self._worksheets.clear()
+
+    @classmethod
+    def is_stale_error(cls, error: Exception) -> bool:
+        import gspread
+        if isinstance(error, (gspread.exceptions.WorksheetNotFound, gspread.exceptions.SpreadsheetNotFound)):
+            return True
+        if isinstance(error, gspread.exceptions.APIError):
+            return getattr(error, 'code', None) in cls.STALE_STATUS_CODES
+        return False
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'cached_worksheets': len(self._worksheets)}
+
+
+class StorageBackend(ABC):
+    """
+    Antarmuka penyimpanan yang dipakai bot: worksheet bernama ("Users", "Check-in Data", ...)
+    berisi baris-baris nilai string dengan header di baris 1, mengikuti subset API gspread.Worksheet
+    yang dipakai (get_all_values, get_values, append_row(s), update_cell, batch_update, delete_rows, col_values).
+    Semua method blocking; jalankan lewat BlockingCallPool dari kode async.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def worksheet(self, title: str):
+        """Mengembalikan objek worksheet; WorksheetMissing jika tidak ada."""
+
+    @abstractmethod
+    def worksheet_titles(self) -> list:
+        """Daftar nama worksheet yang tersedia."""
+
+    @abstractmethod
+    def add_worksheet(self, title: str, header: list = None):
+        """Membuat worksheet `title` berisi baris header (tidak berubah jika sudah ada) dan mengembalikannya."""
+
+    def revision(self):
+        """Penanda murah yang berubah setiap ada penulisan; None jika backend tidak mendukung."""
+        return None
+
+    def run(self, title: str, func, *args, **kwargs):
+        """Menjalankan func(worksheet, *args, **kwargs)."""
+        return func(self.worksheet(title), *args, **kwargs)
+
+    def invalidate(self):
+        """Membuang state/handle yang di-cache (jika ada)."""
+
+    def stats(self) -> dict:
+        return {'backend': self.name}
+
+    def close(self):
+        pass
+
+
+def rowcol_to_a1(row: int, col: int) -> str:
+    """Label sel A1 dari nomor baris dan kolom (1-based), seperti gspread.utils.rowcol_to_a1."""
+    letters = ''
+    while col > 0:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return f"{letters}{row}"
+
+
+def a1_to_rowcol(label: str):
+    """(baris, kolom) dari label sel A1 seperti 'B5', seperti gspread.utils.a1_to_rowcol."""
+    match = _A1_CELL.match(label.strip().upper())
+    if not match:
+        raise ValueError(f"Label sel A1 tidak valid: {label}")
+    col = 0
+    for letter in match.group(1):
+        col = col * 26 + ord(letter) - ord('A') + 1
+    return int(match.group(2)), col
+
+
+def _row_range(range_name: str):
+    """Baris pertama dan terakhir (None = sampai akhir) dari range A1 seperti 'A2:H' atau 'A2:H500'."""
+    start, _, end = range_name.partition(':')
+    first_row = int(start.lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ') or 1)
+    end_digits = end.lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+    return first_row, (int(end_digits) if end_digits else None)
+
+
+def _trim_trailing_empty(rows: list) -> list:
+    """Seperti Sheets API: baris kosong di akhir range tidak dikembalikan."""
+    while rows and not any(rows[-1]):
+        rows.pop()
+    return rows
+
+
+def _batch_cells(data: list):
+    """(baris, kolom, nilai) untuk setiap sel dari data batch_update [{'range': 'B5', 'values': [[...]]}, ...]."""
+    for item in data:
+        first_row, first_col = a1_to_rowcol(item['range'].split('!')[-1].split(':')[0])
+        for i, values in enumerate(item['values']):
+            for j, value in enumerate(values):
+                yield first_row + i, first_col + j, value
+
+
+def _updated_range(title: str, first_row: int, rows: list) -> dict:
+    """Respons append bergaya Sheets API agar pemanggil bisa membaca nomor baris hasil append."""
+    width = max((len(r) for r in rows), default=1)
+    last_col = rowcol_to_a1(1, max(width, 1)).rstrip('0123456789')
+    return {'updates': {'updatedRange': f"{title}!A{first_row}:{last_col}{first_row + len(rows) - 1}", 'updatedRows': len(rows)}}
+
+
+class SheetsStorage(StorageBackend):
+    """Backend produksi: Google Sheets lewat gspread, dengan handle worksheet yang di-cache."""
+
+    name = "sheets"
+
+    def __init__(self, open_spreadsheet):
+        self.cache = WorksheetCache(open_spreadsheet)
+
+    def worksheet(self, title: str):
+        import gspread
+        try:
+            return self.cache.worksheet(title)
+        except gspread.exceptions.WorksheetNotFound as e:
+            self.cache.invalidate()
+            raise WorksheetMissing(title) from e
+
+    def worksheet_titles(self) -> list:
+        return [ws.title for ws in self.cache.spreadsheet().worksheets()]
+
+    def add_worksheet(self, title: str, header: list = None):
+        import gspread
+        try:
+            worksheet = self.cache.spreadsheet().add_worksheet(title, rows=1000, cols=max(len(header or []), 1))
+        except gspread.exceptions.APIError as e:
+            # Sudah dibuat lebih dulu (instans bot lain atau manual): pakai yang ada
+            if 'already exists' not in str(e):
+                raise
+            return self.worksheet(title)
+        if header:
+            worksheet.append_row(header)
+        self.cache.remember(title, worksheet)
+        return worksheet
+
+    def revision(self):
+        return self.cache.spreadsheet().get_lastUpdateTime()
+
+    def run(self, title: str, func, *args, **kwargs):
+        import gspread
+        try:
+            return self.cache.run(title, func, *args, **kwargs)
+        except gspread.exceptions.WorksheetNotFound as e:
+            raise WorksheetMissing(title) from e
+
+    def invalidate(self):
+        self.cache.invalidate()
+
+    def stats(self) -> dict:
+        return {'backend': self.name, **self.cache.stats()}
+
+
+class MemoryWorksheet:
+    """Worksheet di memori; dipakai MemoryStorage (fake Sheets)."""
+
+    def __init__(self, storage, title: str, rows: list):
+        self._storage = storage
+        self.title = title
+        self._rows = [list(map(str, r)) for r in rows]
+
+    def get_all_values(self) -> list:
+        self._storage._simulate("get_all_values")
+        with self._storage._lock:
+            return [list(r) for r in self._rows]
+
+    def col_values(self, col: int) -> list:
+        self._storage._simulate("col_values")
+        with self._storage._lock:
+            return [r[col - 1] if len(r) >= col else '' for r in self._rows]
+
+    def get_values(self, range_name: str) -> list:
+        """Baris dalam range A1 (hanya nomor barisnya yang dipakai), seperti gspread.Worksheet.get_values."""
+        self._storage._simulate("get_values")
+        first_row, last_row = _row_range(range_name)
+        with self._storage._lock:
+            return _trim_trailing_empty([list(r) for r in self._rows[first_row - 1:last_row]])
+
+    def append_row(self, values: list, **kwargs) -> dict:
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values: list, **kwargs) -> dict:
+        self._storage._simulate("append_rows")
+        with self._storage._lock:
+            first_row = len(self._rows) + 1
+            self._rows.extend(['' if v is None else str(v) for v in row] for row in values)
+            self._storage._bump()
+        return _updated_range(self.title, first_row, values)
+
+    def _set_cell(self, row: int, col: int, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        target = self._rows[row - 1]
+        if len(target) < col:
+            target.extend([''] * (col - len(target)))
+        target[col - 1] = str(value)
+
+    def update_cell(self, row: int, col: int, value) -> dict:
+        self._storage._simulate("update_cell")
+        with self._storage._lock:
+            self._set_cell(row, col, value)
+            self._storage._bump()
+        return {}
+
+    def batch_update(self, data: list, **kwargs) -> dict:
+        """Beberapa range sekaligus dalam satu panggilan, seperti gspread.Worksheet.batch_update."""
+        self._storage._simulate("batch_update")
+        with self._storage._lock:
+            for row, col, value in _batch_cells(data):
+                self._set_cell(row, col, value)
+            self._storage._bump()
+        return {}
+
+    def delete_rows(self, start_index: int, end_index: int = None) -> dict:
+        self._storage._simulate("delete_rows")
+        with self._storage._lock:
+            del self._rows[start_index - 1:(end_index or start_index)]
+            self._storage._bump()
+        return {}
+
+
+class MemoryStorage(StorageBackend):
+    """
+    Fake Google Sheets di memori untuk benchmark dan pengujian offline. Setiap panggilan API
+    ditunda `latency` detik (+ jitter acak) dan gagal dengan TransientStorageError 429 dengan
+    peluang `error_rate`, meniru perilaku Sheets saat sibuk atau terkena kuota.
+    """
+
+    name = "memory"
+
+    def __init__(self, initial_data: dict = None, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._version = 0
+        self.calls = {}
+        self._worksheets = {title: MemoryWorksheet(self, title, rows) for title, rows in (initial_data or {}).items()}
+
+    def _simulate(self, method: str):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self.error_rate and self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise TransientStorageError(f"Fake Sheets: kuota terlampaui ({method})", status=429, retry_after=1.0)
+
+    def _bump(self):
+        self._version += 1
+
+    def worksheet(self, title: str):
+        worksheet = self._worksheets.get(title)
+        if worksheet is None:
+            raise WorksheetMissing(title)
+        return worksheet
+
+    def worksheet_titles(self) -> list:
+        return list(self._worksheets)
+
+    def add_worksheet(self, title: str, header: list = None):
+        with self._lock:
+            if title not in self._worksheets:
+                self._worksheets[title] = MemoryWorksheet(self, title, [header] if header else [])
+            return self._worksheets[title]
+
+    def revision(self):
+        self._simulate("revision")
+        return str(self._version)
+
+    def stats(self) -> dict:
+        return {'backend': self.name, 'calls': dict(self.calls), 'worksheets': len(self._worksheets)}
+
+
+class SQLiteWorksheet:
+    """Worksheet yang disimpan di tabel SQLite `sheet_rows` (satu record per baris)."""
+
+    def __init__(self, storage, title: str):
+        self._storage = storage
+        self.title = title
+
+    def get_all_values(self) -> list:
+        with self._storage._lock:
+            rows = self._storage._conn.execute(
+                "SELECT row_number, values_json FROM sheet_rows WHERE sheet = ? ORDER BY row_number", (self.title,)
+            ).fetchall()
+        values = []
+        for row_number, values_json in rows:
+            while len(values) < row_number - 1:
+                values.append([]) # Baris kosong di tengah, seperti di Sheets
+            values.append(json.loads(values_json))
+        return values
+
+    def col_values(self, col: int) -> list:
+        return [r[col - 1] if len(r) >= col else '' for r in self.get_all_values()]
+
+    def get_values(self, range_name: str) -> list:
+        """Baris dalam range A1 (hanya nomor barisnya yang dipakai), seperti gspread.Worksheet.get_values."""
+        first_row, last_row = _row_range(range_name)
+        with self._storage._lock:
+            rows = self._storage._conn.execute(
+                "SELECT row_number, values_json FROM sheet_rows WHERE sheet = ? AND row_number >= ? AND row_number <= ? ORDER BY row_number",
+                (self.title, first_row, last_row if last_row is not None else 2**62),
+            ).fetchall()
+        values = []
+        for row_number, values_json in rows:
+            while len(values) < row_number - first_row:
+                values.append([])
+            values.append(json.loads(values_json))
+        return _trim_trailing_empty(values)
+
+    def append_row(self, values: list, **kwargs) -> dict:
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values: list, **kwargs) -> dict:
+        with self._storage._transaction() as conn:
+            last = conn.execute("SELECT COALESCE(MAX(row_number), 0) FROM sheet_rows WHERE sheet = ?", (self.title,)).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO sheet_rows (sheet, row_number, values_json) VALUES (?, ?, ?)",
+                [(self.title, last + 1 + i, json.dumps(['' if v is None else str(v) for v in row], ensure_ascii=False)) for i, row in enumerate(values)],
+            )
+        return _updated_range(self.title, last + 1, values)
+
+    def _set_cell(self, conn, row: int, col: int, value):
+        existing = conn.execute("SELECT values_json FROM sheet_rows WHERE sheet = ? AND row_number = ?", (self.title, row)).fetchone()
+        values = json.loads(existing[0]) if existing else []
+        if len(values) < col:
+            values.extend([''] * (col - len(values)))
+        values[col - 1] = str(value)
+        conn.execute(
+            "INSERT OR REPLACE INTO sheet_rows (sheet, row_number, values_json) VALUES (?, ?, ?)",
+            (self.title, row, json.dumps(values, ensure_ascii=False)),
+        )
+
+    def update_cell(self, row: int, col: int, value) -> dict:
+        with self._storage._transaction() as conn:
+            self._set_cell(conn, row, col, value)
+        return {}
+
+    def batch_update(self, data: list, **kwargs) -> dict:
+        """Beberapa range sekaligus dalam satu transaksi, seperti gspread.Worksheet.batch_update."""
+        with self._storage._transaction() as conn:
+            for row, col, value in _batch_cells(data):
+                self._set_cell(conn, row, col, value)
+        return {}
+
+    def delete_rows(self, start_index: int, end_index: int = None) -> dict:
+        end_index = end_index or start_index
+        count = end_index - start_index + 1
+        with self._storage._transaction() as conn:
+            conn.execute("DELETE FROM sheet_rows WHERE sheet = ? AND row_number BETWEEN ? AND ?", (self.title, start_index, end_index))
+            # Geser baris di bawahnya lewat nilai negatif agar tidak bentrok dengan primary key
+            conn.execute("UPDATE sheet_rows SET row_number = -(row_number - ?) WHERE sheet = ? AND row_number > ?", (count, self.title, end_index))
+            conn.execute("UPDATE sheet_rows SET row_number = -row_number WHERE sheet = ? AND row_number < 0", (self.title,))
+        return {}
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Backend SQLite (file lokal, mode WAL) untuk toko yang sudah melewati batas baris dan kuota
+    Google Sheets. Worksheet yang belum ada dibuat otomatis dengan header dari `default_headers`.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, default_headers: dict = None):
+        self.path = path
+        self.default_headers = default_headers or {}
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sheet_rows (sheet TEXT NOT NULL, row_number INTEGER NOT NULL, values_json TEXT NOT NULL, PRIMARY KEY (sheet, row_number));"
+            "CREATE TABLE IF NOT EXISTS worksheets (title TEXT PRIMARY KEY);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0);"
+        )
+        for title, header in self.default_headers.items():
+            self.add_worksheet(title, header)
+        logger.info(f"Penyimpanan SQLite dibuka di {path}.")
+
+    class _Transaction:
+        def __init__(self, storage):
+            self.storage = storage
+
+        def __enter__(self):
+            self.storage._lock.acquire()
+            self.storage._conn.execute("BEGIN IMMEDIATE")
+            return self.storage._conn
+
+        def __exit__(self, exc_type, exc, tb):
+            try:
+                if exc_type is None:
+                    self.storage._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+                    self.storage._conn.execute("COMMIT")
+                else:
+                    self.storage._conn.execute("ROLLBACK")
+            finally:
+                self.storage._lock.release()
+            return False
+
+    def _transaction(self):
+        return self._Transaction(self)
+
+    def worksheet(self, title: str):
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM worksheets WHERE title = ?", (title,)).fetchone()
+        if not exists:
+            raise WorksheetMissing(title)
+        return SQLiteWorksheet(self, title)
+
+    def worksheet_titles(self) -> list:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT title FROM worksheets ORDER BY title")]
+
+    def add_worksheet(self, title: str, header: list = None):
+        with self._transaction() as conn:
+            created = conn.execute("INSERT OR IGNORE INTO worksheets (title) VALUES (?)", (title,)).rowcount
+            if created and header:
+                conn.execute("INSERT INTO sheet_rows (sheet, row_number, values_json) VALUES (?, 1, ?)", (title, json.dumps(header)))
+        return SQLiteWorksheet(self, title)
+
+    def revision(self):
+        with self._lock:
+            return str(self._conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_storage(backend: str, open_spreadsheet=None, sqlite_path: str = None, default_headers: dict = None, fake_latency: float = 0.0, fake_error_rate: float = 0.0) -> StorageBackend:
+    """Membuat backend penyimpanan sesuai nama ('sheets', 'sqlite' atau 'memory')."""
+    backend = (backend or 'sheets').strip().lower()
+    if backend == 'sheets':
+        return SheetsStorage(open_spreadsheet)
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path, default_headers=default_headers)
+    if backend == 'memory':
+        initial_data = {title: [header] for title, header in (default_headers or {}).items()}
+        return MemoryStorage(initial_data, latency=fake_latency, jitter=fake_latency, error_rate=fake_error_rate)
+    raise ValueError(f"Backend penyimpanan tidak dikenal: {backend}")
+
+
+def read_row_range(storage: StorageBackend, title: str, first_row: int, count: int, last_column: str) -> list:
+    """`count` baris mulai dari `first_row` (kolom A sampai `last_column`) dengan satu get_values (blocking)."""
+    range_name = f"A{first_row}:{last_column}{first_row + count - 1}"
+    return storage.run(title, lambda ws: ws.get_values(range_name))
+
+
+class SheetTailReader:
+    """
+    Membaca worksheet append-only secara bertahap: setiap read_new() hanya mengambil baris setelah
+    baris terakhir yang sudah dibaca (get_values per potongan `chunk_rows` baris), sehingga indeks di
+    memori bisa diperbarui tanpa membaca ulang seluruh riwayat. Tidak cocok untuk worksheet yang
+    barisnya dihapus (nomor baris bergeser). Blocking: jalankan lewat BlockingCallPool dari kode async.
+    """
+
+    def __init__(self, storage: StorageBackend, title: str, last_column: str, header_rows: int = 1, chunk_rows: int = 10000):
+        self.storage = storage
+        self.title = title
+        self.last_column = last_column
+        self.chunk_rows = max(1, chunk_rows)
+        self.next_row = header_rows + 1
+        self._lock = threading.Lock() # Satu pembaca per waktu agar baris tidak terbaca dua kali
+
+    def read_new(self) -> list:
+        """Baris baru sejak pembacaan terakhir, sebagai list (nomor_baris, nilai)."""
+        with self._lock:
+            result = []
+            while True:
+                first = self.next_row
+                rows = read_row_range(self.storage, self.title, first, self.chunk_rows, self.last_column)
+                result.extend((first + i, row) for i, row in enumerate(rows))
+                self.next_row = first + len(rows)
+                if len(rows) < self.chunk_rows:
+                    return result
+
+
+class BatchWriteQueue:
+    """
+    Antrean write-behind: baris-baris yang masuk dikumpulkan selama paling lama `max_wait`
+    detik (atau sampai `max_rows` baris), lalu ditulis sekaligus dengan satu panggilan
+    `write_rows(rows)` di BlockingCallPool. `submit()` baru selesai setelah baris tersebut
+    benar-benar tertulis, sehingga pengguna hanya dikonfirmasi untuk data yang sudah tersimpan.
+    """
+
+    def __init__(self, pool: BlockingCallPool, write_rows, max_rows: int = 50, max_wait: float = 0.3, name: str = "batch"):
+        self.pool = pool
+        self.write_rows = write_rows # Fungsi blocking yang menerima list of rows
+        self.max_rows = max(1, max_rows)
+        self.max_wait = max(0.0, max_wait)
+        self.name = name
+        self._queue = None
+        self._worker = None
+
+    @property
+    def pending(self) -> int:
+        """Jumlah baris yang sedang menunggu untuk ditulis."""
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        if self._worker:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"Antrean tulis '{self.name}' dimulai (maks {self.max_rows} baris / {self.max_wait:.3f} detik per batch).")
+
+    async def submit(self, row: list):
+        """Memasukkan satu baris ke antrean dan menunggu sampai batch-nya tertulis."""
+        if not self._worker:
+            raise RuntimeError(f"Antrean tulis '{self.name}' belum dijalankan.")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        return await future
+
+    async def stop(self):
+        """Menulis semua baris yang masih mengantre lalu menghentikan worker."""
+        if not self._worker:
+            return
+        await self._queue.put(None) # Sentinel: flush lalu berhenti
+        await self._worker
+        self._worker = None
+        logger.info(f"Antrean tulis '{self.name}' dihentikan setelah flush terakhir.")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # Satu task get() dipakai ulang lintas batch; membatalkan queue.get() lewat wait_for bisa
+        # menghilangkan item yang kebetulan tiba bersamaan dengan timeout.
+        getter = None
+        stopping = False
+        while not stopping:
+            item = await (getter or self._queue.get())
+            getter = None
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_rows:
+                if not self._queue.empty():
+                    item = self._queue.get_nowait()
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    getter = getter or asyncio.ensure_future(self._queue.get())
+                    done, _ = await asyncio.wait({getter}, timeout=remaining)
+                    if not done:
+                        break
+                    item = getter.result()
+                    getter = None
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # Kosongkan sisa antrean saat berhenti
+        leftovers = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                leftovers.append(item)
+        for start in range(0, len(leftovers), self.max_rows):
+            await self._flush(leftovers[start:start + self.max_rows])
+
+    async def _flush(self, batch: list):
+        rows = [row for row, _ in batch]
+        try:
+            await self.pool.run(self.write_rows, rows)
+        except Exception as e:
+            logger.error(f"Gagal menulis batch {len(rows)} baris di antrean '{self.name}': {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        logger.info(f"Antrean '{self.name}' menulis {len(rows)} baris dalam satu panggilan.")
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Modul bot berada di root repo (bukan paket); test mengimpornya langsung
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def bot_loop():
+    """
+    Event loop bersama untuk test yang memakai modul bot: objek asyncio yang dibuat saat bot diimpor
+    (misalnya semaphore update processor) terikat ke loop ini di Python < 3.10.
+    """
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope='session')
+def bot_module(tmp_path_factory, bot_loop):
+    """
+    Modul bot dengan backend 'memory' (fake Sheets tanpa latensi), jurnal dan snapshot di direktori
+    sementara. bot membaca konfigurasi saat diimpor, jadi environment disiapkan lebih dulu.
+    """
+    import loadtest
+    args = loadtest.parse_args(['--sheets-latency-ms', '0'])
+    loadtest.configure_environment(args, str(tmp_path_factory.mktemp('bot')))
+    asyncio.set_event_loop(bot_loop)
+    try:
+        import bot
+    finally:
+        asyncio.set_event_loop(None)
+    return bot
+
+
+@pytest.fixture
+def users_sheet(bot_module):
+    """Lembar 'Users' fake Sheets dikosongkan (hanya header wajib) dan tabel peran dimuat ulang."""
+    from user_table import REQUIRED_HEADERS
+    storage = bot_module.storage_backend
+    rows = storage.run("Users", lambda ws: ws.get_all_values())
+    if rows:
+        storage.run("Users", lambda ws: ws.delete_rows(1, len(rows)))
+    storage.run("Users", lambda ws: ws.append_rows([REQUIRED_HEADERS]))
+    bot_module.load_user_roles()
+    return storage
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+
+import pytest
+
+from storage import BatchWriteQueue, BlockingCallPool
+
+
+class RecordingWriter:
+    """write_rows palsu: mencatat setiap batch, opsional gagal dengan exception tertentu."""
+
+    def __init__(self, error: Exception = None):
+        self.batches = []
+        self.error = error
+        self._lock = threading.Lock()
+
+    def __call__(self, rows):
+        with self._lock:
+            self.batches.append(list(rows))
+        if self.error:
+            raise self.error
+
+
+def run_queue(writer, scenario, max_rows=50, max_wait=0.05):
+    async def main():
+        pool = BlockingCallPool(1, thread_name_prefix="test-batch")
+        queue = BatchWriteQueue(pool, writer, max_rows=max_rows, max_wait=max_wait, name="test")
+        await queue.start()
+        try:
+            return await scenario(queue)
+        finally:
+            await queue.stop()
+            pool.shutdown()
+    return asyncio.run(main())
+
+
+def test_submits_within_max_wait_are_written_in_one_call():
+    writer = RecordingWriter()
+
+    async def scenario(queue):
+        await asyncio.gather(*(queue.submit([i]) for i in range(5)))
+
+    run_queue(writer, scenario)
+    assert writer.batches == [[[0], [1], [2], [3], [4]]]
+
+
+def test_batches_are_split_at_max_rows():
+    writer = RecordingWriter()
+
+    async def scenario(queue):
+        await asyncio.gather(*(queue.submit([i]) for i in range(7)))
+
+    run_queue(writer, scenario, max_rows=3)
+    assert [len(batch) for batch in writer.batches] == [3, 3, 1]
+    assert [row for batch in writer.batches for row in batch] == [[i] for i in range(7)]
+
+
+def test_submit_returns_only_after_its_batch_is_written():
+    writer = RecordingWriter()
+
+    async def scenario(queue):
+        await queue.submit(['a'])
+        written = len(writer.batches)
+        await queue.submit(['b'])
+        return written
+
+    assert run_queue(writer, scenario, max_wait=0.01) == 1
+    assert writer.batches == [[['a']], [['b']]]
+
+
+def test_write_failure_is_raised_to_every_submitter_in_the_batch():
+    error = RuntimeError("Sheets down")
+    writer = RecordingWriter(error=error)
+
+    async def scenario(queue):
+        return await asyncio.gather(*(queue.submit([i]) for i in range(3)), return_exceptions=True)
+
+    results = run_queue(writer, scenario)
+    assert results == [error, error, error]
+    assert len(writer.batches) == 1
+
+
+def test_queue_keeps_working_after_a_failed_batch():
+    writer = RecordingWriter(error=RuntimeError("sekali gagal"))
+
+    async def scenario(queue):
+        with pytest.raises(RuntimeError):
+            await queue.submit(['gagal'])
+        writer.error = None
+        await queue.submit(['berhasil'])
+
+    run_queue(writer, scenario, max_wait=0.01)
+    assert writer.batches == [[['gagal']], [['berhasil']]]
+
+
+def test_stop_flushes_rows_still_waiting():
+    writer = RecordingWriter()
+
+    async def scenario(queue):
+        # max_wait panjang: tanpa stop() baris ini masih menunggu batch-nya penuh
+        pending = [asyncio.ensure_future(queue.submit([i])) for i in range(4)]
+        await asyncio.sleep(0.05)
+        assert writer.batches == []
+        await queue.stop()
+        await asyncio.gather(*pending)
+
+    run_queue(writer, scenario, max_wait=30)
+    assert [row for batch in writer.batches for row in batch] == [[0], [1], [2], [3]]
+
+
+def test_submit_before_start_is_rejected():
+    async def main():
+        pool = BlockingCallPool(1)
+        queue = BatchWriteQueue(pool, RecordingWriter())
+        try:
+            with pytest.raises(RuntimeError):
+                await queue.submit(['x'])
+        finally:
+            pool.shutdown()
+
+    asyncio.run(main())
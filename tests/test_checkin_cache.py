@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from checkin_cache import CheckinColumns, parse_days
+
+
+def day(date: str) -> int:
+    return int(np.datetime64(date, 'D').astype(np.int64))
+
+
+def row(user_id, timestamp, region, first_name='', username=''):
+    return [user_id, first_name, username, timestamp, 'Outlet', region, 'https://maps', f"{user_id}:{timestamp}"]
+
+
+def test_parse_days_shifts_utc_timestamps_to_gmt7():
+    days = parse_days(['2026-10-16 16:59:59', '2026-10-16 17:00:00', '2026-12-31 23:00:00'])
+    assert days.tolist() == [day('2026-10-16'), day('2026-10-17'), day('2027-01-01')]
+    assert days.dtype == np.int32
+
+
+def test_parse_days_marks_corrupt_timestamps_without_losing_the_rest():
+    days = parse_days(['2026-10-16 08:00:00', 'rusak', '', '2026-13-01 00:00:00', '2026-10-17 08:00:00'])
+    assert days.tolist() == [day('2026-10-16'), -1, -1, -1, day('2026-10-17')]
+
+
+def make_columns():
+    columns = CheckinColumns(initial_capacity=2) # Kapasitas kecil: append ikut menguji pertumbuhan array
+    appended = columns.append([
+        row('1', '2026-10-12 01:00:00', 'Jakarta', 'Budi', 'budi'), # Senin
+        row('1', '2026-10-13 01:00:00', ' jakarta ', 'Budi', 'budi'),
+        row('2', '2026-10-13 02:00:00', 'Bandung', 'Siti'),
+        row('1', '2026-10-18 17:30:00', 'Jakarta', 'Budi', 'budi'), # Senin 19 Okt WIB
+        row('3', '2026-10-20 03:00:00', ''),
+        row('', '2026-10-20 03:00:00', 'Jakarta'), # Tanpa user_id: dilewati
+        ['4', 'Terpotong'], # Kurang kolom: dilewati
+        row('2', 'rusak', 'Bandung', 'Siti'), # Hari -1: tidak masuk rentang mana pun
+    ])
+    assert appended == 6
+    return columns
+
+
+def test_count_by_user_and_region_sorted_by_count():
+    columns = make_columns()
+    start, end = day('2026-10-12'), day('2026-10-20')
+    assert columns.count_by('user', start, end) == [('Budi (@budi)', 3), ('Siti (2)', 1), ('3 (3)', 1)]
+    # Wilayah dinormalisasi ('Jakarta' = ' jakarta ', label terakhir dipakai); label kosong ditampilkan '(kosong)'
+    assert columns.count_by('wilayah', start, end) == [('Jakarta', 3), ('Bandung', 1), ('(kosong)', 1)]
+
+
+def test_count_by_day_includes_empty_days_in_range():
+    columns = make_columns()
+    counts = columns.count_by('hari', day('2026-10-12'), day('2026-10-15'))
+    assert counts == [('2026-10-12', 1), ('2026-10-13', 2), ('2026-10-14', 0), ('2026-10-15', 0)]
+
+
+def test_count_by_week_starts_on_monday():
+    columns = make_columns()
+    counts = columns.count_by('minggu', day('2026-10-14'), day('2026-10-20'))
+    # Rentang mulai Rabu: minggu pertama tetap diberi label Senin-nya, check-in sebelum rentang tidak dihitung
+    assert counts == [('mulai 2026-10-12', 0), ('mulai 2026-10-19', 2)]
+    assert columns.count_by('minggu', day('2026-10-12'), day('2026-10-18')) == [('mulai 2026-10-12', 3)]
+
+
+def test_count_by_rejects_unknown_dimension_and_reports_stats():
+    columns = make_columns()
+    with pytest.raises(ValueError):
+        columns.count_by('bulan', 0, 1)
+    stats = columns.stats()
+    assert (stats['rows'], stats['users'], stats['regions']) == (6, 3, 3)
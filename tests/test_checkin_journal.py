@@ -0,0 +1,119 @@
+from checkin_journal import CheckinJournal
+
+
+def open_journal(tmp_path):
+    return CheckinJournal(str(tmp_path / 'journal.db'))
+
+
+def test_append_is_idempotent_per_key(tmp_path):
+    journal = open_journal(tmp_path)
+    first_id, inserted = journal.append('1:10', 'Checkins', ['1', 'a'])
+    again_id, inserted_again = journal.append('1:10', 'Checkins', ['1', 'lain'])
+    assert inserted and not inserted_again
+    assert again_id == first_id
+    assert [entry.row for entry in journal.pending()] == [['1', 'a']]
+
+
+def test_append_many_keeps_order_and_reports_duplicates(tmp_path):
+    journal = open_journal(tmp_path)
+    existing_id, _ = journal.append('k2', 'Checkins', ['2'])
+    results = journal.append_many([('k1', 'Checkins', ['1']), ('k2', 'Checkins', ['2']), ('k3', 'Checkins', ['3'])])
+    assert [inserted for _, inserted in results] == [True, False, True]
+    assert results[1][0] == existing_id
+    assert [entry.idempotency_key for entry in journal.pending()] == ['k2', 'k1', 'k3']
+    assert journal.append_many([]) == []
+
+
+def test_pending_survives_reopen(tmp_path):
+    journal = open_journal(tmp_path)
+    journal.append('k1', 'Checkins', ['1', 'Outlet ü'])
+    journal.close()
+
+    reopened = open_journal(tmp_path)
+    entries = reopened.pending()
+    assert [(entry.idempotency_key, entry.sheet, entry.row, entry.attempts) for entry in entries] == [('k1', 'Checkins', ['1', 'Outlet ü'], 0)]
+
+
+def test_pending_filters_by_sheet_excludes_in_flight_and_respects_limit(tmp_path):
+    journal = open_journal(tmp_path)
+    ids = [journal.append(f"k{i}", 'Checkins_2024_01' if i % 2 else 'Checkins_2024_02', [str(i)])[0] for i in range(6)]
+    assert [entry.id for entry in journal.pending(sheet='Checkins_2024_01')] == [ids[1], ids[3], ids[5]]
+    # Entri yang dikecualikan tidak mengurangi jumlah hasil
+    assert [entry.id for entry in journal.pending(limit=2, exclude_ids=(ids[0], ids[1]))] == [ids[2], ids[3]]
+
+
+def test_mark_sent_removes_entries_from_pending(tmp_path):
+    journal = open_journal(tmp_path)
+    ids = [journal.append(f"k{i}", 'Checkins', [str(i)])[0] for i in range(3)]
+    journal.mark_sent([ids[0], ids[2]])
+    journal.mark_sent([])
+    assert [entry.id for entry in journal.pending()] == [ids[1]]
+    assert journal.stats()['pending'] == 1
+    # Entri terkirim tetap terlihat di recent() untuk deteksi duplikat
+    assert [entry.id for entry in journal.recent(0)] == ids
+
+
+def test_record_failure_counts_only_uncertain_attempts(tmp_path):
+    journal = open_journal(tmp_path)
+    entry_id, _ = journal.append('k1', 'Checkins', ['1'])
+    journal.record_failure([entry_id], "429 kuota", uncertain=False)
+    assert journal.pending()[0].attempts == 0
+    journal.record_failure([entry_id], "timeout")
+    journal.record_failure([entry_id], "503 " + "x" * 1000)
+    assert journal.pending()[0].attempts == 2
+
+    stats = journal.stats()
+    assert stats['pending'] == 1
+    assert stats['failed'] == 1
+    assert stats['last_error'].startswith("503 ") and len(stats['last_error']) == 500
+    assert stats['oldest_age_seconds'] >= 0
+
+    journal.mark_sent([entry_id])
+    assert journal.stats() == {'pending': 0, 'oldest_age_seconds': 0.0, 'failed': 0, 'last_error': None}
+
+
+def test_replay_job_sends_pending_rows_without_duplicating_written_ones(bot_module, bot_loop):
+    bot = bot_module
+    sheet = bot.checkin_partitions.sheet_for('2024-01-15 08:00:00')
+    bot.checkin_partitions.ensure(sheet)
+    written_row = ['7', 'Budi', 'budi', '2024-01-15 08:00:00', 'Outlet A', 'Jakarta', 'https://maps', '7:1']
+    lost_row = ['7', 'Budi', 'budi', '2024-01-15 09:00:00', 'Outlet B', 'Jakarta', 'https://maps', '7:2']
+    # Baris pertama sudah sampai ke sheet tetapi hasil append-nya tidak pasti (timeout)
+    bot.storage_backend.run(sheet, lambda ws: ws.append_rows([written_row]))
+    written_id, _ = bot.checkin_journal.append('7:1', sheet, written_row)
+    bot.checkin_journal.record_failure([written_id], "timeout")
+    lost_id, _ = bot.checkin_journal.append('7:2', sheet, lost_row)
+
+    bot_loop.run_until_complete(bot.replay_journal_job(None))
+
+    keys = bot.storage_backend.run(sheet, lambda ws: ws.col_values(len(written_row)))
+    assert keys.count('7:1') == 1
+    assert keys.count('7:2') == 1
+    pending_ids = {entry.id for entry in bot.checkin_journal.pending()}
+    assert written_id not in pending_ids and lost_id not in pending_ids
+
+
+def test_sent_ids_reports_only_sent_entries(tmp_path):
+    journal = open_journal(tmp_path)
+    ids = [journal.append(f"k{i}", 'Checkins', [str(i)])[0] for i in range(3)]
+    journal.mark_sent([ids[1]])
+    assert journal.sent_ids(ids) == {ids[1]}
+    assert journal.sent_ids([]) == set()
+
+
+def test_prune_removes_only_entries_sent_before_the_cutoff(tmp_path, monkeypatch):
+    journal = open_journal(tmp_path)
+    now = [1_000_000.0]
+    monkeypatch.setattr('checkin_journal.time.time', lambda: now[0])
+    old_sent, recent_sent, old_pending = [journal.append(f"k{i}", 'Checkins', [str(i)])[0] for i in range(3)]
+    journal.mark_sent([old_sent])
+    now[0] += 3 * 86400
+    journal.mark_sent([recent_sent])
+    now[0] += 3600
+
+    assert journal.prune(86400, chunk=1) == 1
+    assert [entry.id for entry in journal.recent(0)] == [recent_sent, old_pending]
+    assert [entry.id for entry in journal.pending()] == [old_pending]
+    assert journal.prune(86400) == 0
+    # Kunci yang sudah dihapus bisa dicatat lagi sebagai entri baru
+    assert journal.append('k0', 'Checkins', ['0'])[1]
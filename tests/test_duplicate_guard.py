@@ -0,0 +1,74 @@
+import threading
+
+from checkin_journal import JournalEntry
+from duplicate_guard import DuplicateGuard
+
+LAT, LNG = -6.2, 106.8
+# Sekitar 11 m ke utara per 0.0001 derajat lintang
+NEAR = LAT + 0.0002
+FAR = LAT + 0.002
+
+
+def make_guard(window=600, radius=50):
+    guard = DuplicateGuard(window_seconds=window, radius_m=radius)
+    guard.record(7, LAT, LNG, 'Outlet  Melati', 'Jakarta', '7:1', at=1000)
+    return guard
+
+
+def test_same_outlet_nearby_within_window_is_found():
+    previous = make_guard().find(7, NEAR, LNG, 'outlet melati', now=1300)
+    assert previous is not None and previous.checkin_id == '7:1'
+
+
+def test_name_is_compared_after_normalisation():
+    guard = make_guard()
+    assert guard.find(7, LAT, LNG, '  OUTLET\tmelati ', now=1001) is not None
+    assert guard.find(7, LAT, LNG, 'Outlet Mawar', now=1001) is None
+
+
+def test_outside_radius_or_other_user_is_not_a_duplicate():
+    guard = make_guard()
+    assert guard.find(7, FAR, LNG, 'Outlet Melati', now=1001) is None
+    assert guard.find(8, LAT, LNG, 'Outlet Melati', now=1001) is None
+
+
+def test_window_expiry_prunes_old_checkins():
+    guard = make_guard(window=600)
+    assert guard.find(7, LAT, LNG, 'Outlet Melati', now=1600) is not None
+    assert guard.find(7, LAT, LNG, 'Outlet Melati', now=1601) is None
+    assert guard.stats() == {'users': 0, 'checkins': 0, 'suppressed': 0}
+
+
+def test_latest_matching_checkin_is_returned():
+    guard = make_guard()
+    guard.record(7, NEAR, LNG, 'Outlet Melati', 'Jakarta', '7:2', at=1100)
+    assert guard.find(7, LAT, LNG, 'Outlet Melati', now=1200).checkin_id == '7:2'
+
+
+def test_seed_from_journal_entries_skips_unusable_rows():
+    guard = DuplicateGuard(window_seconds=600, radius_m=50)
+    row = ['7', 'Budi', 'budi', '2026-10-17 01:00:00', 'Outlet Melati', 'Jakarta', f"https://www.google.com/maps?q={LAT},{LNG}", '7:1']
+    entries = [
+        JournalEntry(1, '7:1', 'Check-in 2026-10', row, 1000, 0),
+        JournalEntry(2, '7:2', 'Check-in 2026-10', row[:6] + ['tanpa koordinat', '7:2'], 1000, 0),
+        JournalEntry(3, 'x:3', 'Check-in 2026-10', ['bukan-id'] + row[1:], 1000, 0),
+    ]
+    assert guard.seed(entries) == 1
+    assert guard.find(7, NEAR, LNG, 'outlet melati', now=1500).checkin_id == '7:1'
+    # Waktu dari created_at entri jurnal: jendela tetap dihitung dari check-in aslinya
+    assert guard.find(7, LAT, LNG, 'Outlet Melati', now=1601) is None
+
+
+def test_mark_suppressed_is_safe_across_threads():
+    guard = DuplicateGuard(window_seconds=600, radius_m=50)
+
+    def mark():
+        for _ in range(1000):
+            guard.mark_suppressed()
+
+    threads = [threading.Thread(target=mark) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert guard.stats()['suppressed'] == 4000
@@ -0,0 +1,100 @@
+import csv
+import gzip
+import io
+
+import numpy as np
+import pytest
+
+from export import FORMAT_CSV, FORMAT_CSV_GZ, FORMAT_PARQUET, CheckinExporter, ExportError
+
+HEADERS = ['User id', 'Nama', 'Username', 'Timestamp', 'Nama Lokasi', 'Wilayah', 'Link', 'checkin_id']
+
+
+def day(date: str) -> int:
+    return int(np.datetime64(date, 'D').astype(np.int64))
+
+
+def row(user_id, timestamp, location='Outlet, "Melati"'):
+    return [user_id, 'Budi', 'budi', timestamp, location, 'Jakarta', 'https://maps', f"{user_id}:{timestamp}"]
+
+
+ROWS = [
+    row('1', '2026-10-14 16:59:59'), # 14 Okt WIB
+    row('1', '2026-10-14 17:00:00'), # 15 Okt WIB
+    row('2', '2026-10-15 08:00:00', 'Kafé ☕'),
+    row('3', '2026-10-16 08:00:00'),
+    row('2', '2026-10-17 08:00:00'),
+    row('2', 'rusak'),
+]
+
+
+def read_csv(content: bytes, fmt: str) -> list:
+    if fmt == FORMAT_CSV_GZ:
+        content = gzip.decompress(content)
+    text = content.decode('utf-8')
+    if fmt == FORMAT_CSV:
+        assert text.startswith('﻿') # BOM untuk Excel
+    return list(csv.reader(io.StringIO(text.lstrip('﻿'))))
+
+
+def export(fmt=FORMAT_CSV, chunks=(ROWS[:3], ROWS[3:]), **filters):
+    exporter = CheckinExporter(HEADERS, fmt, **filters)
+    for chunk in chunks:
+        exporter.write_rows(chunk)
+    content, size = exporter.finish()
+    return exporter, content, size
+
+
+@pytest.mark.parametrize('fmt', [FORMAT_CSV, FORMAT_CSV_GZ])
+def test_csv_round_trip_without_filters(fmt):
+    exporter, content, size = export(fmt)
+    assert isinstance(content, bytes) and size == len(content)
+    assert read_csv(content, fmt) == [HEADERS] + ROWS
+    assert (exporter.rows_read, exporter.rows_written) == (6, 6)
+
+
+@pytest.mark.parametrize('fmt', [FORMAT_CSV, FORMAT_CSV_GZ])
+def test_day_range_uses_gmt7_dates_and_drops_unreadable_timestamps(fmt):
+    exporter, content, _ = export(fmt, start_day=day('2026-10-15'), end_day=day('2026-10-16'))
+    assert read_csv(content, fmt)[1:] == [ROWS[1], ROWS[2], ROWS[3]]
+    assert (exporter.rows_read, exporter.rows_written) == (6, 3)
+
+
+def test_user_filter_combines_with_open_ended_day_range():
+    _, content, _ = export(user_ids=[2, '3'], start_day=day('2026-10-16'))
+    assert read_csv(content, FORMAT_CSV)[1:] == [ROWS[3], ROWS[4]]
+
+
+def test_short_and_long_rows_are_fitted_to_headers():
+    _, content, _ = export(chunks=([['9', 'Ani'], row('9', '2026-10-15 08:00:00') + ['ekstra']],))
+    assert read_csv(content, FORMAT_CSV)[1:] == [['9', 'Ani', '', '', '', '', '', ''], row('9', '2026-10-15 08:00:00')]
+
+
+def test_finish_returns_file_on_disk_once_spool_limit_is_exceeded():
+    exporter = CheckinExporter(HEADERS, FORMAT_CSV, spool_max_bytes=1024)
+    for i in range(100):
+        exporter.write_rows([row(str(i), '2026-10-15 08:00:00')])
+    content, size = exporter.finish()
+    try:
+        assert size > 1024
+        assert not isinstance(content, bytes)
+        assert content.name # File di disk punya nama (dibutuhkan InputFile PTB)
+        assert content.tell() == 0
+        assert len(read_csv(content.read(), FORMAT_CSV)) == 101
+    finally:
+        exporter.close()
+
+
+def test_invalid_format_and_spool_size_are_rejected():
+    with pytest.raises(ExportError):
+        CheckinExporter(HEADERS, 'xlsx')
+    with pytest.raises(ExportError):
+        CheckinExporter(HEADERS, FORMAT_CSV, spool_max_bytes=0)
+
+
+def test_parquet_round_trip():
+    pq = pytest.importorskip('pyarrow.parquet')
+    _, content, _ = export(FORMAT_PARQUET, user_ids=['2'])
+    table = pq.read_table(io.BytesIO(content))
+    assert table.column_names == HEADERS
+    assert [list(r.values()) for r in table.to_pylist()] == [ROWS[2], ROWS[4], ROWS[5]]
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import threading
+
+from checkin_journal import CheckinJournal
+from location_ingest import LOCATIONS_SHEET, LocationIngestor, handle_batch_async
+from resilience import CircuitBreaker, ResilientPool, RetryPolicy
+from storage import BlockingCallPool, MemoryStorage
+
+
+def make_ingestor(tmp_path, latency=0.0):
+    storage = MemoryStorage({}, latency=latency)
+    return LocationIngestor(storage, CheckinJournal(str(tmp_path / 'locations.db'))), storage
+
+
+def location(i):
+    return {'latitude': -6.2, 'longitude': 106.8 + i / 1000, 'client_id': f"c{i}"}
+
+
+def sheet_keys(storage):
+    return [row[-1] for row in storage.run(LOCATIONS_SHEET, lambda ws: ws.get_all_values())[1:]]
+
+
+def test_claim_pending_hands_each_entry_to_one_sender(tmp_path):
+    journal = CheckinJournal(str(tmp_path / 'journal.db'))
+    ids = [journal.append(f"k{i}", LOCATIONS_SHEET, [i])[0] for i in range(3)]
+    first = journal.claim_pending(limit=2, sheet=LOCATIONS_SHEET)
+    assert [entry.id for entry in first] == ids[:2]
+    assert [entry.id for entry in journal.claim_pending(sheet=LOCATIONS_SHEET)] == ids[2:]
+    assert journal.claim_pending(sheet=LOCATIONS_SHEET) == []
+    # Kegagalan melepas klaim; klaim yang kedaluwarsa bisa diambil lagi
+    journal.record_failure([ids[0]], "timeout")
+    assert [entry.id for entry in journal.claim_pending(sheet=LOCATIONS_SHEET, lease=-1)] == [ids[0]]
+    assert [entry.id for entry in journal.claim_pending(sheet=LOCATIONS_SHEET)] == [ids[0]]
+
+
+def test_concurrent_batches_write_every_location_once(tmp_path):
+    ingestor, storage = make_ingestor(tmp_path, latency=0.02)
+    threads = [threading.Thread(target=ingestor.ingest, args=([location(i)],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(sheet_keys(storage)) == [f"c{i}" for i in range(8)]
+    assert ingestor.journal.stats()['pending'] == 0
+
+
+def test_async_batch_skips_sheets_while_breaker_is_open_and_catches_up(tmp_path):
+    ingestor, storage = make_ingestor(tmp_path)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+
+    async def main():
+        sheets_pool = ResilientPool(BlockingCallPool(1), RetryPolicy(max_retries=0), breaker)
+        journal_pool = BlockingCallPool(1)
+        try:
+            breaker.record_failure()
+            body = json.dumps([location(0), location(1)]).encode()
+            status, queued = await handle_batch_async(ingestor, body, 'application/json', 10, sheets_pool, journal_pool)
+            assert status == 200 and queued['summary']['queued'] == 2
+            assert storage.calls == {}
+
+            breaker.record_success()
+            body = json.dumps([location(2)]).encode()
+            return await handle_batch_async(ingestor, body, 'application/json', 10, sheets_pool, journal_pool)
+        finally:
+            sheets_pool.shutdown()
+            journal_pool.shutdown()
+
+    status, stored = asyncio.run(main())
+    assert status == 200 and stored['summary']['stored'] == 1
+    assert sheet_keys(storage) == ['c0', 'c1', 'c2']
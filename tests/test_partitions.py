@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+
+import partitions
+from partitions import LEGACY_CHECKIN_SHEET, CheckinPartitions, PartitionedTailReader, partition_month
+from storage import MemoryStorage
+
+HEADER = ['User id', 'Nama', 'Username', 'Timestamp', 'Nama Lokasi', 'Wilayah', 'Link', 'checkin_id']
+
+
+def day(date: str) -> int:
+    return int(np.datetime64(date, 'D').astype(np.int64))
+
+
+def checkin(timestamp: str, key: str) -> list:
+    return ['7', 'Budi', 'budi', timestamp, 'Outlet', 'Jakarta', 'https://maps', key]
+
+
+def test_sheet_for_routes_by_month_in_gmt7():
+    parts = CheckinPartitions(MemoryStorage(), HEADER)
+    # 17:30 UTC tanggal 30 sudah 00:30 WIB tanggal 1 bulan berikutnya
+    assert parts.sheet_for('2026-09-30 17:30:00') == 'Check-in 2026-10'
+    assert parts.sheet_for('2026-09-30 16:59:59') == 'Check-in 2026-09'
+    assert parts.sheet_for('2026-12-31 17:00:00') == 'Check-in 2027-01'
+    assert CheckinPartitions(MemoryStorage(), HEADER, enabled=False).sheet_for('2026-09-30 17:30:00') == LEGACY_CHECKIN_SHEET
+
+
+def test_sheet_for_unreadable_timestamp_uses_current_month(monkeypatch):
+    monkeypatch.setattr(partitions, 'today_day', lambda: day('2026-10-17'))
+    assert CheckinPartitions(MemoryStorage(), HEADER).sheet_for('bukan waktu') == 'Check-in 2026-10'
+
+
+def test_ensure_creates_new_month_once_with_header():
+    storage = MemoryStorage({LEGACY_CHECKIN_SHEET: [HEADER]})
+    parts = CheckinPartitions(storage, HEADER)
+    threads = [threading.Thread(target=parts.ensure, args=('Check-in 2026-10',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    parts.ensure('Check-in 2026-10')
+    parts.ensure('Bukan partisi') # Diabaikan
+
+    assert parts.created == 1
+    assert storage.worksheet_titles() == [LEGACY_CHECKIN_SHEET, 'Check-in 2026-10']
+    assert storage.run('Check-in 2026-10', lambda ws: ws.get_all_values()) == [HEADER]
+    assert parts.titles() == [LEGACY_CHECKIN_SHEET, 'Check-in 2026-10']
+
+
+def test_titles_for_days_keeps_legacy_sheet_and_matching_months():
+    storage = MemoryStorage({LEGACY_CHECKIN_SHEET: [HEADER]})
+    parts = CheckinPartitions(storage, HEADER)
+    for month in ('2026-08', '2026-09', '2026-10'):
+        parts.ensure(f"Check-in {month}")
+    assert parts.titles_for_days(day('2026-09-15'), day('2026-10-01')) == [LEGACY_CHECKIN_SHEET, 'Check-in 2026-09', 'Check-in 2026-10']
+    assert [partition_month(t) for t in parts.titles_for_days(start_day=day('2026-10-01'))] == [None, '2026-10']
+
+
+def test_tail_reader_skips_closed_partitions_after_first_read(monkeypatch):
+    monkeypatch.setattr(partitions, 'today_day', lambda: day('2026-10-17'))
+    storage = MemoryStorage()
+    parts = CheckinPartitions(storage, HEADER)
+    for month in ('2026-07', '2026-08', '2026-09', '2026-10'):
+        parts.ensure(f"Check-in {month}")
+        storage.run(f"Check-in {month}", lambda ws: ws.append_rows([checkin(f"{month}-02 08:00:00", f"{month}-a")]))
+    reader = PartitionedTailReader(parts, last_column='H', open_months=2)
+
+    # Pembacaan pertama membaca semua partisi
+    assert sorted(row[-1] for _, _, row in reader.read_new()) == ['2026-07-a', '2026-08-a', '2026-09-a', '2026-10-a']
+
+    for month in ('2026-07', '2026-08', '2026-09', '2026-10'):
+        storage.run(f"Check-in {month}", lambda ws: ws.append_rows([checkin(f"{month}-03 08:00:00", f"{month}-b")]))
+    # Juli dan Agustus sudah lewat lebih dari 2 bulan dari Oktober: tidak dibaca lagi
+    assert sorted(row[-1] for _, _, row in reader.read_new()) == ['2026-09-b', '2026-10-b']
+    assert reader.read_new() == []
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter
+
+from rate_limiter import PRIORITY_BROADCAST, PRIORITY_INTERACTIVE, PRIORITY_NOTIFICATION, PriorityRateLimiter
+
+
+class FakeTelegram:
+    """Callback request palsu: mencatat (label, waktu loop) setiap pengiriman; bisa gagal dengan RetryAfter."""
+
+    def __init__(self):
+        self.sent = []
+        self.retry_after = {} # label -> daftar jeda RetryAfter untuk percobaan berikutnya
+
+    async def send(self, label):
+        delays = self.retry_after.get(label)
+        if delays:
+            raise RetryAfter(delays.pop(0))
+        self.sent.append((label, asyncio.get_running_loop().time()))
+        return label
+
+    def labels(self):
+        return [label for label, _ in self.sent]
+
+
+def request(limiter, telegram, label, chat_id, priority=None):
+    return asyncio.ensure_future(limiter.process_request(telegram.send, (label,), {}, 'sendMessage', {'chat_id': chat_id}, priority))
+
+
+def run_limiter(scenario, **limits):
+    async def main():
+        limiter = PriorityRateLimiter(**limits)
+        await limiter.initialize()
+        try:
+            return await scenario(limiter, FakeTelegram())
+        finally:
+            await limiter.shutdown()
+    return asyncio.run(main())
+
+
+def test_interactive_reply_goes_ahead_of_broadcast_backlog():
+    async def scenario(limiter, telegram):
+        broadcasts = [request(limiter, telegram, f"b{i}", 1000 + i, PRIORITY_BROADCAST) for i in range(15)]
+        await asyncio.sleep(0.01) # Burst global (10) habis dipakai broadcast
+        assert len(telegram.sent) == 10
+        reply = request(limiter, telegram, 'reply', 1)
+        notification = request(limiter, telegram, 'notify', 2, PRIORITY_NOTIFICATION)
+        await asyncio.gather(reply, notification)
+        assert limiter.queue_depths()['broadcast'] > 0
+        await asyncio.gather(*broadcasts)
+        return telegram.labels(), limiter.sent
+
+    labels, sent = run_limiter(scenario, global_rate=10, chat_rate=0)
+    assert labels[10:12] == ['reply', 'notify']
+    assert labels[12:] == [f"b{i}" for i in range(10, 15)]
+    assert sent == [1, 1, 15]
+
+
+def test_chat_without_tokens_is_skipped_without_blocking_other_chats():
+    async def scenario(limiter, telegram):
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(
+            request(limiter, telegram, 'a1', 1, PRIORITY_BROADCAST),
+            request(limiter, telegram, 'a2', 1, PRIORITY_BROADCAST),
+            request(limiter, telegram, 'b1', 2, PRIORITY_BROADCAST),
+        )
+        return [(label, at - started) for label, at in telegram.sent]
+
+    sent = run_limiter(scenario, global_rate=0, chat_rate=10, chat_burst=1)
+    assert [label for label, _ in sent] == ['a1', 'b1', 'a2']
+    assert sent[1][1] < 0.05 # b1 tidak menunggu bucket chat 1
+    assert sent[2][1] >= 0.09 # a2 menunggu token chat 1 (10/detik)
+
+
+def test_group_chats_use_the_per_minute_bucket():
+    async def scenario(limiter, telegram):
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(*(request(limiter, telegram, f"g{i}", -100123) for i in range(2)))
+        await asyncio.gather(*(request(limiter, telegram, f"p{i}", 5) for i in range(2)))
+        return {label: at - started for label, at in telegram.sent}
+
+    sent = run_limiter(scenario, global_rate=0, chat_rate=100, chat_burst=5, group_rate_per_minute=600)
+    assert sent['g0'] < 0.05 and sent['g1'] >= 0.09 # Grup: burst 1, 10/detik
+    assert sent['p1'] - sent['p0'] < 0.05 # Chat pribadi: burst 5
+
+
+def test_retry_after_pauses_every_lane_then_retries():
+    async def scenario(limiter, telegram):
+        loop = asyncio.get_running_loop()
+        telegram.retry_after['a'] = [0.2]
+        started = loop.time()
+        first = request(limiter, telegram, 'a', 1)
+        await asyncio.sleep(0.05) # 'a' sudah ditolak; jeda berlaku
+        other = request(limiter, telegram, 'b', 2)
+        results = await asyncio.gather(first, other)
+        return results, {label: at - started for label, at in telegram.sent}, limiter.retry_after_total
+
+    results, sent, retry_after_total = run_limiter(scenario, global_rate=0, chat_rate=0)
+    assert results == ['a', 'b']
+    assert retry_after_total == 1
+    assert sent['a'] >= 0.2 and sent['b'] >= 0.2 # Chat lain juga ikut menunggu jeda
+
+
+def test_retry_after_is_raised_after_max_retries():
+    async def scenario(limiter, telegram):
+        telegram.retry_after['a'] = [0.01, 0.01]
+        with pytest.raises(RetryAfter):
+            await request(limiter, telegram, 'a', 1)
+        return limiter.retry_after_total
+
+    assert run_limiter(scenario, global_rate=0, chat_rate=0, max_retries=1) == 2
+
+
+def test_requests_without_chat_or_priority_use_interactive_lane():
+    async def scenario(limiter, telegram):
+        await limiter.process_request(telegram.send, ('me',), {}, 'getMe', None, None)
+        await limiter.process_request(telegram.send, ('x',), {}, 'sendMessage', {'chat_id': 1}, 'bukan prioritas')
+        return limiter.sent
+
+    assert run_limiter(scenario)[PRIORITY_INTERACTIVE] == 2
@@ -0,0 +1,154 @@
+import asyncio
+import random
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, ResilientPool, RetryPolicy, classify_error, is_rejected
+from storage import BlockingCallPool, TransientStorageError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_retry_delay_is_bounded_by_exponential_backoff_and_max_delay():
+    random.seed(1)
+    policy = RetryPolicy(max_retries=5, base_delay=0.5, max_delay=4.0)
+    for attempt, ceiling in [(0, 0.5), (1, 1.0), (2, 2.0), (3, 4.0), (10, 4.0)]:
+        delays = [policy.delay(attempt) for _ in range(200)]
+        assert all(0 <= d <= ceiling for d in delays)
+    assert max(policy.delay(10) for _ in range(200)) > 2.0
+
+
+def test_retry_delay_honours_retry_after():
+    policy = RetryPolicy(base_delay=0.5, max_delay=1.0)
+    assert all(policy.delay(0, retry_after=7.5) == 7.5 for _ in range(50))
+
+
+def test_breaker_opens_after_threshold_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=FakeClock())
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success() # Keberhasilan mereset hitungan berturut-turut
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.opened_total == 1
+    assert breaker.retry_after() == 30
+
+
+def test_breaker_half_open_allows_single_trial_then_closes_on_success():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.state == CircuitBreaker.OPEN and breaker.retry_after() == 20
+    clock.now += 20
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow() # Hanya satu panggilan percobaan
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_breaker_reopens_when_half_open_trial_fails():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30, clock=clock)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_after() == 30
+    assert breaker.opened_total == 2
+
+
+def test_classify_error():
+    assert classify_error(TransientStorageError("kuota", status=429, retry_after=2.0)) == (True, 429, 2.0)
+    assert classify_error(ValueError("bug")) == (False, None, None)
+    assert is_rejected(TransientStorageError("kuota", status=429))
+    assert not is_rejected(TransientStorageError("server", status=503))
+    assert is_rejected(CircuitOpenError("terbuka"))
+
+
+class FlakyCall:
+    """Gagal dengan exception dari `errors` secara berurutan, lalu mengembalikan 'ok'."""
+
+    __name__ = 'flaky_call' # Label log/metrik ResilientPool
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+def run_pool(func, idempotent, breaker=None, max_retries=3):
+    async def main():
+        pool = ResilientPool(
+            BlockingCallPool(1, thread_name_prefix="test-resilient"),
+            RetryPolicy(max_retries=max_retries, base_delay=0.001, max_delay=0.001),
+            breaker or CircuitBreaker(failure_threshold=10, reset_timeout=30),
+        )
+        try:
+            result = await (pool.run_idempotent(func) if idempotent else pool.run(func))
+            return result, pool
+        finally:
+            pool.pool.shutdown()
+    return asyncio.run(main())
+
+
+def test_idempotent_call_retries_server_errors():
+    func = FlakyCall(TransientStorageError("503", status=503), TransientStorageError("putus"))
+    result, pool = run_pool(func, idempotent=True)
+    assert result == 'ok' and func.calls == 3
+    assert pool.stats()['retries'] == {'503': 1, 'connection': 1}
+
+
+def test_non_idempotent_call_retries_only_quota_errors():
+    func = FlakyCall(TransientStorageError("429", status=429))
+    assert run_pool(func, idempotent=False)[0] == 'ok'
+    assert func.calls == 2
+
+    func = FlakyCall(TransientStorageError("503", status=503))
+    with pytest.raises(TransientStorageError):
+        run_pool(func, idempotent=False)
+    assert func.calls == 1
+
+
+def test_retries_stop_after_max_retries():
+    func = FlakyCall(*[TransientStorageError("429", status=429) for _ in range(5)])
+    with pytest.raises(TransientStorageError):
+        run_pool(func, idempotent=True, max_retries=2)
+    assert func.calls == 3
+
+
+def test_request_errors_are_not_retried_and_do_not_trip_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    func = FlakyCall(ValueError("permintaan salah"))
+    with pytest.raises(ValueError):
+        run_pool(func, idempotent=True, breaker=breaker)
+    assert func.calls == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_rejects_without_calling_api():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    func = FlakyCall()
+    with pytest.raises(CircuitOpenError) as excinfo:
+        run_pool(func, idempotent=True, breaker=breaker)
+    assert func.calls == 0
+    assert 0 < excinfo.value.retry_after <= 30
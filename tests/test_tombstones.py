@@ -0,0 +1,73 @@
+import loadtest
+from user_table import REMOVED_AT_HEADER, REQUIRED_HEADERS, without_tombstones
+
+HEADER = REQUIRED_HEADERS + [REMOVED_AT_HEADER]
+
+
+def test_without_tombstones_drops_removed_rows_and_counts_them():
+    data = [
+        HEADER,
+        ['1', 'admin', 'A'],
+        ['2', 'removed', 'B', '', '', '', '', '2024-01-01 10:00:00'],
+        ['3', ' Removed ', 'C'],
+        ['4', 'user', 'D'],
+    ]
+    kept, removed = without_tombstones(data)
+    assert kept == [HEADER, ['1', 'admin', 'A'], ['4', 'user', 'D']]
+    assert removed == 2
+
+
+def test_without_tombstones_uses_role_column_from_header():
+    data = [['nama', 'user_id', 'role'], ['A', '1', 'removed'], ['B', '2', 'user'], ['C', '3']]
+    assert without_tombstones(data) == ([['nama', 'user_id', 'role'], ['B', '2', 'user'], ['C', '3']], 1)
+
+
+def test_without_tombstones_without_removed_rows_or_data():
+    data = [HEADER, ['1', 'user']]
+    assert without_tombstones(data) == (data, 0)
+    assert without_tombstones([]) == ([], 0)
+
+
+def test_remove_user_writes_tombstone_and_compaction_drops_it(bot_module, bot_loop, users_sheet):
+    bot = bot_module
+    loadtest.seed_users(bot, [100], [201, 202, 203])
+    rows_before = users_sheet.run("Users", lambda ws: ws.get_all_values())
+
+    results = bot_loop.run_until_complete(bot.manage_users_in_sheet([202, 100], 'user', 'remove_user', bot.OWNER_ID, 'Owner'))
+    assert all(success for _, success, _ in results)
+    bot.apply_user_roles(save_snapshot=False)
+    assert 202 not in bot.user_ids and 100 not in bot.admin_ids
+
+    # Tombstone: baris tetap di tempatnya (nomor baris lain tidak bergeser) dengan kolom removed_at baru
+    tombstoned = users_sheet.run("Users", lambda ws: ws.get_all_values())
+    assert len(tombstoned) == len(rows_before)
+    assert tombstoned[0][-1] == REMOVED_AT_HEADER
+    by_id = {row[0]: row for row in tombstoned[1:]}
+    assert by_id['202'][1] == 'removed' and by_id['202'][-1]
+    assert by_id['203'][1] == 'user' and not by_id['203'][-1]
+
+    assert bot.compact_users_sheet() == 2
+    compacted = users_sheet.run("Users", lambda ws: ws.get_all_values())
+    assert [row[0] for row in compacted[1:]] == ['201', '203']
+    assert [row[1] for row in compacted[1:]] == ['user', 'user']
+    assert compacted[0][-1] == REMOVED_AT_HEADER
+    assert [row[0] for row in bot.user_table.rows()[1:]] == ['201', '203']
+    assert bot.user_ids == {bot.OWNER_ID, 201, 203}
+    assert bot.admin_ids == {bot.OWNER_ID}
+
+    # Checksum sudah mengikuti isi baru: refresh berikutnya tidak membangun ulang tabel
+    assert bot.refresh_user_roles() is False
+    assert bot.compact_users_sheet() == 0
+
+
+def test_readding_removed_user_reuses_tombstone_row(bot_module, bot_loop, users_sheet):
+    bot = bot_module
+    loadtest.seed_users(bot, [], [301, 302])
+    bot_loop.run_until_complete(bot.manage_users_in_sheet([301], 'user', 'remove_user', bot.OWNER_ID, 'Owner'))
+    results = bot_loop.run_until_complete(bot.manage_users_in_sheet([301], 'admin', 'add', bot.OWNER_ID, 'Owner'))
+    assert results[0][1]
+
+    rows = users_sheet.run("Users", lambda ws: ws.get_all_values())
+    assert [row[0] for row in rows[1:]] == ['301', '302']
+    assert rows[1][1] == 'admin' and rows[1][-1] == ''
+    assert bot.compact_users_sheet() == 0
@@ -0,0 +1,125 @@
+import asyncio
+from types import SimpleNamespace
+
+from update_processor import PerUserUpdateProcessor
+
+
+def update_from(user_id=None, chat_id=None):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id) if user_id is not None else None,
+        effective_chat=SimpleNamespace(id=chat_id) if chat_id is not None else None,
+    )
+
+
+def run_processor(scenario, max_concurrent_updates=8, max_queue_per_user=4):
+    async def main():
+        # Dibuat di dalam loop: semaphore BaseUpdateProcessor terikat ke loop yang berjalan
+        processor = PerUserUpdateProcessor(max_concurrent_updates, max_queue_per_user)
+        return await scenario(processor)
+    return asyncio.run(main())
+
+
+def test_updates_from_one_user_run_in_arrival_order():
+    events = []
+
+    async def handler(name, delay):
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        events.append(f"end {name}")
+
+    async def scenario(processor):
+        # Update pertama lebih lambat: tanpa urutan per pengguna update kedua akan selesai lebih dulu
+        await asyncio.gather(
+            processor.process_update(update_from(1), handler('a', 0.05)),
+            processor.process_update(update_from(1), handler('b', 0)),
+            processor.process_update(update_from(1), handler('c', 0)),
+        )
+
+    run_processor(scenario)
+    assert events == ['start a', 'end a', 'start b', 'end b', 'start c', 'end c']
+
+
+def test_updates_from_different_users_overlap():
+    async def scenario(processor):
+        started = {1: asyncio.Event(), 2: asyncio.Event()}
+        peak = []
+
+        async def handler(user_id):
+            started[user_id].set()
+            # Hanya selesai jika update pengguna lain juga sudah mulai (berjalan bersamaan)
+            peak.append(processor.running)
+            await asyncio.wait_for(started[3 - user_id].wait(), timeout=1)
+
+        await asyncio.gather(
+            processor.process_update(update_from(1), handler(1)),
+            processor.process_update(update_from(2), handler(2)),
+        )
+        return processor, peak
+
+    processor, peak = run_processor(scenario)
+    assert peak[-1] == 2
+    assert processor.running == 0 and processor.queued == 0
+
+
+def test_overflow_beyond_per_user_queue_is_dropped_and_counted():
+    ran = []
+
+    async def scenario(processor):
+        release = asyncio.Event()
+
+        async def handler(name):
+            await release.wait()
+            ran.append(name)
+
+        tasks = [asyncio.ensure_future(processor.process_update(update_from(7), handler(i))) for i in range(4)]
+        other = asyncio.ensure_future(processor.process_update(update_from(8), handler('lain')))
+        await asyncio.sleep(0.01)
+        assert processor.queued == 1 # Update kedua pengguna 7 menunggu giliran
+        assert processor.running == 2
+        release.set()
+        await asyncio.gather(*tasks, other)
+        return processor
+
+    processor = run_processor(scenario, max_queue_per_user=2)
+    assert processor.dropped == 2
+    assert sorted(ran, key=str) == [0, 1, 'lain']
+    assert processor.queued == 0 and not processor._tails
+
+
+def test_updates_without_user_are_ordered_by_chat_and_anonymous_ones_run_freely():
+    assert PerUserUpdateProcessor.ordering_key(update_from(user_id=5, chat_id=9)) == ('user', 5)
+    assert PerUserUpdateProcessor.ordering_key(update_from(chat_id=-100)) == ('chat', -100)
+    assert PerUserUpdateProcessor.ordering_key(object()) is None
+
+    async def scenario(processor):
+        async def handler():
+            return None
+        await processor.process_update(object(), handler())
+        return processor
+
+    assert run_processor(scenario).dropped == 0
+
+
+def test_cancelled_waiting_update_does_not_block_the_next_one():
+    events = []
+
+    async def scenario(processor):
+        release = asyncio.Event()
+
+        async def handler(name):
+            if name == 'a':
+                await release.wait()
+            events.append(name)
+
+        first = asyncio.ensure_future(processor.process_update(update_from(3), handler('a')))
+        second = asyncio.ensure_future(processor.process_update(update_from(3), handler('b')))
+        third = asyncio.ensure_future(processor.process_update(update_from(3), handler('c')))
+        await asyncio.sleep(0.01)
+        second.cancel()
+        release.set()
+        await asyncio.gather(first, third)
+        return processor
+
+    processor = run_processor(scenario)
+    assert events == ['a', 'c']
+    assert processor.queued == 0 and not processor._tails
@@ -0,0 +1,67 @@
+from user_table import parse_user_ids, parse_user_ids_csv
+
+
+def test_parse_user_ids_accepts_mixed_separators_and_keeps_order():
+    assert parse_user_ids("111 222,333;444\n555\t666") == ([111, 222, 333, 444, 555, 666], [])
+    assert parse_user_ids(" 10 ,, ; 20 \n\n") == ([10, 20], [])
+
+
+def test_parse_user_ids_deduplicates_and_reports_invalid_tokens():
+    ids, invalid = parse_user_ids("300 100 abc 300 12x 100 -5")
+    assert ids == [300, 100, -5]
+    assert invalid == ['abc', '12x']
+
+
+def test_parse_user_ids_empty_input():
+    assert parse_user_ids("") == ([], [])
+    assert parse_user_ids(None) == ([], [])
+
+
+def test_parse_user_ids_csv_uses_user_id_column():
+    data = "nama,User_ID,role\nBudi,111,user\nSiti,222,admin\nAni,,user\nTono,x9,user\n".encode()
+    assert parse_user_ids_csv(data) == ([111, 222], ['x9'])
+
+
+def test_parse_user_ids_csv_skips_header_of_first_column():
+    data = "id telegram,nama\n111,Budi\n222,Siti\n111,Budi lagi\n".encode()
+    assert parse_user_ids_csv(data) == ([111, 222], [])
+
+
+def test_parse_user_ids_csv_without_header_and_with_bom_and_blank_lines():
+    data = "﻿111\n\n222\r\n  333  \n,\n".encode('utf-8')
+    assert parse_user_ids_csv(data) == ([111, 222, 333], [])
+
+
+def test_parse_user_ids_csv_empty_file():
+    assert parse_user_ids_csv(b"") == ([], [])
+
+
+def test_batch_add_appends_new_users_in_one_call_and_updates_roles(bot_module, bot_loop, users_sheet):
+    bot = bot_module
+    target_ids, invalid = parse_user_ids("501 502,503\n501")
+    appends_before = users_sheet.calls.get('append_rows', 0)
+    results = bot_loop.run_until_complete(bot.manage_users_in_sheet(target_ids, 'user', 'add', bot.OWNER_ID, 'Owner'))
+    assert [(user_id, success) for user_id, success, _ in results] == [(501, True), (502, True), (503, True)]
+    assert users_sheet.calls.get('append_rows', 0) - appends_before == 1
+
+    bot.apply_user_roles(save_snapshot=False)
+    assert {501, 502, 503} <= bot.user_ids
+    assert not {501, 502, 503} & bot.admin_ids
+    rows = users_sheet.run("Users", lambda ws: ws.get_all_values())
+    assert sorted(row[0] for row in rows[1:]) == ['501', '502', '503']
+
+
+def test_batch_errors_are_escaped_for_markdown_summary(bot_module, bot_loop, users_sheet, monkeypatch):
+    bot = bot_module
+
+    async def failing_write(*args, **kwargs):
+        raise ValueError("RESOURCE_EXHAUSTED: quota *write_requests*")
+
+    monkeypatch.setattr(bot, 'run_on_worksheet', failing_write)
+    results = bot_loop.run_until_complete(bot.manage_users_in_sheet([601, 602], 'user', 'add', bot.OWNER_ID, 'Owner'))
+    assert [success for _, success, _ in results] == [False, False]
+    assert results[0][2] == "Terjadi kesalahan: RESOURCE\\_EXHAUSTED: quota \\*write\\_requests\\*"
+
+    summary = "".join(bot.format_user_batch_summary('adduser', results, ['a_b']))
+    assert "RESOURCE_EXHAUSTED" not in summary
+    assert summary.count("RESOURCE\\_EXHAUSTED") == 2
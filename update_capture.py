@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FILENAME = 'updates.ndjson'
+
+# Field identitas pada objek User/Chat yang diganti nama samaran
+_NAME_FIELDS = ('first_name', 'last_name', 'username', 'title')
+# Field yang dibuang seluruhnya
+_DROPPED_FIELDS = ('phone_number', 'vcard', 'bio', 'email', 'photo', 'invite_link')
+_DIGITS = re.compile(r"^-?\d+$")
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def capture_files(path: str) -> list:
+    """File rekaman di `path` (file atau direktori capture), urut dari yang paling lama."""
+    if not os.path.isdir(path):
+        return [path]
+    rotated = []
+    for name in os.listdir(path):
+        match = re.match(re.escape(CAPTURE_FILENAME) + r"\.(\d+)(\.gz)?$", name)
+        if match:
+            rotated.append((int(match.group(1)), os.path.join(path, name)))
+    files = [p for _, p in sorted(rotated, reverse=True)] # .N terbesar = paling lama
+    current = os.path.join(path, CAPTURE_FILENAME)
+    if os.path.exists(current):
+        files.append(current)
+    return files
+
+
+def read_capture(path: str):
+    """Membaca record rekaman (dict dengan 't', 'role', 'update') dari file .ndjson atau .ndjson.N.gz."""
+    for file_path in capture_files(path):
+        opener = gzip.open if file_path.endswith('.gz') else open
+        with opener(file_path, 'rt', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Melewati baris {line_number} di {file_path}: JSON tidak valid ({e}).")
+
+
+class UpdateRedactor:
+    """
+    Menghapus PII dari update Telegram (hasil Update.to_dict()) tanpa merusak alurnya:
+    ID pengguna/chat diganti ID samaran yang konsisten (HMAC dengan `salt`), nama diganti,
+    teks bebas, nama file dokumen serta judul/alamat venue diganti placeholder, dan koordinat
+    dibulatkan ke `coordinate_decimals` digit.
+    Perintah (/checkin) dan teks berupa angka (ID untuk /adduser) tetap dapat diputar ulang.
+    """
+
+    def __init__(self, salt: bytes, coordinate_decimals: int = 3):
+        self.salt = salt
+        self.coordinate_decimals = coordinate_decimals
+
+    def pseudonym(self, value: int) -> int:
+        digest = hmac.new(self.salt, str(abs(int(value))).encode('utf-8'), hashlib.sha256).hexdigest()
+        pseudo = int(digest[:12], 16) % 10**12 + 1 # Tetap muat di ID Telegram (bilangan 64-bit)
+        return -pseudo if int(value) < 0 else pseudo
+
+    def _placeholder(self, text: str) -> str:
+        digest = hmac.new(self.salt, text.encode('utf-8'), hashlib.sha256).hexdigest()
+        return f"teks-{digest[:8]}"
+
+    def redact_text(self, text: str) -> str:
+        if text.startswith('/'):
+            command, *args = text.split()
+            return ' '.join([command] + [self.redact_text(arg) for arg in args])
+        if _DIGITS.match(text.strip()):
+            return str(self.pseudonym(int(text.strip())))
+        return self._placeholder(text)
+
+    def redact(self, data):
+        if isinstance(data, list):
+            return [self.redact(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        # Objek User/Chat: punya 'id' plus salah satu field identitas
+        is_identity = 'id' in data and any(k in data for k in ('first_name', 'type', 'is_bot', 'username', 'title'))
+        owner_id = data['id'] if is_identity else data.get('user_id') # Contact hanya punya user_id
+        result = {}
+        for key, value in data.items():
+            if key in _DROPPED_FIELDS:
+                continue
+            if is_identity and key == 'id':
+                result[key] = self.pseudonym(value)
+            elif key in _NAME_FIELDS and owner_id is not None:
+                result[key] = f"{key}-{self.pseudonym(owner_id)}"
+            elif key in ('title', 'address') and isinstance(value, str):
+                # Nama dan alamat venue (objek tanpa identitas pemilik) bisa berisi data pribadi
+                result[key] = self._placeholder(value)
+            elif key == 'file_name' and isinstance(value, str):
+                # Ekstensi dipertahankan agar unggahan (misalnya CSV /adduser) tetap bisa diputar ulang
+                result[key] = self._placeholder(value) + os.path.splitext(value)[1].lower()
+            elif key == 'user_id' and isinstance(value, int):
+                result[key] = self.pseudonym(value)
+            elif key in ('text', 'caption') and isinstance(value, str):
+                result[key] = self.redact_text(value)
+            elif key in ('entities', 'caption_entities'):
+                # Offset entitas lain tidak lagi cocok dengan teks placeholder; hanya perintah yang disimpan
+                result[key] = [e for e in value if e.get('type') == 'bot_command' and e.get('offset') == 0]
+            elif key in ('latitude', 'longitude') and isinstance(value, (int, float)):
+                result[key] = round(value, self.coordinate_decimals)
+            else:
+                result[key] = self.redact(value)
+        return result
+
+
+class UpdateCapture:
+    """
+    Merekam update yang masuk ke NDJSON (satu update per baris) setelah PII dihapus, untuk diputar
+    ulang dengan replay.py. File dirotasi setiap `max_bytes` dan file lama dikompres gzip; penulisan
+    dan kompresi dilakukan thread QueueListener sehingga event loop tidak ikut menunggu disk.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, backup_count: int, salt: bytes, coordinate_decimals: int = 3, role_of=None):
+        self.directory = directory
+        self.redactor = UpdateRedactor(salt, coordinate_decimals)
+        self.role_of = role_of # Opsional: user_id asli -> 'owner'/'admin'/'user'/None, untuk menyiapkan peran saat replay
+        self.recorded = 0
+        self.failed = 0
+
+        os.makedirs(directory, exist_ok=True)
+        file_handler = RotatingFileHandler(os.path.join(directory, CAPTURE_FILENAME), maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        file_handler.namer = lambda name: name + '.gz'
+        file_handler.rotator = _gzip_rotator
+        file_handler.setFormatter(logging.Formatter('%(message)s'))
+
+        self._queue = queue.SimpleQueue()
+        self._listener = QueueListener(self._queue, file_handler)
+        self._writer = logging.getLogger(f"{__name__}.writer")
+        self._writer.propagate = False
+        self._writer.setLevel(logging.INFO)
+        self._writer.handlers = [QueueHandler(self._queue)]
+
+    def start(self):
+        self._listener.start()
+        logger.info(f"Perekaman update aktif di {self.directory}.")
+
+    def stop(self):
+        self._listener.stop() # Menulis sisa antrean sebelum berhenti
+
+    async def record(self, update, context):
+        """Callback TypeHandler (group -1): dipanggil untuk setiap update sebelum handler lain."""
+        try:
+            user = getattr(update, 'effective_user', None)
+            role = self.role_of(user.id) if (self.role_of and user) else None
+            record = {'t': time.time(), 'role': role, 'update': self.redactor.redact(update.to_dict())}
+            self._writer.info(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            self.recorded += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Gagal merekam update: {e}")
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Memproses update secara bersamaan dengan urutan tetap per pengguna. Update dari pengguna
+    berbeda berjalan paralel (dibatasi `max_concurrent_updates`), sedangkan update dari pengguna
+    yang sama menunggu update sebelumnya selesai, sehingga state ConversationHandler tetap benar.
+    Update yang menunggu giliran ikut memegang slot konkurensi, jadi antrean per pengguna dibatasi
+    `max_queue_per_user`; update berikutnya dibuang.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_queue_per_user: int):
+        super().__init__(max_concurrent_updates)
+        self.max_queue_per_user = max(1, max_queue_per_user)
+        self._tails = {} # kunci pengguna -> future yang selesai saat update terakhirnya selesai
+        self._depth = {} # kunci pengguna -> jumlah update yang menunggu + sedang berjalan
+        self.running = 0
+        self.dropped = 0
+
+    @staticmethod
+    def ordering_key(update: object):
+        """Kunci urutan: user_id, atau chat_id untuk update tanpa pengirim (misalnya post channel)."""
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return ('user', user.id)
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return ('chat', chat.id)
+        return None
+
+    @property
+    def queued(self) -> int:
+        """Update yang sedang menunggu giliran (belum berjalan)."""
+        return sum(self._depth.values()) - self.running
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        # Dipanggil BaseUpdateProcessor.process_update setelah slot konkurensi global didapat; di sini
+        # hanya urutan per pengguna yang dijaga (lock per kunci lewat rantai future)
+        key = self.ordering_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        depth = self._depth.get(key, 0)
+        if depth >= self.max_queue_per_user:
+            coroutine.close()
+            self.dropped += 1
+            logger.warning(f"Antrean update untuk {key[0]} {key[1]} penuh ({depth}); update dibuang.")
+            return
+
+        self._depth[key] = depth + 1
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        started = False
+        try:
+            if previous is not None:
+                # shield: pembatalan task ini tidak boleh membatalkan future milik update sebelumnya
+                await asyncio.shield(previous)
+            started = True
+            await self._run(coroutine)
+        finally:
+            if not started:
+                coroutine.close()
+            if not done.done():
+                done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+            self._depth[key] -= 1
+            if not self._depth[key]:
+                del self._depth[key]
+
+    async def _run(self, coroutine) -> None:
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,255 @@
+import csv
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Kolom yang wajib ada di header lembar 'Users'
+REQUIRED_HEADERS = ['user_id', 'role', 'first_name', 'username', 'added_by_id', 'added_by_name', 'added_date']
+# Penghapusan pengguna dicatat sebagai tombstone (role 'removed' + waktu hapus); barisnya baru
+# benar-benar dibuang saat lembar dipadatkan (lihat without_tombstones)
+REMOVED_ROLE = 'removed'
+REMOVED_AT_HEADER = 'removed_at'
+
+# Contoh updatedRange dari respons append: "Users!A12:G12"
+_UPDATED_RANGE_ROW = re.compile(r"![A-Z]+(\d+)")
+# Pemisah daftar ID di perintah kelola pengguna: spasi, baris baru, koma atau titik koma
+_USER_ID_SEPARATORS = re.compile(r"[\s,;]+")
+
+
+def parse_user_ids(text: str):
+    """ID Telegram dari teks bebas: (ID unik urut kemunculan, token yang bukan angka)."""
+    return _collect_user_ids(token for token in _USER_ID_SEPARATORS.split(text or '') if token)
+
+
+def parse_user_ids_csv(data: bytes):
+    """
+    ID Telegram dari file CSV: kolom 'user_id' jika header-nya ada, selain itu kolom pertama
+    (baris pertama yang bukan angka dianggap header). Hasilnya seperti parse_user_ids().
+    """
+    rows = [row for row in csv.reader(io.StringIO(data.decode('utf-8-sig', errors='replace'))) if any(cell.strip() for cell in row)]
+    column = 0
+    if rows:
+        header = [cell.strip().lower() for cell in rows[0]]
+        if 'user_id' in header:
+            column = header.index('user_id')
+            rows = rows[1:]
+        elif not header[0].lstrip('-').isdigit():
+            rows = rows[1:]
+    return _collect_user_ids(row[column].strip() if len(row) > column else '' for row in rows)
+
+
+def without_tombstones(all_data: list):
+    """Isi lembar 'Users' (header + baris) tanpa baris tombstone, beserta jumlah baris yang dibuang."""
+    if not all_data:
+        return [], 0
+    header = [str(h).strip() for h in all_data[0]]
+    role_idx = header.index('role') if 'role' in header else 1
+    kept = [all_data[0]] + [row for row in all_data[1:] if not (len(row) > role_idx and str(row[role_idx]).strip().lower() == REMOVED_ROLE)]
+    return kept, len(all_data) - len(kept)
+
+
+def _collect_user_ids(tokens):
+    user_ids = {} # dict sebagai set berurutan
+    invalid = []
+    for token in tokens:
+        if not token:
+            continue
+        try:
+            user_ids.setdefault(int(token), None)
+        except ValueError:
+            invalid.append(token)
+    return list(user_ids), invalid
+
+
+@dataclass
+class UserRecord:
+    user_id: int
+    row_number: int # Nomor baris di Google Sheet (header = baris 1)
+    role: str # Sudah dinormalisasi (strip + lower)
+    values: list = field(default_factory=list) # Isi baris mentah sesuai urutan header
+
+
+class UserTable:
+    """
+    Salinan lokal lembar 'Users' dengan peta header -> kolom dan indeks user_id -> UserRecord.
+    Dimuat sekali dari get_all_values(), lalu dijaga tetap konsisten dengan mencatat setiap
+    perubahan yang berhasil ditulis (update sel, append; hapus berupa tombstone), sehingga
+    mengelola pengguna cukup satu penulisan tertarget tanpa membaca ulang seluruh sheet.
+    """
+
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+        self._lock = threading.Lock()
+        self.header = []
+        self.columns = {} # nama header -> nomor kolom (1-based)
+        self._records = [] # Semua baris valid, urut sesuai nomor baris
+        self._index = {} # user_id -> UserRecord (kemunculan pertama)
+
+    def load(self, all_data: list):
+        """Membangun ulang tabel dari hasil get_all_values() lembar 'Users'."""
+        header = [str(h).strip() for h in all_data[0]] if all_data else []
+        columns = {name: i + 1 for i, name in enumerate(header) if name and name not in header[:i]}
+        # user_id dan role secara historis ada di kolom A dan B
+        user_id_idx = columns.get('user_id', 1) - 1
+        role_idx = columns.get('role', 2) - 1
+
+        records = []
+        index = {}
+        for i, row in enumerate(all_data[1:]): # Melewati header (all_data[0])
+            row_num = i + 2 # Nomor baris di sheet Google (mulai dari 2)
+            user_id_str = row[user_id_idx] if len(row) > user_id_idx else None
+            if not user_id_str:
+                logger.warning(f"Melewati baris {row_num} di 'Users' karena 'user_id' hilang.")
+                continue
+            try:
+                user_id = int(str(user_id_str).strip()) # Pastikan user_id bisa diubah ke integer
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Melewati baris {row_num} di lembar 'Users' karena user_id tidak valid. Data: {row}. Error: {e}")
+                continue
+            role_str = row[role_idx] if len(row) > role_idx else ''
+            record = UserRecord(user_id=user_id, row_number=row_num, role=str(role_str).strip().lower(), values=list(row))
+            records.append(record)
+            index.setdefault(user_id, record)
+
+        with self._lock:
+            self.header = header
+            self.columns = columns
+            self._records = records
+            self._index = index
+        logger.info(f"Tabel pengguna dimuat: {len(records)} baris, {len(index)} user_id unik.")
+
+    def missing_headers(self, required: list = REQUIRED_HEADERS) -> list:
+        return [h for h in required if h not in self.columns]
+
+    def get(self, user_id: int):
+        return self._index.get(user_id)
+
+    def rows(self) -> list:
+        """Isi tabel sebagai header + baris mentah (urut nomor baris), dalam bentuk hasil get_all_values()."""
+        with self._lock:
+            return [list(self.header)] + [list(record.values) for record in self._records]
+
+    def role_sets(self):
+        """Mengembalikan (admin_ids, user_ids) baru; OWNER selalu termasuk keduanya."""
+        admins = {self.owner_id}
+        users = {self.owner_id}
+        with self._lock:
+            records = list(self._records)
+        for record in records:
+            if not record.role:
+                logger.warning(f"Melewati baris {record.row_number} di 'Users' karena 'role' hilang.")
+                continue
+            if record.role == REMOVED_ROLE:
+                continue
+            users.add(record.user_id)
+            if record.role == 'admin' or record.user_id == self.owner_id: # Owner juga dianggap admin
+                admins.add(record.user_id)
+        return admins, users
+
+    def build_row(self, values: dict) -> list:
+        """Menyusun baris baru sesuai urutan header dari dict {nama_header: nilai}."""
+        row = [''] * max(self.columns.values(), default=0)
+        for name, value in values.items():
+            row[self.columns[name] - 1] = value
+        return row
+
+    # --- Pencatatan perubahan yang sudah berhasil ditulis ke sheet ---
+
+    def add_column(self, name: str) -> int:
+        """Mencatat header baru di kolom kosong pertama setelah header terakhir. Mengembalikan nomor kolomnya."""
+        with self._lock:
+            if name not in self.columns:
+                self.header.append(name)
+                self.columns[name] = len(self.header)
+            return self.columns[name]
+
+    def record_cells(self, user_id: int, values: dict):
+        """Mencatat sel yang diperbarui pada baris `user_id` dari dict {nama_header: nilai}."""
+        with self._lock:
+            record = self._index[user_id]
+            for name, value in values.items():
+                idx = self.columns[name] - 1
+                if len(record.values) <= idx:
+                    record.values.extend([''] * (idx + 1 - len(record.values)))
+                record.values[idx] = value
+                if name == 'role':
+                    record.role = str(value).strip().lower()
+
+    def record_appends(self, rows: list, append_response) -> bool:
+        """
+        Mencatat baris-baris yang baru di-append (satu append_rows). Nomor baris pertama diambil dari
+        `updatedRange` respons API; jika tidak bisa dibaca, tabel dianggap basi dan False
+        dikembalikan agar pemanggil memuat ulang.
+        """
+        try:
+            updated_range = append_response['updates']['updatedRange']
+            first_row = int(_UPDATED_RANGE_ROW.search(updated_range).group(1))
+        except (KeyError, TypeError, AttributeError, ValueError):
+            logger.warning(f"Tidak dapat membaca nomor baris dari respons append: {append_response}")
+            return False
+        records = []
+        for offset, row in enumerate(rows):
+            user_id = int(row[self.columns['user_id'] - 1])
+            records.append(UserRecord(user_id=user_id, row_number=first_row + offset, role=str(row[self.columns['role'] - 1]).strip().lower(), values=list(row)))
+        with self._lock:
+            self._records.extend(records)
+            self._records.sort(key=lambda r: r.row_number)
+            for record in records:
+                self._index.setdefault(record.user_id, record)
+        return True
+
+
+class RoleSnapshot:
+    """
+    Snapshot lokal (JSON) isi lembar 'Users' terakhir yang berhasil dimuat, untuk warm start: saat
+    boot peran langsung diisi dari file ini sementara Google Sheets dimuat di latar belakang.
+    Ditulis atomik (file sementara lalu os.replace) dan hanya jika isinya berubah.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last_data = None
+        self.saved_at = None
+
+    def save(self, rows: list) -> bool:
+        """Menyimpan rows (header + baris); False jika isinya sama dengan snapshot terakhir."""
+        data = json.dumps(rows, ensure_ascii=False)
+        with self._lock:
+            if data == self._last_data:
+                return False
+            saved_at = time.time()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'saved_at': saved_at, 'rows': rows}, ensure_ascii=False))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._last_data = data
+            self.saved_at = saved_at
+        return True
+
+    def load(self):
+        """Rows dari snapshot, atau None jika file tidak ada atau rusak."""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            rows = snapshot['rows']
+            if not isinstance(rows, list) or not all(isinstance(row, list) for row in rows):
+                raise ValueError("format 'rows' tidak dikenal")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Snapshot peran {self.path} tidak bisa dibaca, diabaikan: {e}")
+            return None
+        with self._lock:
+            self._last_data = json.dumps(rows, ensure_ascii=False)
+            self.saved_at = snapshot.get('saved_at')
+        return rows